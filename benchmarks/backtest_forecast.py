@@ -0,0 +1,108 @@
+""" Backtests the utilization forecasts on exported CSVs
+
+Walks through every dataset minute by minute, forecasting the next minutes
+from the past only, and reports:
+  - the mean absolute error of the forecast against the last value (naive)
+  - the peaks (crossings of the pre-scaling threshold) predicted ahead of time
+  - the latency above the median during the first minutes of the predicted
+    peaks, which a reactive scale-up would still have suffered
+
+Usage (from the monitor directory):
+    python ../benchmarks/backtest_forecast.py ["../ICSD Cloud Resource Sample"] [--season 60]
+"""
+
+import argparse
+
+import numpy as np
+
+from flaskr.forecast import SeasonalForecaster, PRESCALE_THRESHOLDS, FORECAST_HORIZON
+from sample_data import iter_datasets, load_metrics
+
+LATENCY = 'Request Latency (ms)'
+
+
+def backtest(values: np.ndarray, latency: np.ndarray | None, threshold: float,
+             season: int, horizon: int, reaction: int) -> dict:
+    """
+    Backtests the forecaster on one metric.
+
+    Args:
+        values (np.ndarray): The metric, one value per minute.
+        latency (np.ndarray | None): The request latency at the same times, if exported.
+        threshold (float): The pre-scaling threshold of the metric.
+        season (int): The season of the forecaster.
+        horizon (int): The number of minutes forecast.
+        reaction (int): The minutes a reactive scale-up takes to serve after a crossing.
+
+    Returns:
+        dict: The errors, peaks and avoided latency.
+    """
+    forecaster = SeasonalForecaster(season)
+    errors, naive_errors = [], []
+    # 每個時間點預測在 horizon 內是否會超過門檻
+    warned = np.zeros(len(values), dtype=bool)
+    for t, value in enumerate(values):
+        forecaster.update(value)
+        forecast = forecaster.forecast(horizon)
+        if forecast is None:
+            continue
+        actual = values[t + 1:t + 1 + horizon]
+        errors.append(np.abs(forecast[:len(actual)] - actual).mean() if len(actual) else np.nan)
+        naive_errors.append(np.abs(value - actual).mean() if len(actual) else np.nan)
+        warned[t] = value <= threshold and forecast.max() > threshold
+
+    peaks = [t for t in range(1, len(values))
+             if values[t] > threshold and values[t - 1] <= threshold]
+    leads, avoided = [], 0.0
+    baseline = np.nanmedian(latency) if latency is not None else 0
+    for t0 in peaks:
+        start = max(t0 - horizon, 0)
+        early = np.flatnonzero(warned[start:t0])
+        if len(early) == 0:
+            continue
+        lead = t0 - (start + early[0])
+        leads.append(lead)
+        if latency is not None and lead >= reaction:
+            window = latency[t0:t0 + reaction]
+            avoided += np.nansum(np.clip(window - baseline, 0, None))
+
+    return {
+        'mae': np.nanmean(errors) if errors else np.nan,
+        'naive_mae': np.nanmean(naive_errors) if naive_errors else np.nan,
+        'peaks': len(peaks),
+        'predicted': len(leads),
+        'lead': np.mean(leads) if leads else 0,
+        'avoided': avoided,
+    }
+
+
+def main():
+    """main"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sample_dir', nargs='?', default='../ICSD Cloud Resource Sample')
+    # 範例資料只有數小時，預設以一小時為週期
+    parser.add_argument('--season', type=int, default=60)
+    parser.add_argument('--horizon', type=int, default=FORECAST_HORIZON)
+    parser.add_argument('--reaction', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"dataset":<40} {"metric":<34} {"mae":>7} {"naive":>7} '
+          f'{"peaks":>5} {"ahead":>5} {"lead":>5} {"avoided latency":>16}')
+    for name, csv_dir in iter_datasets(args.sample_dir):
+        metrics = load_metrics(csv_dir)
+        latency = metrics[LATENCY].to_numpy(dtype=float) if LATENCY in metrics else None
+        for key, (_, threshold) in PRESCALE_THRESHOLDS.items():
+            if key not in metrics:
+                continue
+            # 缺少的分鐘以前一筆補上，與線上逐分鐘餵入的資料相同
+            values = metrics[key].ffill().to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+            result = backtest(values[valid], latency[valid] if latency is not None else None,
+                              threshold, args.season, args.horizon, args.reaction)
+            print(f'{name:<40} {key:<34} {result["mae"]:>7.2f} {result["naive_mae"]:>7.2f} '
+                  f'{result["peaks"]:>5} {result["predicted"]:>5} {result["lead"]:>5.1f} '
+                  f'{result["avoided"]:>13,.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
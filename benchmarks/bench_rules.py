@@ -0,0 +1,77 @@
+""" Micro-benchmark of the vectorized rule engine against row-by-row evaluation
+
+Usage (from the monitor directory):
+    python ../benchmarks/bench_rules.py [rows]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from flaskr.rules import ABNORMAL_RULES, SCALING_RULES
+
+
+def make_metrics(rows: int) -> pd.DataFrame:
+    """
+    Generates random metrics shaped like the exported Cloud Run CSVs.
+    """
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Container CPU Utilization (%)': rng.uniform(0, 100, rows),
+        'Container Memory Utilization (%)': rng.uniform(0, 100, rows),
+        'Container Startup Latency (ms)': np.where(rng.random(rows) < 0.01, 4000.0, np.nan),
+        'Instance Count (active)': rng.integers(0, 4, rows),
+        'Request Count (4xx)': rng.poisson(3, rows),
+        'Request Count (5xx)': rng.poisson(1, rows),
+        'Request Latency (ms)': rng.exponential(80, rows),
+    })
+
+
+def row_by_row(rows: list[dict]) -> int:
+    """
+    Evaluates the abnormality rules one two-row window at a time,
+    as the report used to, and returns the number of anomalous windows.
+    """
+    count = 0
+    for i in range(2, len(rows) + 1):
+        window = rows[i-2:i]
+        metric = window[-1]
+        if metric.get('Container Startup Latency (ms)', 0) > 0 \
+                or metric.get('Instance Count (active)', 0) > 2 \
+                or metric.get('Request Count (4xx)', 0) > 5 \
+                or metric.get('Request Count (5xx)', 0) > 5 \
+                or all(m.get('Container CPU Utilization (%)', 0) > 60 for m in window) \
+                or all(m.get('Container Memory Utilization (%)', 0) > 60 for m in window):
+            count += 1
+    return count
+
+
+def bench(name: str, rows: int, func) -> None:
+    """
+    Runs a function once and prints its throughput.
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<32} {rows:>10} rows {elapsed:>8.3f} s {rows / elapsed:>14,.0f} rows/s  ({result})')
+
+
+def main():
+    """main"""
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = make_metrics(rows)
+
+    bench('ABNORMAL_RULES.evaluate', rows,
+          lambda: int(ABNORMAL_RULES.evaluate(df)[1:].any(axis=1).sum()))
+    bench('SCALING_RULES.votes', rows,
+          lambda: int((SCALING_RULES.votes(df)[0] != 0).sum()))
+
+    sample = min(rows, 100_000)
+    records = df.iloc[:sample].to_dict('records')
+    bench('row by row (dict windows)', sample, lambda: row_by_row(records))
+
+
+if __name__ == '__main__':
+    main()
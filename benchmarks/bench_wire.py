@@ -0,0 +1,69 @@
+""" Size and speed of the websocket encodings negotiated with the dcbot
+
+Usage (from the monitor directory):
+    python ../benchmarks/bench_wire.py [iterations]
+"""
+
+import sys
+import time
+import base64
+import random
+
+from flaskr import wire
+from flaskr.wire import Codec
+
+
+def make_alert() -> dict:
+    """
+    Generates an alert shaped like the abnormal metrics notifications, about 1.5 KB of markdown.
+    """
+    lines = ['# :warning: Abnormal metrics', '**Service**: `billing-api` (asia-east1)', '']
+    for i in range(20):
+        lines.append(f'- `2024-01-01 00:{i:02d}:00` CPU {60 + i}% · memory {55 + i}% · 5xx {i % 7}')
+    return {'channel_id': '1234567890123456789', 'message': '\n'.join(lines), 'priority': 0}
+
+
+def make_report(size: int = 200_000) -> dict:
+    """
+    Generates a report message with a PDF-like attachment of `size` bytes, partly compressible.
+    """
+    rng = random.Random(0)
+    text = b'BT /F1 12 Tf 72 712 Td (Request Latency (ms)) Tj ET\n' * (size // 100)
+    noise = bytes(rng.getrandbits(8) for _ in range(size - len(text)))
+    return {'channel_id': '1234567890123456789', 'message': 'report',
+            'file_base64': base64.b64encode(b'%PDF-1.7\n' + text + noise).decode()}
+
+
+def bench(name: str, payload: dict, codec: Codec, iterations: int) -> None:
+    """
+    Encodes and decodes a message `iterations` times and prints its size and timings.
+    """
+    frame = codec.encode(payload)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(payload)
+    encode = (time.perf_counter() - start) / iterations
+    start = time.perf_counter()
+    for _ in range(iterations):
+        wire.decode(frame)
+    decode = (time.perf_counter() - start) / iterations
+    print(f'{name:<24} {len(frame):>10,} bytes {encode * 1e6:>10.1f} µs encode {decode * 1e6:>10.1f} µs decode')
+
+
+def main():
+    """main"""
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    codecs = {'json': Codec(), 'json+zlib': Codec(wire.JSON, wire.ZLIB)}
+    if wire.msgpack is not None:
+        codecs['msgpack'] = Codec(wire.MSGPACK)
+        codecs['msgpack+zlib'] = Codec(wire.MSGPACK, wire.ZLIB)
+    else:
+        print('msgpack is not installed, skipping it')
+
+    for name, payload in (('alert', make_alert()), ('report', make_report())):
+        for codec_name, codec in codecs.items():
+            bench(f'{name} {codec_name}', payload, codec, iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+""" Loading of the exported Cloud Run CSV datasets shared by the benchmarks """
+
+import os
+import tempfile
+import zipfile
+from functools import reduce
+
+import pandas as pd
+
+
+def iter_datasets(sample_dir: str):
+    """
+    Yields the name and CSV directory of every dataset in the sample directory:
+    the loose CSV files and the content of every zip archive.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        loose = os.path.join(temp_dir, 'csv')
+        os.makedirs(loose)
+        for entry in sorted(os.listdir(sample_dir)):
+            path = os.path.join(sample_dir, entry)
+            if entry.endswith('.csv'):
+                with open(path, 'rb') as src, open(os.path.join(loose, entry), 'wb') as dst:
+                    dst.write(src.read())
+            elif entry.endswith('.zip'):
+                target = os.path.join(temp_dir, entry)
+                with zipfile.ZipFile(path) as zip_ref:
+                    zip_ref.extractall(target)
+                yield entry, target
+        if os.listdir(loose):
+            yield '*.csv', loose
+
+
+def load_metrics(csv_dir: str) -> pd.DataFrame:
+    """
+    Merges the CSV files of a directory on their time column, as the report does.
+    """
+    data_frames = []
+    for entry in sorted(os.listdir(csv_dir)):
+        df = pd.read_csv(os.path.join(csv_dir, entry))
+        data_frames.append(df.assign(Time=pd.to_datetime(df['Time'])))
+    merged = reduce(lambda left, right: pd.merge(
+        left, right, on=['Time'], how='outer'), data_frames)
+    return merged.set_index('Time').sort_index()
@@ -0,0 +1,60 @@
+""" Counts the LLM calls made by the CSV report with and without the local triage
+
+Usage (from the monitor directory):
+    python ../benchmarks/triage_llm_calls.py "../ICSD Cloud Resource Sample"
+"""
+
+import sys
+
+from flaskr import dcbot
+from flaskr.triage import Triage
+from sample_data import iter_datasets
+
+
+class CountingLLM:
+    """ Stands in for an LLM task and counts how often it is called """
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def gen(self, data: str) -> str:
+        self.calls += 1
+        return ''
+
+
+def count_llm_calls(csv_dir: str, use_triage: bool) -> int:
+    """
+    Generates the CSV report of a directory and counts its LLM calls.
+
+    Args:
+        csv_dir (str): The directory containing the exported CSV files.
+        use_triage (bool): Whether low-scoring anomalies skip the LLM.
+
+    Returns:
+        int: The number of LLM calls.
+    """
+    counter = CountingLLM()
+    origin_llm, origin_triage = dcbot.LLM.AnalysisError, dcbot.Triage
+    dcbot.LLM.AnalysisError = counter
+    if not use_triage:
+        dcbot.Triage = lambda detector: Triage(detector, threshold=float("-inf"))
+    try:
+        dcbot.genai(csv_dir)
+    finally:
+        dcbot.LLM.AnalysisError, dcbot.Triage = origin_llm, origin_triage
+    return counter.calls
+
+
+def main():
+    """main"""
+    sample_dir = sys.argv[1] if len(sys.argv) > 1 else '../ICSD Cloud Resource Sample'
+    print(f'{"dataset":<45} {"without":>8} {"with":>8} {"saved":>7}')
+    for name, csv_dir in iter_datasets(sample_dir):
+        without_triage = count_llm_calls(csv_dir, use_triage=False)
+        with_triage = count_llm_calls(csv_dir, use_triage=True)
+        saved = 1 - with_triage / without_triage if without_triage else 0
+        print(f'{name:<45} {without_triage:>8} {with_triage:>8} {saved:>7.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,22 @@ from discord.ext import commands
 from discord import HTTPException
 import websockets
 import dotenv
-import requests
 import json
 import base64
 import io
+import re
+import time
+import heapq
+import functools
+import itertools
+import zlib
+import aiohttp
+from collections import OrderedDict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 
 # --- env
@@ -19,7 +31,17 @@ dotenv.load_dotenv()
 
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 WEBSOCKET_PORT = int(os.getenv('WEBSOCKET_PORT'))
+# discord requests in flight at once, across all channels
+MAX_CONCURRENT_SENDS = int(os.getenv('MAX_CONCURRENT_SENDS', '8'))
 MONITOR_URL = os.getenv('MONITOR_URL')
+# timeout of the requests to the monitor, in seconds
+MONITOR_TIMEOUT = 10
+# interactions are deferred when the monitor has not answered within this many seconds,
+# well before discord's 3 second acknowledgement deadline
+DEFER_AFTER = 2.0
+# largest zip accepted by gen_report_by_csv, must not exceed GEN_MAX_UPLOAD_MB of the monitor
+MAX_ATTACHMENT_BYTES = int(os.getenv('MAX_ATTACHMENT_MB', '20')) * 1024 * 1024
+ATTACHMENT_CHUNK_BYTES = 64 * 1024
 
 # --- logging
 
@@ -32,81 +54,462 @@ logger.addHandler(handler)
 
 # --- global vars
 
+# messages sent with a "message_key", kept so that later websocket messages can edit them
+MAX_KEYED_MESSAGES = 256
+keyed_messages: OrderedDict[str, discord.Message] = OrderedDict()
+# answers to the monitor messages, by message id, so that a resent message is not delivered twice
+MAX_ANSWERS = 1024
+answers: OrderedDict[str, dict] = OrderedDict()
+
+# --- send scheduler
+
+# lower values are sent first: alerts go ahead of scaling notices
+PRIORITY_ALERT = 0
+PRIORITY_NOTICE = 1
+# discord allows about 5 messages per 5 seconds per channel, until its rate limit headers tell otherwise
+DEFAULT_BUCKET_LIMIT = 5
+DEFAULT_BUCKET_PERIOD = 5.0
+# seconds between two logs of the queue statistics
+STATS_INTERVAL = 60
+CHANNEL_MESSAGES_PATH = re.compile(r'/channels/(\d+)/messages$')
+
+
+class TokenBucket:
+    """
+    the send budget of one channel, a fixed window of `limit` messages
+    refilled every `period` seconds, corrected by discord's rate limit headers
+    """
+
+    def __init__(self, limit: int = DEFAULT_BUCKET_LIMIT, period: float = DEFAULT_BUCKET_PERIOD):
+        self.limit = limit
+        self.period = period
+        self.tokens = limit
+        self.reset_at = None
+
+    async def acquire(self):
+        """wait for a token and take it"""
+        while True:
+            now = time.monotonic()
+            if self.reset_at is None or now >= self.reset_at:
+                self.tokens = self.limit
+                self.reset_at = now + self.period
+            if self.tokens > 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(self.reset_at - now)
+
+    def update(self, limit: int, remaining: int, reset_after: float):
+        """take the state of the bucket from the rate limit headers of a response"""
+        self.limit = limit
+        self.tokens = min(self.tokens, remaining)
+        self.reset_at = time.monotonic() + reset_after
+
+
+class ChannelQueue:
+    """the pending sends of one channel, by priority then arrival order"""
+
+    def __init__(self):
+        self.heap = []
+        self.bucket = TokenBucket()
+        self.task = None
+
+
+class SendScheduler:
+    """
+    sends the messages of every channel from its own task, so that a channel
+    waiting for its rate limit or a slow upload does not hold the others back.
+    within a channel, messages of the same priority are sent one at a time in
+    arrival order, and at most `max_concurrent` sends are in flight overall
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_SENDS):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.channels: dict[int, ChannelQueue] = {}
+        # priority of the keyed messages, so that their edits never overtake them
+        self.key_priorities: OrderedDict[str, int] = OrderedDict()
+        self.counter = itertools.count()
+        self.sent = 0
+        self.waits = []
+
+    def submit(self, channel_id: int, priority: int, job, message_key: str = None):
+        """queue a coroutine function that sends to a channel"""
+        if message_key:
+            priority = self.key_priorities.setdefault(message_key, priority)
+            self.key_priorities.move_to_end(message_key)
+            while len(self.key_priorities) > MAX_KEYED_MESSAGES:
+                self.key_priorities.popitem(last=False)
+        queue = self.channels.get(channel_id)
+        if queue is None:
+            queue = self.channels[channel_id] = ChannelQueue()
+        heapq.heappush(queue.heap, (priority, next(self.counter), time.monotonic(), job))
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.create_task(self.drain(channel_id, queue))
+
+    async def drain(self, channel_id: int, queue: ChannelQueue):
+        """send the queued messages of a channel until its queue is empty"""
+        while queue.heap:
+            await queue.bucket.acquire()
+            _, _, queued_at, job = heapq.heappop(queue.heap)
+            self.waits.append(time.monotonic() - queued_at)
+            try:
+                # the token is taken outside the semaphore, a rate limited channel holds no slot
+                async with self.semaphore:
+                    await job()
+                self.sent += 1
+            except Exception as e:
+                logger.error('send to channel %s failed: %s', channel_id, e)
+
+    def update_bucket(self, channel_id: int, headers):
+        """update the bucket of a channel from the rate limit headers of a response"""
+        queue = self.channels.get(channel_id)
+        if queue is None or 'X-RateLimit-Limit' not in headers:
+            return
+        try:
+            queue.bucket.update(int(headers['X-RateLimit-Limit']),
+                                int(headers['X-RateLimit-Remaining']),
+                                float(headers['X-RateLimit-Reset-After']))
+        except (KeyError, ValueError) as e:
+            logger.error('invalid rate limit headers: %s', e)
+
+    def report(self):
+        """log the queue depths and waits since the last report"""
+        depths = {channel_id: len(queue.heap) for channel_id, queue in self.channels.items() if queue.heap}
+        waits, self.waits = self.waits, []
+        sent, self.sent = self.sent, 0
+        logger.info('send queue: %d sent, %d pending in %d channels (max %d), wait avg %.2fs max %.2fs',
+                    sent, sum(depths.values()), len(depths), max(depths.values(), default=0),
+                    sum(waits) / len(waits) if waits else 0, max(waits, default=0))
+        # forget idle channels
+        for channel_id in [c for c, q in self.channels.items() if not q.heap and (q.task is None or q.task.done())]:
+            del self.channels[channel_id]
+
+    async def report_forever(self):
+        """log the statistics every `STATS_INTERVAL` seconds"""
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self.report()
+
+
+scheduler = SendScheduler()
+
+
+async def on_request_end(session, context, params):
+    """feed discord's rate limit headers of message requests into the channel buckets"""
+    match = CHANNEL_MESSAGES_PATH.search(params.url.path)
+    if match and params.method == 'POST':
+        scheduler.update_bucket(int(match.group(1)), params.response.headers)
+
+
+http_trace = aiohttp.TraceConfig()
+http_trace.on_request_end.append(on_request_end)
+
 
 # --- websockets
 
 
+# --- wire format, see monitor/flaskr/wire.py
+
+# flags in the first byte of binary frames
+FLAG_ZLIB = 0x01
+FLAG_MSGPACK = 0x02
+
+
+def welcome(offer: dict) -> dict:
+    """choose the encoding and compression of the monitor messages among the ones offered"""
+    encodings = offer.get('encodings') or []
+    compression = offer.get('compression') or []
+    return {
+        'encoding': 'msgpack' if msgpack is not None and 'msgpack' in encodings else 'json',
+        'compression': 'zlib' if 'zlib' in compression else None,
+    }
+
+
+def decode_frame(frame):
+    """decode a text frame (json) or a binary frame (flags byte, then json or msgpack, maybe zlib compressed)"""
+    if isinstance(frame, str):
+        return json.loads(frame)
+    flags, body = frame[0], frame[1:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack is not installed')
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+
+class DeliveryError(Exception):
+    """a monitor message that could not be delivered, answered with a nack carrying `code`"""
+
+    def __init__(self, code: str, retry: bool = False):
+        super().__init__(code)
+        self.code = code
+        self.retry = retry
+
+
+async def answer(websocket, message_id: str, error: DeliveryError = None):
+    """ack or nack a monitor message, remembering the answer in case the monitor resends it"""
+    if message_id is None:
+        return
+    if error is None:
+        reply = {'ack': message_id}
+    else:
+        reply = {'nack': message_id, 'code': error.code, 'retry': error.retry}
+    if error is None or not error.retry:
+        remember_answer(message_id, reply)
+    else:
+        # a retryable failure is tried again when resent
+        answers.pop(message_id, None)
+    try:
+        await websocket.send(json.dumps(reply))
+    except websockets.ConnectionClosed:
+        logger.error('cannot answer %s, connection closed', message_id)
+
+
+def remember_answer(message_id: str, reply):
+    """remember the answer of a message, None while it is being delivered, forgetting the oldest ones"""
+    answers[message_id] = reply
+    answers.move_to_end(message_id)
+    while len(answers) > MAX_ANSWERS:
+        answers.popitem(last=False)
+
+
+def parse_message(ws_message_json: dict):
+    """validate a monitor message, returning its channel and fields"""
+    if 'channel_id' not in ws_message_json:
+        logger.error('message does not contain "channel_id": %s', ws_message_json)
+        raise DeliveryError('invalid_message')
+    message = ws_message_json.get('message', None)
+    # reports come as raw bytes with msgpack, as base64 with json
+    file_base64 = ws_message_json.get('file', None) or ws_message_json.get('file_base64', None)
+    channel_id = ws_message_json['channel_id']
+    reply_to = ws_message_json.get('reply_to', None)
+    message_key = ws_message_json.get('message_key', None)
+    edit = ws_message_json.get('edit', False)
+    try:
+        channel_id = int(channel_id)
+    except ValueError as e:
+        logger.error('channel_id is not int: %s', e)
+        raise DeliveryError('invalid_message') from e
+    if reply_to is not None:
+        try:
+            reply_to = int(reply_to)
+        except ValueError as e:
+            logger.error('reply_to is not int: %s', e)
+            raise DeliveryError('invalid_message') from e
+
+    channel = client.get_channel(channel_id)
+    if not channel:
+        logger.error("can't access channel: %s", channel_id)
+        raise DeliveryError('bad_channel')
+    if not isinstance(channel, discord.TextChannel):
+        logger.error('channel is not TextChannel: %s', channel)
+        raise DeliveryError('bad_channel')
+    if not channel.permissions_for(channel.guild.me).send_messages:
+        logger.error("can't send message to channel: %s", channel_id)
+        raise DeliveryError('forbidden')
+    return channel, message, file_base64, reply_to, message_key, edit
+
+
 async def websocket_handler(websocket, path):
-    """handle websocket messages"""
+    """handle websocket messages, answering the ones with an "id" with an ack or nack"""
     async for ws_message in websocket:
         # logger.debug("received message:\n%s", ws_message)
         try:
-            ws_message_json = json.loads(ws_message)
-        except json.decoder.JSONDecodeError as e:
-            logger.error('json decode error: %s', e)
+            ws_message_json = decode_frame(ws_message)
+        except (ValueError, zlib.error) as e:
+            logger.error('decode error: %s', e)
             continue
         if not isinstance(ws_message_json, dict):
             logger.error('message is not dict: %s', ws_message_json)
             continue
+        if isinstance(ws_message_json.get('hello'), dict):
+            # capability handshake of the monitor
+            choice = welcome(ws_message_json['hello'])
+            logger.debug('monitor encoding: %s', choice)
+            await websocket.send(json.dumps({'welcome': choice}))
+            continue
 
-        if 'channel_id' not in ws_message_json:
-            logger.error('message does not contain "channel_id": %s', ws_message_json)
+        message_id = ws_message_json.get('id')
+        if message_id is not None and message_id in answers:
+            # a resent message that was already handled gets the same answer again
+            if answers[message_id] is not None:
+                await websocket.send(json.dumps(answers[message_id]))
             continue
-        message = ws_message_json.get('message', None)
-        file_base64 = ws_message_json.get('file_base64', None)
-        channel_id = ws_message_json['channel_id']
-        reply_to = ws_message_json.get('reply_to', None)
         try:
-            channel_id = int(channel_id)
-        except ValueError as e:
-            logger.error('channel_id is not int: %s', e)
-            continue
-        if reply_to is not None:
-            try:
-                reply_to = int(reply_to)
-            except ValueError as e:
-                logger.error('reply_to is not int: %s', e)
-                continue
-
-        channel = client.get_channel(channel_id)
-        if not channel:
-            logger.error("can't access channel: %s", channel_id)
-            continue
-        if not isinstance(channel, discord.TextChannel):
-            logger.error('channel is not TextChannel: %s', channel)
-            continue
-        if not channel.permissions_for(channel.guild.me).send_messages:
-            logger.error("can't send message to channel: %s", channel_id)
+            channel, message, file_base64, reply_to, message_key, edit = parse_message(ws_message_json)
+        except DeliveryError as e:
+            await answer(websocket, message_id, e)
             continue
+        if message_id is not None:
+            remember_answer(message_id, None)
 
-        file = None
-        if file_base64:
-            try:
-                file_bytes = base64.b64decode(file_base64)
-            except Exception as e:
-                logger.error('base64 decode error: %s', e)
-                continue
-            file = discord.File(io.BytesIO(file_bytes), 'report.pdf')
-        if reply_to:
-            try:
-                message_to_reply = await channel.fetch_message(reply_to)
-            except discord.NotFound:
-                logger.error('message to reply not found: %s', reply_to)
-                continue
-            if not message_to_reply:
-                logger.error('message to reply not found: %s', reply_to)
-                continue
-
-            await message_to_reply.reply(message, file=file)
-            logger.debug('replied to channel: %s, message: %s, file: %s', channel_id, reply_to, file)
-            continue
-        await channel.send(message, file=file)
+        priority = ws_message_json.get('priority')
+        if not isinstance(priority, int):
+            # streamed analyses are alerts, the rest are notices
+            priority = PRIORITY_ALERT if message_key or file_base64 else PRIORITY_NOTICE
+
+        # the handler only dispatches, so a slow reply or upload does not block the next messages
+        scheduler.submit(channel.id, priority,
+                         functools.partial(deliver_and_answer, websocket, message_id, channel, message,
+                                           file_base64, reply_to, message_key, edit),
+                         message_key)
+
+
+async def deliver_and_answer(websocket, message_id: str, *args):
+    """deliver a monitor message, then ack it or nack it with the reason of the failure"""
+    try:
+        await deliver(*args)
+    except DeliveryError as e:
+        await answer(websocket, message_id, e)
+        return
+    except discord.Forbidden as e:
+        logger.error('send forbidden: %s', e)
+        await answer(websocket, message_id, DeliveryError('forbidden'))
+        return
+    except HTTPException as e:
+        logger.error('send failed: %s', e)
+        # server errors and rate limits may pass later, bad requests will not
+        await answer(websocket, message_id, DeliveryError('send_failed', retry=e.status >= 500 or e.status == 429))
+        return
+    except Exception as e:
+        logger.error('send failed: %s', e)
+        await answer(websocket, message_id, DeliveryError('send_failed', retry=True))
+        return
+    await answer(websocket, message_id)
+
+
+async def deliver(channel: discord.TextChannel, message: str, file_base64: str,
+                  reply_to: int, message_key: str, edit: bool):
+    """send, reply or edit a message received from the monitor"""
+    channel_id = channel.id
+    file = None
+    if isinstance(file_base64, bytes):
+        file = discord.File(io.BytesIO(file_base64), 'report.pdf')
+    elif file_base64:
+        try:
+            file_bytes = await asyncio.to_thread(base64.b64decode, file_base64)
+        except Exception as e:
+            logger.error('base64 decode error: %s', e)
+            raise DeliveryError('invalid_file') from e
+        file = discord.File(io.BytesIO(file_bytes), 'report.pdf')
+    if edit:
+        message_to_edit = keyed_messages.get(message_key)
+        if not message_to_edit:
+            logger.error('message to edit not found: %s', message_key)
+            raise DeliveryError('not_found')
+        await message_to_edit.edit(content=message)
+        logger.debug('edited message: %s', message_key)
+        return
+
+    if reply_to:
+        try:
+            message_to_reply = await channel.fetch_message(reply_to)
+        except discord.NotFound as e:
+            logger.error('message to reply not found: %s', reply_to)
+            raise DeliveryError('not_found') from e
+        if not message_to_reply:
+            logger.error('message to reply not found: %s', reply_to)
+            raise DeliveryError('not_found')
+
+        sent_message = await message_to_reply.reply(message, file=file)
+        logger.debug('replied to channel: %s, message: %s, file: %s', channel_id, reply_to, file)
+    else:
+        sent_message = await channel.send(message, file=file)
         logger.debug('sent to channel: %s', channel_id)
+    if message_key:
+        remember_keyed_message(message_key, sent_message)
+
+
+def remember_keyed_message(message_key: str, message: discord.Message):
+    """remember a sent message so it can be edited later, forgetting the oldest ones"""
+    keyed_messages[message_key] = message
+    keyed_messages.move_to_end(message_key)
+    while len(keyed_messages) > MAX_KEYED_MESSAGES:
+        keyed_messages.popitem(last=False)
+
+# --- monitor http client
+
+# one pooled keep-alive session, created at startup
+http_session: aiohttp.ClientSession = None
+
+
+async def open_http_session():
+    """create the session used for the requests to the monitor"""
+    global http_session
+    http_session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=MONITOR_TIMEOUT),
+        connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60))
+
+
+async def request_monitor(method: str, url: str, **kwargs):
+    """send a request to the monitor, returning the status and the json or text body"""
+    async with http_session.request(method, url, **kwargs) as response:
+        if response.content_type == 'application/json':
+            body = await response.json()
+        else:
+            body = await response.text()
+        return response.status, body
+
+
+async def call_monitor(interaction: discord.interactions.Interaction, method: str, url: str, **kwargs):
+    """
+    send a request to the monitor on behalf of an interaction, deferring the
+    interaction if the monitor is slow. returns the status and body, or None
+    and the error message if the request failed
+    """
+    request = asyncio.ensure_future(request_monitor(method, url, **kwargs))
+    try:
+        return await asyncio.wait_for(asyncio.shield(request), DEFER_AFTER)
+    except asyncio.TimeoutError:
+        if not interaction.response.is_done():
+            await interaction.response.defer(thinking=True)
+    except aiohttp.ClientError as e:
+        logger.error('monitor request failed: %s', e)
+        return None, f'monitor request failed: {e}'
+    try:
+        return await request
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error('monitor request failed: %s', e)
+        return None, f'monitor request failed: {e}'
+
+
+async def respond(interaction: discord.interactions.Interaction, content: str):
+    """answer an interaction, as a followup if it was already answered or deferred"""
+    if interaction.response.is_done():
+        await interaction.followup.send(content)
+    else:
+        await interaction.response.send_message(content)
+
+
+class AttachmentTooLarge(Exception):
+    """raised when an attachment grows past `MAX_ATTACHMENT_BYTES` while streamed"""
+
+
+async def stream_attachment(attachment: discord.Attachment, limit: int = MAX_ATTACHMENT_BYTES):
+    """yield the bytes of an attachment from discord's cdn, without keeping or saving them"""
+    async with http_session.get(attachment.url) as response:
+        response.raise_for_status()
+        size = 0
+        async for chunk in response.content.iter_chunked(ATTACHMENT_CHUNK_BYTES):
+            size += len(chunk)
+            if size > limit:
+                raise AttachmentTooLarge(f'attachment is larger than {limit} bytes')
+            yield chunk
+
+
+def monitor_message(status: int, body, success: str) -> str:
+    """the message telling the result of a monitor request"""
+    if status is not None and 200 <= status < 300:
+        return success
+    if isinstance(body, dict) and 'message' in body:
+        return f'failed: {body["message"]}'
+    return f'failed: {body}'
 
 # --- discord
 
 intents = discord.Intents.all()
-client = commands.Bot(command_prefix='!', intents=intents)
+client = commands.Bot(command_prefix='!', intents=intents, http_trace=http_trace)
 
 
 @client.event
@@ -163,22 +566,25 @@ async def gen_report_by_csv(interaction: discord.interactions.Interaction, zip_f
         original_response_id = original_response.id
         channel_id = original_response.channel.id
 
-        # send request to monitor
-        await zip_file.save('tmp.zip')
+        if zip_file.size > MAX_ATTACHMENT_BYTES:
+            await interaction.followup.send(f'file is too large, the limit is {MAX_ATTACHMENT_BYTES // 1024 // 1024} MB')
+            return
+
+        # stream the attachment from discord's cdn straight into the request to the monitor
         url = MONITOR_URL + '/gen'
-        files = {
-            'file': ('tmp.zip', open('tmp.zip', 'rb'), 'application/zip')
-        }
-        data = {
-            'channel_id': channel_id,
-            'original_response_id': original_response_id,
-        }
+        data = aiohttp.FormData()
+        data.add_field('channel_id', str(channel_id))
+        data.add_field('original_response_id', str(original_response_id))
+        data.add_field('file', stream_attachment(zip_file),
+                       filename=zip_file.filename, content_type='application/zip')
         logger.debug('url: %s', url)
-        logger.debug('files: %s', files)
         logger.debug('data: %s', data)
-        response = requests.post(url, files=files, data=data, timeout=10)
-        os.remove('tmp.zip')
-        await interaction.followup.send(f'sent request to monitor, waiting for response...')
+        try:
+            status, body = await call_monitor(interaction, 'POST', url, data=data)
+        except AttachmentTooLarge as e:
+            status, body = None, str(e)
+        await interaction.followup.send(
+            monitor_message(status, body, 'sent request to monitor, waiting for response...'))
     else:
         logger.debug('no file received')
         await interaction.response.send_message('no file, try again')
@@ -197,8 +603,8 @@ async def register_cloud_run(
     logger.debug('project_id: %s', project_id)
     logger.debug('service_name: %s', service_name)
     url = f'{MONITOR_URL}/dcbot/guilds/{guild_id}/channels/{channel_id}/cloud_run_services/{region}/{project_id}/{service_name}'
-    requests.post(url, timeout=10)
-    await interaction.response.send_message('register success')
+    status, body = await call_monitor(interaction, 'POST', url)
+    await respond(interaction, monitor_message(status, body, 'register success'))
 
 
 @client.tree.command()
@@ -214,8 +620,8 @@ async def unregister_cloud_run(
     logger.debug('project_id: %s', project_id)
     logger.debug('service_name: %s', service_name)
     url = f'{MONITOR_URL}/dcbot/guilds/{guild_id}/channels/{channel_id}/cloud_run_services/{region}/{project_id}/{service_name}'
-    requests.delete(url, timeout=10)
-    await interaction.response.send_message('unregister success')
+    status, body = await call_monitor(interaction, 'DELETE', url)
+    await respond(interaction, monitor_message(status, body, 'unregister success'))
 
 
 @client.tree.command()
@@ -224,8 +630,10 @@ async def list_cloud_run(interaction):
     guild_id = interaction.guild.id
     channel_id = interaction.channel.id
     url = f'{MONITOR_URL}/dcbot/guilds/{guild_id}/channels/{channel_id}/cloud_run_services'
-    response = requests.get(url, timeout=10)
-    cloud_run_services = response.json()
+    status, cloud_run_services = await call_monitor(interaction, 'GET', url)
+    if status != 200:
+        await respond(interaction, monitor_message(status, cloud_run_services, ''))
+        return
     logger.debug('type(cloud_run_services): %s', type(cloud_run_services))
     logger.debug('cloud_run_services: %s', cloud_run_services)
     response_message = 'cloud run services:\n'
@@ -233,7 +641,7 @@ async def list_cloud_run(interaction):
         response_message += f'- service name: **{cloud_run_service['service_name']}**\n'
         response_message += f'  - project id: **{cloud_run_service['project_id']}**\n'
         response_message += f'  - region: **{cloud_run_service['region']}**\n'
-    await interaction.response.send_message(response_message)
+    await respond(interaction, response_message)
 
 # --- start ---
 
@@ -248,6 +656,8 @@ def main():
     print(f'running websockets on port {WEBSOCKET_PORT}', flush=True)
     server = websockets.serve(websocket_handler, '', WEBSOCKET_PORT)
     loop.run_until_complete(server)
+    loop.run_until_complete(open_http_session())
+    loop.create_task(scheduler.report_forever())
 
     # - discord -
 
@@ -1,20 +1,20 @@
 """ The flask application package """
 
 import asyncio
-import datetime
 import base64
 import json
-import shutil
 import threading
 import logging
 import os
+import signal
 import zipfile
 from io import BytesIO
 import dotenv
 import markdown
+import pandas as pd
 from weasyprint import HTML
-from flask import Flask, request, jsonify, send_file
-from flaskr import dcbot
+from flask import Flask, Request, request, jsonify, send_file
+from flaskr import dcbot, incident
 from flaskr.db import init_db
 from flaskr.dcbot_websocket import DCBotWebSocket
 
@@ -32,6 +32,50 @@ logger.addHandler(handler)
 
 init_db()
 
+# /gen 上傳檔案的大小上限
+GEN_MAX_UPLOAD_BYTES = int(os.getenv('GEN_MAX_UPLOAD_MB', '20')) * 1024 * 1024
+# inline: 監控引擎在 API 程序內執行 (開發用)；external: 由獨立的程序執行 (python -m flaskr)
+MONITOR_ENGINE = os.getenv('MONITOR_ENGINE', 'inline')
+
+
+class UploadRequest(Request):
+    """
+    A request whose uploaded files are parsed from the multipart stream into
+    memory instead of temporary files; the size is capped by `MAX_CONTENT_LENGTH`.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return BytesIO()
+
+
+def start_engine() -> None:
+    """
+    Starts the monitoring engine: the pollers of the registered services,
+    the incident digests and the scaling planner.
+    """
+    dcbot.engine.start()
+    incident.run_digest_timer()
+    dcbot.planner.start()
+
+
+def run_engine() -> None:
+    """
+    Runs the monitoring engine as its own process until SIGTERM or SIGINT.
+
+    It only shares the database with the API workers, which register the
+    services, and sends its notifications to the dcbot over its own websocket.
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    DCBotWebSocket.connect_dcbot()
+    start_engine()
+    logger.info('monitoring engine started')
+    stop.wait()
+    logger.info('monitoring engine stopped')
+
+
 def create_app() -> Flask:
     """
     Creates and configures the Flask application.
@@ -45,6 +89,8 @@ def create_app() -> Flask:
 
     # flask app
     app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = GEN_MAX_UPLOAD_BYTES
     logger.debug('create_app')
 
     # websocket
@@ -78,6 +124,10 @@ def create_app() -> Flask:
             ws_message['file_base64'] = data['file_base64']
         if 'reply_to' in data:
             ws_message['reply_to'] = data['reply_to']
+        if 'message_key' in data:
+            ws_message['message_key'] = data['message_key']
+        if 'edit' in data:
+            ws_message['edit'] = data['edit']
 
         logger.debug('ws_message: %s', ws_message)
         result = DCBotWebSocket.send(json.dumps(ws_message))
@@ -101,23 +151,25 @@ def create_app() -> Flask:
             return jsonify({'message': 'file is required'}), 400
 
         if file and file.filename.endswith('.zip'):
-            now = datetime.datetime.now()
-            temp_dir = f'temp-{now.strftime("%Y-%m-%d-%H-%M-%S")}'
-            os.makedirs(temp_dir)
-            zip_path = os.path.join(temp_dir, file.filename)
-            logger.debug('zip_path: %s', zip_path)
-            file.save(zip_path)
-            # unzip
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            # remove zip
-            os.remove(zip_path)
-
-            def ws(temp_dir, channel_id, reply_to):
-                logger.debug('ws: %s', temp_dir)
+            # 直接從記憶體中的上傳內容讀取 CSV，不寫入暫存檔
+            try:
+                data_frames = dcbot.read_zip_csvs(file.stream)
+            except zipfile.BadZipFile:
+                logger.warning('invalid zip file')
+                return jsonify({'message': 'invalid zip file'}), 400
+            except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                logger.warning('invalid csv file: %s', e)
+                return jsonify({'message': 'invalid csv file'}), 400
+            except ValueError as e:
+                logger.warning('invalid zip file: %s', e)
+                return jsonify({'message': str(e)}), 400
+            if not data_frames:
+                return jsonify({'message': 'no csv file in zip'}), 400
+
+            def ws(data_frames, channel_id, reply_to):
+                logger.debug('ws: %d csv files', len(data_frames))
                 # gen AI report
-                mdpdf = dcbot.genai(temp_dir)
-                shutil.rmtree(temp_dir)
+                mdpdf = dcbot.genai_report(data_frames)
                 html = markdown.markdown(mdpdf)
                 pdf = HTML(string=html).write_pdf()
 
@@ -131,7 +183,7 @@ def create_app() -> Flask:
                 DCBotWebSocket.send(json.dumps(ws_message))
 
             th = threading.Thread(target=ws, args=(
-                temp_dir, channel_id, reply_to))
+                data_frames, channel_id, reply_to))
             th.daemon = True
             th.start()
             return jsonify({'message': 'ok'}), 200
@@ -154,11 +206,32 @@ def create_app() -> Flask:
         return dcbot.unregister_cloud_run_service(
             guild_id, channel_id, region, project_id, service_name)
 
+    @app.route(
+        '/dcbot/guilds/<guild_id>/channels/<channel_id>/cloud_run_services',
+        methods=['POST'])
+    def register_cloud_run_services(guild_id, channel_id):
+        services = dcbot.parse_services(request.get_json(silent=True))
+        if services is None:
+            logger.warning('invalid services: %s', request.data)
+            return jsonify({'message': 'services is required'}), 400
+        return dcbot.register_cloud_run_services(guild_id, channel_id, services)
+
+    @app.route(
+        '/dcbot/guilds/<guild_id>/channels/<channel_id>/cloud_run_services',
+        methods=['DELETE'])
+    def unregister_cloud_run_services(guild_id, channel_id):
+        services = dcbot.parse_services(request.get_json(silent=True))
+        if services is None:
+            logger.warning('invalid services: %s', request.data)
+            return jsonify({'message': 'services is required'}), 400
+        return dcbot.unregister_cloud_run_services(guild_id, channel_id, services)
+
     @app.route(
         '/dcbot/guilds/<guild_id>/channels/<channel_id>/cloud_run_services',
         methods=['GET'])
     def list_cloud_run_services(guild_id, channel_id):
         return dcbot.list_cloud_run_services(guild_id, channel_id)
 
-    dcbot.init_already_registered_services()
+    if MONITOR_ENGINE == 'inline':
+        start_engine()
     return app
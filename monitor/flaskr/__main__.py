@@ -0,0 +1,5 @@
+""" Runs the monitoring engine as its own process: python -m flaskr """
+
+from flaskr import run_engine
+
+run_engine()
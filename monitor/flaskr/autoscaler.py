@@ -0,0 +1,228 @@
+""" Autoscaling controller with hysteresis and cooldown for each service """
+
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+
+from flaskr.db import get_db
+from flaskr.genAI.cloud import CloudRun
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 以最近幾筆資料的平均投票決定是否調整
+SCALE_WINDOW = 6
+# 平均投票達到此值才增加資源
+SCALE_UP_THRESHOLD = 0.5
+# 減少資源需要更明確的證據，避免在兩個版本之間來回切換
+SCALE_DOWN_THRESHOLD = 1.0
+# 上次調整後至少等待多久才能再次調整
+SCALE_UP_DWELL = timedelta(minutes=5)
+SCALE_DOWN_DWELL = timedelta(minutes=30)
+
+APPLIED = 'applied'
+PREDICTED = 'predicted'
+COOLDOWN = 'cooldown'
+
+
+class ScalingDecision:
+    """
+    The outcome of one autoscaling evaluation.
+
+    Attributes:
+        cpu (int): The CPU step, 1 to scale up, -1 to scale down, 0 to keep.
+        memory (int): The memory step, 1 to scale up, -1 to scale down, 0 to keep.
+        cpu_vote (float): The average CPU vote of the window.
+        memory_vote (float): The average memory vote of the window.
+        reason (str): Why the steps are held, empty if they can be applied.
+        repeated (bool): Whether the previous evaluation had the same steps and reason.
+        predicted (bool): Whether the steps scale up ahead of a predicted peak.
+    """
+
+    def __init__(self, cpu: int = 0, memory: int = 0, cpu_vote: float = 0,
+                 memory_vote: float = 0, reason: str = '') -> None:
+        self.cpu = cpu
+        self.memory = memory
+        self.cpu_vote = cpu_vote
+        self.memory_vote = memory_vote
+        self.reason = reason
+        self.repeated = False
+        self.predicted = False
+
+    @property
+    def should_scale(self) -> bool:
+        """
+        Whether there is a step to apply now.
+        """
+        return (self.cpu != 0 or self.memory != 0) and not self.reason
+
+    def __repr__(self) -> str:
+        return f'ScalingDecision(cpu={self.cpu}, memory={self.memory}, reason={self.reason!r})'
+
+
+class AutoscalingController:
+    """
+    Decides when to scale one service from the votes of `SCALING_RULES`.
+
+    The votes are averaged over the last `window` rows, with separate
+    thresholds for scaling up and down, and a change must wait for the
+    dwell time since the previous one.
+    """
+
+    def __init__(self, window: int = SCALE_WINDOW,
+                 up_threshold: float = SCALE_UP_THRESHOLD,
+                 down_threshold: float = SCALE_DOWN_THRESHOLD,
+                 up_dwell: timedelta = SCALE_UP_DWELL,
+                 down_dwell: timedelta = SCALE_DOWN_DWELL) -> None:
+        self.window = window
+        self.up_threshold = up_threshold
+        self.down_threshold = down_threshold
+        self.up_dwell = up_dwell
+        self.down_dwell = down_dwell
+        self.last_change = None
+        self._last_time = None
+        self._last_outcome = None
+        self._cpu_votes = deque(maxlen=window)
+        self._memory_votes = deque(maxlen=window)
+
+    def decide(self, times: list, cpu_votes, memory_votes, now: datetime = None,
+               ahead: tuple[int, int] = (0, 0)) -> ScalingDecision:
+        """
+        Feeds the votes of new rows in and decides whether to scale.
+
+        Args:
+            times (list): The time of each row, oldest first.
+            cpu_votes: The CPU vote of each row.
+            memory_votes: The memory vote of each row.
+            now (datetime, optional): The time of the decision. Defaults to now.
+            ahead (tuple[int, int], optional): The CPU and memory steps to scale up
+                ahead of a predicted peak, used when the votes do not call for a change.
+
+        Returns:
+            ScalingDecision: The steps to apply, or why they are held.
+        """
+        if now is None:
+            now = datetime.now()
+        for time, cpu, memory in zip(times, cpu_votes, memory_votes):
+            if self._last_time is not None and time <= self._last_time:
+                continue
+            self._last_time = time
+            self._cpu_votes.append(int(cpu))
+            self._memory_votes.append(int(memory))
+
+        if len(self._cpu_votes) < self.window:
+            return ScalingDecision()
+        cpu_vote = sum(self._cpu_votes) / self.window
+        memory_vote = sum(self._memory_votes) / self.window
+        decision = ScalingDecision(self._step(cpu_vote), self._step(memory_vote),
+                                   cpu_vote, memory_vote)
+        if decision.cpu == 0 and decision.memory == 0:
+            if not any(ahead):
+                return decision
+            decision.cpu, decision.memory = ahead
+            decision.predicted = True
+
+        if self.last_change is not None:
+            scale_down = decision.cpu <= 0 and decision.memory <= 0
+            dwell = self.down_dwell if scale_down else self.up_dwell
+            if now - self.last_change < dwell:
+                decision.reason = COOLDOWN
+        outcome = (decision.cpu, decision.memory, decision.reason)
+        decision.repeated = outcome == self._last_outcome
+        self._last_outcome = outcome
+        return decision
+
+    def changed(self, now: datetime = None) -> None:
+        """
+        Records that the service was scaled, which starts the dwell time
+        and discards the votes collected for the previous revision.
+
+        Args:
+            now (datetime, optional): The time of the change. Defaults to now.
+        """
+        self.last_change = now if now is not None else datetime.now()
+        self._last_outcome = None
+        self._cpu_votes.clear()
+        self._memory_votes.clear()
+
+    def _step(self, vote: float) -> int:
+        if vote >= self.up_threshold:
+            return 1
+        if vote <= -self.down_threshold:
+            return -1
+        return 0
+
+
+class Autoscaler:
+    """
+    The autoscaling controllers of all services.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._controllers: dict[str, AutoscalingController] = {}
+
+    def controller(self, service: str) -> AutoscalingController:
+        """
+        Returns the controller of a service, creating it if needed.
+
+        Args:
+            service (str): The key of the service.
+
+        Returns:
+            AutoscalingController: The controller of the service.
+        """
+        with self._lock:
+            controller = self._controllers.get(service)
+            if controller is None:
+                controller = self._controllers[service] = AutoscalingController()
+            return controller
+
+    def forget(self, service: str) -> None:
+        """
+        Drops the controller of a service.
+
+        Args:
+            service (str): The key of the service.
+        """
+        with self._lock:
+            self._controllers.pop(service, None)
+
+
+def record_scaling_decision(cr: CloudRun, decision: ScalingDecision, action: str,
+                            origin: tuple[int, int], target: tuple[int, int],
+                            now: datetime = None) -> None:
+    """
+    Writes a scaling decision into the decision log.
+
+    Args:
+        cr (CloudRun): The CloudRun instance.
+        decision (ScalingDecision): The decision of the controller.
+        action (str): `APPLIED` or the reason the steps were held.
+        origin (tuple[int, int]): The CPU and memory before the decision.
+        target (tuple[int, int]): The CPU and memory after the decision.
+        now (datetime, optional): The time of the decision. Defaults to now.
+    """
+    if now is None:
+        now = datetime.now()
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('''
+    INSERT INTO scaling_decision (region, project_id, service_name, decided_at,
+      action, cpu_vote, memory_vote, cpu_from, cpu_to, memory_from, memory_to)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (cr.region, cr.project_id, cr.service_name, now.isoformat(), action,
+          decision.cpu_vote, decision.memory_vote, origin[0], target[0],
+          origin[1], target[1]))
+    db.commit()
+    db.close()
+    logger.debug('scaling decision of %s: %s %s -> %s',
+                 cr.service_name, action, origin, target)
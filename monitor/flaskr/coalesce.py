@@ -0,0 +1,152 @@
+""" Per-channel coalescing of the notifications sent to the dcbot """
+
+import json
+import threading
+import logging
+
+from flaskr.dcbot_websocket import DCBotWebSocket
+from flaskr.stream_message import DISCORD_MESSAGE_LIMIT
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 同一頻道的通知累積多久後合併送出 (秒)
+COALESCE_WINDOW = 5
+# dcbot 依優先度送出訊息，數字小的先送 (告警先於資源調整通知)
+PRIORITY_ALERT = 0
+PRIORITY_NOTICE = 1
+
+
+def pack_messages(sections: list[str], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """
+    Packs sections into as few messages as possible, each within `limit`
+    characters. A section longer than the limit is split on line breaks.
+
+    Args:
+        sections (list[str]): The sections, in order.
+        limit (int): The maximum length of a message.
+
+    Returns:
+        list[str]: The messages.
+    """
+    messages, current = [], ''
+    for section in sections:
+        section = section.strip('\n')
+        while len(section) > limit:
+            cut = section.rfind('\n', 0, limit)
+            if cut <= 0:
+                cut = limit
+            head, section = section[:cut], section[cut:].lstrip('\n')
+            if current:
+                messages.append(current)
+                current = ''
+            messages.append(head)
+        if not section:
+            continue
+        if current and len(current) + 2 + len(section) > limit:
+            messages.append(current)
+            current = ''
+        current = f'{current}\n\n{section}' if current else section
+    if current:
+        messages.append(current)
+    return messages
+
+
+class ChannelBuffer:
+    """
+    The notifications of one channel waiting to be sent, grouped by header.
+    """
+
+    def __init__(self) -> None:
+        self.groups: dict[str, list[str]] = {}
+        self.priority = PRIORITY_NOTICE
+        self.timer: threading.Timer | None = None
+
+    def sections(self) -> list[str]:
+        """
+        Returns one section per header, the header written once before its bodies.
+        """
+        return [header + '\n'.join(body.strip('\n') for body in bodies)
+                for header, bodies in self.groups.items()]
+
+
+class NotificationCoalescer:
+    """
+    Buffers the notifications of each channel for `window` seconds and sends
+    them as few messages within the Discord limit, so the services reporting
+    to one channel do not run into its rate limit.
+
+    Notifications about the same service share a header, which is written
+    once. An urgent notification flushes its channel at once. Streamed
+    messages that are edited afterwards are not coalesced.
+    """
+
+    def __init__(self, window: float = COALESCE_WINDOW) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._channels: dict[str, ChannelBuffer] = {}
+
+    def post(self, channel_id: str, body: str, header: str = '',
+             urgent: bool = False, priority: int = PRIORITY_NOTICE) -> None:
+        """
+        Adds a notification to the buffer of its channel.
+
+        Args:
+            channel_id (str): The ID of the channel.
+            body (str): The notification.
+            header (str, optional): The header of the notification, e.g. the service it is about.
+            urgent (bool, optional): Whether to send the channel buffer at once.
+            priority (int, optional): The priority of the notification in the dcbot.
+                The merged messages take the highest priority of their notifications.
+        """
+        with self._lock:
+            buffer = self._channels.get(channel_id)
+            if buffer is None:
+                buffer = self._channels[channel_id] = ChannelBuffer()
+            buffer.groups.setdefault(header, []).append(body)
+            buffer.priority = min(buffer.priority, priority)
+            if not urgent and buffer.timer is None:
+                buffer.timer = threading.Timer(self.window, self.flush, [channel_id])
+                buffer.timer.daemon = True
+                buffer.timer.start()
+        if urgent:
+            self.flush(channel_id)
+
+    def flush(self, channel_id: str, priority: int = None) -> int:
+        """
+        Sends the buffered notifications of a channel.
+
+        Args:
+            channel_id (str): The ID of the channel.
+            priority (int, optional): Raises the priority of the messages, so they
+                are sent before a message of that priority posted right after them.
+
+        Returns:
+            int: The number of messages sent.
+        """
+        with self._lock:
+            buffer = self._channels.pop(channel_id, None)
+        if buffer is None:
+            return 0
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+        if priority is not None:
+            buffer.priority = min(buffer.priority, priority)
+        messages = pack_messages(buffer.sections())
+        for message in messages:
+            DCBotWebSocket.send(json.dumps({
+                'channel_id': channel_id,
+                'message': message,
+                'priority': buffer.priority,
+            }))
+        logger.debug('%d notifications sent to %s in %d messages',
+                     sum(len(bodies) for bodies in buffer.groups.values()),
+                     channel_id, len(messages))
+        return len(messages)
@@ -2,14 +2,18 @@
 
 import sqlite3
 
+# 等待其他程序 (API workers 與監控引擎) 釋放資料庫鎖的時間 (秒)
+DB_BUSY_TIMEOUT = 30
+
 def get_db():
     """
     Connects to the 'monitor.db' SQLite database and returns the connection object.
+    The database is shared by the API workers and the monitoring engine.
 
     Returns:
         sqlite3.Connection: The connection object to the database.
     """
-    db = sqlite3.connect('monitor.db')
+    db = sqlite3.connect('monitor.db', timeout=DB_BUSY_TIMEOUT)
     db.row_factory = sqlite3.Row
     return db
 
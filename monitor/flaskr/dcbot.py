@@ -1,19 +1,34 @@
 """ This module contains the functions for monitoring Cloud Run services. """
-import threading
 import os
-import json
+import zipfile
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import reduce
+from typing import Callable
 from flask import jsonify
 import pandas as pd
 import logging
 
 from flaskr.genAI.llm import LLM
 from flaskr.db import get_db
-from flaskr.genAI.cloud import (CloudRun, CloudRunPerformanceMonitor,
-                                UntilNowTimeRange, SpecificTimeRange, CloudRunResourceManager)
-from flaskr.dcbot_websocket import DCBotWebSocket
+from flaskr.genAI.cloud import (CloudRun, CloudRunPerformanceMonitor, TimeRange,
+                                UntilNowTimeRange, CloudRunResourceManager,
+                                service_specs)
+from flaskr.stream_message import StreamingMessage
+from flaskr.incident import update_incidents, INCIDENT_DIGEST_MINUTES
+from flaskr.detector import AnomalyDetector, deviation_rules
+from flaskr.rules import ABNORMAL_RULES, SCALING_RULES
+from flaskr.triage import Triage, format_template
+from flaskr.rollout import RolloutTracker
+from flaskr.autoscaler import (Autoscaler, AutoscalingController, ScalingDecision,
+                               record_scaling_decision, APPLIED, PREDICTED)
+from flaskr.forecast import Forecaster
+from flaskr.planner import FleetPlanner, ScalingProposal
+from flaskr.logmine import LogMiner, format_templates
+from flaskr.logbuffer import LogBuffers
+from flaskr.logbatch import ProjectLogFetcher
+from flaskr.coalesce import NotificationCoalescer, PRIORITY_ALERT, PRIORITY_NOTICE
+from flaskr.engine import MonitoringEngine
 
 # --- logger
 
@@ -25,67 +40,80 @@ formatter = logging.Formatter(
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-def check_metrics_abnormalities(metrics: list[dict]):
+detector = AnomalyDetector()
+triage = Triage(detector)
+rollouts = RolloutTracker()
+autoscaler = Autoscaler()
+forecaster = Forecaster()
+log_miner = LogMiner()
+# 同專案的服務一起讀取 log，共用一次查詢
+log_buffers = LogBuffers(fetch=ProjectLogFetcher().fetch)
+# 同一頻道的通知合併後再送出
+notifications = NotificationCoalescer()
+planner = FleetPlanner(notifications=notifications)
+# 告警訊息與 prompt 中列出的 log 樣板數量
+ALERT_TEMPLATE_LIMIT = 3
+PROMPT_TEMPLATE_LIMIT = 20
+# 第一次輪詢時讀取的歷史資料長度，需涵蓋兩個季節週期
+FORECAST_HISTORY_DAYS = 3
+# /gen 上傳的 zip 中 CSV 解壓縮後的大小上限
+GEN_MAX_CSV_BYTES = int(os.getenv('GEN_MAX_CSV_MB', '100')) * 1024 * 1024
+
+# 告警標題中顯示的指標
+HEADLINE_METRICS = [
+    'Container CPU Utilization (%)',
+    'Container Memory Utilization (%)',
+    'Request Latency (ms)',
+    'Request Count (4xx)',
+    'Request Count (5xx)',
+    'Instance Count (active)',
+    'Container Startup Latency (ms)',
+]
+
+
+def find_metrics_abnormalities(metrics: list[dict]) -> list[str]:
     """
-    Checks if the given metrics indicate abnormalities.
+    Finds the abnormality rules fired by the given metrics.
 
     Args:
         metrics (list[dict]): List of metric dictionaries.
 
     Returns:
-        bool: True if abnormalities are detected, False otherwise.
+        list[str]: The descriptions of the fired rules, empty if there are none.
     """
     if len(metrics) == 0:
-        return False
-    logger.debug('check_metrics_abnormalities: %s', metrics)
-    metric = metrics[-1]
-
-    if metric.get('Container Startup Latency (ms)', 0) > 0:
-        return True
-
-    if metric.get('Instance Count (active)', 0) > 2:
-        return True
-
-    if metric.get('Request Count (4xx)', 0) > 5:
-        return True
-
-    if metric.get('Request Count (5xx)', 0) > 5:
-        return True
-
-    times_dict = {'cpu': 0, 'memory': 0}
+        return []
+    logger.debug('find_metrics_abnormalities: %s', metrics)
+    return ABNORMAL_RULES.fired(pd.DataFrame(metrics))
 
-    if len(metrics) >= 2:
-        for metric in metrics[-2:]:
-            cpu_abnormal = metric.get(
-                'Container CPU Utilization (%)', 0) > 60
-            memory_abnormal = metric.get(
-                'Container Memory Utilization (%)', 0) > 60
 
-            if cpu_abnormal:
-                times_dict['cpu'] += 1
-            else:
-                times_dict['cpu'] = 0
+def check_metrics_abnormalities(metrics: list[dict]):
+    """
+    Checks if the given metrics indicate abnormalities.
 
-            if memory_abnormal:
-                times_dict['memory'] += 1
-            else:
-                times_dict['memory'] = 0
+    Args:
+        metrics (list[dict]): List of metric dictionaries.
 
-    return times_dict['cpu'] >= 2 or times_dict['memory'] >= 2
+    Returns:
+        bool: True if abnormalities are detected, False otherwise.
+    """
+    return len(find_metrics_abnormalities(metrics)) > 0
 
 
-def polling_metric(crpm: CloudRunPerformanceMonitor):
+def polling_metric(crpm: CloudRunPerformanceMonitor, until_now: TimeRange = None):
     """
     Polls various metrics from a CloudRunPerformanceMonitor object.
 
     Args:
         crpm (CloudRunPerformanceMonitor): The CloudRunPerformanceMonitor object 
         to poll metrics from.
+        until_now (TimeRange, optional): The time range to poll. Defaults to the last 5 minutes.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the polled metrics.
     """
-    until_now = UntilNowTimeRange(minutes=5)
+    if until_now is None:
+        until_now = UntilNowTimeRange(minutes=5)
     metries_datas = []
 
     metries_types_and_name = [
@@ -232,6 +260,94 @@ def is_cloud_run_service_registered(guild_id, channel_id, region, project_id, se
     return cursor.fetchone() is not None
 
 
+def get_service_header(cr: CloudRun) -> str:
+    """
+    Builds the lines identifying a service at the top of its messages.
+
+    Args:
+        cr (CloudRun): The CloudRun instance.
+
+    Returns:
+        str: The header in markdown.
+    """
+    message = f'- service name: **{cr.service_name}**\n'
+    message += f'  - project id: **{cr.project_id}**\n'
+    message += f'  - region: **{cr.region}**\n'
+    return message
+
+
+def get_alert_headline(cr: CloudRun, fired_rules: list[str], metric: dict) -> str:
+    """
+    Builds the headline of an alert message, which is sent before the analysis.
+
+    Args:
+        cr (CloudRun): The CloudRun instance the alert is about.
+        fired_rules (list[str]): The descriptions of the fired rules.
+        metric (dict): The latest metrics of the service.
+
+    Returns:
+        str: The headline in markdown.
+    """
+    message = get_service_header(cr)
+    message += f'  - rules: **{", ".join(fired_rules)}**\n'
+    # 只使用已快取的服務設定，告警路徑上不呼叫 API；沒有快取時省略此行
+    spec = service_specs.peek(cr.get_full_service_name())
+    if spec is not None and spec.template.containers:
+        limits = spec.template.containers[0].resources.limits
+        message += f'  - limits: **{limits.get("cpu", "-")} CPU, {limits.get("memory", "-")}**\n'
+    for key in HEADLINE_METRICS:
+        if key in metric and not pd.isna(metric[key]):
+            message += f'  - {key}: **{metric[key]:.2f}**\n'
+    return message + '\n'
+
+
+def load_forecast_history(crpm: CloudRunPerformanceMonitor, service_key: str):
+    """
+    Feeds the last `FORECAST_HISTORY_DAYS` days of metrics into the forecaster,
+    so that predictions start without waiting for the history to build up.
+
+    Args:
+        crpm (CloudRunPerformanceMonitor): The monitor of the service.
+        service_key (str): The key of the service.
+    """
+    try:
+        history = polling_metric(crpm, UntilNowTimeRange(days=FORECAST_HISTORY_DAYS))
+    except Exception as e:
+        logger.error('cannot load history of %s: %s', service_key, e)
+        return
+    forecaster.update(service_key, list(history.index),
+                      [item.to_dict() for item in history.iloc])
+
+
+def apply_scaling(crm: CloudRunResourceManager, controller: AutoscalingController,
+                  decision: ScalingDecision, origin: tuple[int, int],
+                  target: tuple[int, int], notify: Callable[[bool], None]):
+    """
+    Sends the update of a scaling decision. The decision is recorded and the
+    cooldown of the controller starts only once the update is accepted; a
+    rejected update (quota, permission, invalid spec) is reported as failed.
+
+    Args:
+        crm (CloudRunResourceManager): The resource manager of the service.
+        controller (AutoscalingController): The autoscaling controller of the service.
+        decision (ScalingDecision): The decision to apply.
+        origin (tuple[int, int]): The current CPU and memory.
+        target (tuple[int, int]): The planned CPU and memory.
+        notify (Callable[[bool], None]): Tells the channel whether the new revision serves.
+
+    Returns:
+        Operation | None: The long-running operation of the update, or None if it failed.
+    """
+    operation = crm.apply_plan(cpu=decision.cpu, memory=decision.memory)
+    if operation is None:
+        notify(False)
+        return None
+    controller.changed()
+    record_scaling_decision(crm.cloud_run_info, decision,
+                            PREDICTED if decision.predicted else APPLIED, origin, target)
+    return operation
+
+
 def query(cr: CloudRun, channel_id):
     """
     Queries the CloudRun instance for metrics and performs scaling operations based on the metrics.
@@ -244,171 +360,160 @@ def query(cr: CloudRun, channel_id):
         None
     """
     logger.debug('query: %s', cr)
-    lastest_llm_query_time = get_lastest_llm_query_time(
-        cr.region, cr.project_id, cr.service_name)
-    query_time = datetime.fromisoformat(
-        lastest_llm_query_time) if lastest_llm_query_time else None
-    if not query_time is None and (datetime.now() - query_time).total_seconds() < 600:
-        return
-
     crpm = CloudRunPerformanceMonitor(cr)
     result = polling_metric(crpm)
 
+    if result.empty:
+        return
+
     metrics = [item.to_dict() for item in result.iloc]
-    if check_metrics_abnormalities(metrics):
-        # 獲取該 metrixs 的 第一筆資料 和 最後一筆資料 的時間
-        start_time, end_time = result.index[0], result.index[-1]
-        time_range = SpecificTimeRange(start_time, end_time)
-        logs = crpm.get_logs(time_range)
-
-        if logs is []:
-            logs = '沒有 log'
-
-        text = LLM.AnalysisError.gen(
-            data=f'指標：\b{result.to_dict()}\n錯誤訊息:\n{logs}')
-        set_lastest_llm_query_time(
-            cr.region, cr.project_id, cr.service_name, datetime.now().isoformat())
-
-        message = f'- service name: **{cr.service_name}**\n'
-        message += f'  - project id: **{cr.project_id}**\n'
-        message += f'  - region: **{cr.region}**\n'
-        message += text
-
-        ws_message = {
-            'channel_id': channel_id,
-            'message': message
-        }
-        DCBotWebSocket.send(json.dumps(ws_message))
+    service_key = cr.get_full_service_name()
+    if not forecaster.has_history(service_key):
+        load_forecast_history(crpm, service_key)
+    forecaster.update(service_key, list(result.index), metrics)
+    # 固定門檻的規則，加上相對於服務自身基準值的偏差
+    deviations = detector.update(service_key, list(result.index), metrics)
+    fired_rules = ABNORMAL_RULES.fired(result) + deviation_rules(deviations)
+    # 只有新開啟的事件才告警，持續中的事件只更新紀錄
+    changes = update_incidents(cr, channel_id, fired_rules)
+    if changes.resolved and INCIDENT_DIGEST_MINUTES <= 0:
+        notifications.post(channel_id, f'  - 已恢復: **{", ".join(changes.resolved)}**',
+                           header=get_service_header(cr))
+    if changes.opened:
+        verdict = triage.evaluate(service_key, fired_rules, metrics[-1])
+        headline = get_alert_headline(cr, changes.opened, metrics[-1])
+
+        if not verdict.escalate:
+            # 嚴重度低，不呼叫 LLM，直接送出樣板訊息
+            notifications.post(channel_id, format_template(fired_rules, verdict),
+                               header=headline, priority=PRIORITY_ALERT)
+        else:
+            # 先送出標題，分析結果再以編輯訊息的方式逐步補上
+            # 串流訊息之後會被編輯，不合併；先以告警的優先度送出頻道中累積的通知，
+            # dcbot 依優先度排序，同優先度則依到達順序，才能維持順序
+            notifications.flush(channel_id, priority=PRIORITY_ALERT)
+            stream = StreamingMessage(channel_id, headline)
+            stream.start()
+            try:
+                set_lastest_llm_query_time(
+                    cr.region, cr.project_id, cr.service_name, datetime.now().isoformat())
+
+                # 獲取該 metrixs 的 第一筆資料 和 最後一筆資料 的時間
+                start_time, end_time = result.index[0], result.index[-1]
+                try:
+                    # 只向 Cloud Logging 讀取上次之後的新 log，其餘從緩衝區取得
+                    entries = log_buffers.read(service_key, crpm, start_time, end_time)
+                    # 重複的錯誤訊息合併成樣板，縮短 prompt
+                    templates = log_miner.summarize(service_key, entries)
+                    logs = format_templates(templates, PROMPT_TEMPLATE_LIMIT)
+                except Exception as e:
+                    # 讀不到 log 時仍以指標進行分析
+                    logger.error('cannot read logs of %s: %s', cr.service_name, e)
+                    templates, logs = [], ''
+
+                if not logs:
+                    logs = '沒有 log'
+                else:
+                    stream.append('**Log 樣板**\n' + ''.join(
+                        f'- x{template.count} `{template.template[:200]}`\n'
+                        for template in templates[:ALERT_TEMPLATE_LIMIT]) + '\n')
+
+                for chunk in LLM.AnalysisError.gen_stream(
+                        data=f'指標：\b{result.to_dict()}\n錯誤訊息:\n{logs}'):
+                    stream.append(chunk)
+            finally:
+                stream.finish()
+
+    # 前一次調整的新版本上線前，不再做新的調整
+    if rollouts.in_progress(service_key):
+        return
 
-    cpu_util = metrics[-1].get('Container CPU Utilization (%)', 0)
-    mem_util = metrics[-1].get('Container Memory Utilization (%)', 0)
-    crm = CloudRunResourceManager(cr)
-    # if cpu_util > 50:
-    #     crm.cpu.scale_up()
-    # elif cpu_util < 30:
-    #     crm.cpu.scale_down()
-
-    # if mem_util > 50:
-    #     crm.memory.scale_up()
-    # elif mem_util < 30:
-    #     crm.memory.scale_down()
-
-    request_count = metrics[-1].get('Request Count', 50)
-    request_latencies = metrics[-1].get('Request Latency (ms)', 0)
-    instance_count = metrics[-1].get('Instance Count', 1)
-    container_startup_latencies = metrics[-1].get('Container Startup Latency (ms)', 0)
-    cpu, mem = 0, 0
-
-    if cpu_util > 50:
-        cpu += 1
-    elif cpu_util < 30:
-        cpu -= 1
-    
-    if mem_util > 50:
-        mem += 1
-    elif mem_util < 30:
-        mem -= 1
-    
-    if request_count > 100:
-        cpu += 1
-        mem += 1
-    elif request_count < 50:
-        cpu -= 1
-        mem -= 1
-    
-    if request_latencies > 100:
-        cpu += 1
-    elif request_latencies < 50:
-        cpu -= 1
-
-    if instance_count > 2:
-        cpu += 1
-        mem += 1
-    elif instance_count < 1:
-        cpu -= 1
-        mem -= 1
-
-    if container_startup_latencies > 100:
-        cpu += 1
-        mem += 1
-    elif container_startup_latencies == 0:
-        cpu -= 1
-        mem -= 1
+    cpu_votes, mem_votes = SCALING_RULES.votes(result)
+    controller = autoscaler.controller(service_key)
+    decision = controller.decide(list(result.index), cpu_votes, mem_votes,
+                                 ahead=forecaster.prescale_steps(service_key))
+    if decision.cpu == 0 and decision.memory == 0:
+        return
+    # 冷卻中且與上次相同的決策已記錄過，不需再讀取服務
+    if not decision.should_scale and decision.repeated:
+        return
 
-    message = f'- service name: **{cr.service_name}**\n'
-    message += f'  - project id: **{cr.project_id}**\n'
-    message += f'  - region: **{cr.region}**\n'
-    
-    if cpu > 0:
-        crm.cpu.scale_up()
-        DCBotWebSocket.send(json.dumps({
-            'channel_id': channel_id,
-            'message': message + 'CPU **增加**資源'
-        }))
-    elif cpu < 0:
-        crm.cpu.scale_down()
-        DCBotWebSocket.send(json.dumps({
-            'channel_id': channel_id,
-            'message': message + 'CPU **減少**資源'
-        }))
-    if mem > 0:
-        crm.memory.scale_up()
-        DCBotWebSocket.send(json.dumps({
-            'channel_id': channel_id,
-            'message': message + 'Memory **增加**資源'
-        }))
-    elif mem < 0:
-        crm.memory.scale_down()
-        DCBotWebSocket.send(json.dumps({
-            'channel_id': channel_id,
-            'message': message + 'Memory **減少**資源'
-        }))
-
-def run_timer(guild_id, channel_id, cr: CloudRun):
-    """
-    Run a timer that periodically executes the query function for a given CloudRun instance.
+    # CPU 與 Memory 一起調整，只更新一次服務
+    crm = CloudRunResourceManager(cr)
+    try:
+        crm.init_resource()
+        target_cpu, target_mem = crm.plan(cpu=decision.cpu, memory=decision.memory)
+    except Exception as e:
+        logger.error('cannot read resource of %s: %s', cr.service_name, e)
+        return
+    origin_cpu, origin_mem = crm.cpu.value, crm.memory.value
+    if (target_cpu, target_mem) == (origin_cpu, origin_mem):
+        return
+    if not decision.should_scale:
+        record_scaling_decision(cr, decision, decision.reason,
+                                (origin_cpu, origin_mem), (target_cpu, target_mem))
+        return
+    message = ''
+    if target_cpu != origin_cpu:
+        message += f'CPU **{"增加" if target_cpu > origin_cpu else "減少"}**資源' \
+            f' ({origin_cpu} → {target_cpu} vCPU)\n'
+    if target_mem != origin_mem:
+        message += f'Memory **{"增加" if target_mem > origin_mem else "減少"}**資源' \
+            f' ({origin_mem} → {target_mem} MiB)\n'
+    if decision.predicted:
+        message += '預測即將出現尖峰，提前調整\n'
+
+    def notify(serving: bool):
+        # 調整失敗需要立即處理，不等待合併
+        notifications.post(channel_id,
+                           message + ('新版本已上線' if serving else '**調整失敗**，請檢查服務狀態'),
+                           header=get_service_header(cr), urgent=not serving,
+                           priority=PRIORITY_NOTICE if serving else PRIORITY_ALERT)
+
+    def apply():
+        # 在背景送出更新並追蹤新版本的上線進度，不阻塞輪詢
+        rollouts.submit(service_key,
+                        lambda: apply_scaling(crm, controller, decision, (origin_cpu, origin_mem),
+                                              (target_cpu, target_mem), notify),
+                        notify)
+
+    # 交給 planner 與其他服務的提案一起，在專案預算內批次套用
+    planner.propose(ScalingProposal(cr, channel_id, decision, (origin_cpu, origin_mem),
+                                    (target_cpu, target_mem), apply))
+
+# 輪詢所有已註冊的服務，可在 API 程序內或獨立的程序中執行 (python -m flaskr)
+engine = MonitoringEngine(query)
+
+def read_zip_csvs(stream) -> list[pd.DataFrame]:
+    """
+    Reads the CSV files of a zip archive without extracting them to disk.
 
     Args:
-        guild_id (str): The ID of the guild.
-        channel_id (str): The ID of the channel.
-        cr (CloudRun): The CloudRun instance.
+        stream: The seekable binary stream of the zip archive.
 
     Returns:
-        None
-    """
-    if not is_cloud_run_service_registered(
-            guild_id, channel_id, cr.region, cr.project_id, cr.service_name):
-        return
-    timer = threading.Timer(30, run_timer, [guild_id, channel_id, cr])
-    timer.daemon = True
-    timer.start()
-    query(cr, channel_id)
+        list[pd.DataFrame]: One data frame per CSV file.
 
-def init_already_registered_services():
+    Raises:
+        zipfile.BadZipFile: If the stream is not a zip archive.
+        ValueError: If the CSV files exceed `GEN_MAX_CSV_BYTES` once decompressed.
+        UnicodeDecodeError: If a CSV file is not UTF-8.
+        pd.errors.ParserError: If a CSV file cannot be parsed.
     """
-    Initializes the already registered Cloud Run services.
-
-    Returns:
-        None
-    """
-    db = get_db()
-    cursor = db.cursor()
-
-    cursor.execute('''
-    SELECT * FROM cloud_run_service
-    ''')
+    with zipfile.ZipFile(stream) as zip_ref:
+        # macOS 壓縮時加入的 __MACOSX/ 資源檔不是 CSV
+        members = [info for info in zip_ref.infolist()
+                   if not info.is_dir() and info.filename.endswith('.csv')
+                   and not info.filename.startswith('__MACOSX/')]
+        # 讀取前先以標頭中的大小檢查，避免解壓縮炸彈
+        if sum(info.file_size for info in members) > GEN_MAX_CSV_BYTES:
+            raise ValueError(f'csv files exceed {GEN_MAX_CSV_BYTES // (1024 * 1024)} MB')
+        data_frames = []
+        for info in members:
+            with zip_ref.open(info) as csv_file:
+                data_frames.append(pd.read_csv(csv_file))
+    return data_frames
 
-    for row in cursor.fetchall():
-        guild_id = row[5]
-        channel_id = row[3]
-        region = row[0]
-        project_id = row[1]
-        service_name = row[2]
-        cr = CloudRun(region, project_id, service_name)
-        timer_thread = threading.Thread(target=run_timer, args=(
-            guild_id, channel_id, cr))
-        timer_thread.daemon = True
-        timer_thread.start()
 
 def genai(temp_dir: str):
     """
@@ -423,6 +528,19 @@ def genai(temp_dir: str):
     data_frames = []
     for entry in os.listdir(temp_dir):
         data_frames.append(pd.read_csv(os.path.join(temp_dir, entry)))
+    return genai_report(data_frames)
+
+
+def genai_report(data_frames: list[pd.DataFrame]):
+    """
+    Generate a markdown report based on the given data frames.
+
+    Args:
+        data_frames (list[pd.DataFrame]): The exported metrics, one data frame per CSV file.
+
+    Returns:
+        str: The generated markdown report.
+    """
     data_frames = list(map(lambda df: df.assign(
         Time=pd.to_datetime(df['Time'])), data_frames))
     merged_data = reduce(lambda left, right: pd.merge(
@@ -431,32 +549,47 @@ def genai(temp_dir: str):
 
     # Generate markdown
     mdpdf = "# 報告書\n"
+    rows = [item.to_dict() for item in merged_data.iloc]
+    # 一次計算所有時間點的規則與調整建議
+    hits = ABNORMAL_RULES.evaluate(merged_data)
+    cpu_votes, mem_votes = SCALING_RULES.votes(merged_data)
+    report_detector = AnomalyDetector()
+    report_triage = Triage(report_detector)
     i = 2
     while i < len(merged_data):
-        metrics = [item.to_dict() for item in merged_data.iloc][i-2:i]
-        if check_metrics_abnormalities(metrics):
+        # 包含被略過的資料，讓基準值涵蓋異常時間之前的所有資料
+        start = max(i - 12, 0)
+        deviations = report_detector.update(
+            'report', merged_data.index[start:i], rows[start:i])
+        metrics = rows[i-2:i]
+        fired_rules = ABNORMAL_RULES.names_at(hits, i-1) + deviation_rules(deviations)
+        if fired_rules:
             mdpdf += f'## 異常時間: {merged_data.index[i-1]}\n'
-            mdpdf += LLM.AnalysisError.gen(data=f'指標：{metrics}')
+            verdict = report_triage.evaluate(
+                'report', fired_rules, metrics[-1], now=merged_data.index[i-1])
+            if verdict.escalate:
+                mdpdf += LLM.AnalysisError.gen(data=f'指標：{metrics}')
+            else:
+                mdpdf += format_template(fired_rules, verdict)
             mdpdf += '\n'
-            i += 10
-            cpu_util = metrics[-1].get('Container CPU Utilization (%)', 0)
-            mem_util = metrics[-1].get('Container Memory Utilization (%)', 0)
 
-            if cpu_util > 50 or cpu_util < 30:
+            if cpu_votes[i-1] != 0:
                 mdpdf += '### CPU 自動調整操作\n'
-                mdpdf += f'CPU 建議**{"增加" if cpu_util > 50 else "減少"}**資源˙\n'
+                mdpdf += f'CPU 建議**{"增加" if cpu_votes[i-1] > 0 else "減少"}**資源\n'
 
-            if mem_util > 50 or mem_util < 30:
+            if mem_votes[i-1] != 0:
                 mdpdf += '### Memory 自動調整操作\n'
-                mdpdf += f'Memory 建議**{"增加" if mem_util > 50 else "減少"}**資源\n'
+                mdpdf += f'Memory 建議**{"增加" if mem_votes[i-1] > 0 else "減少"}**資源\n'
+            if verdict.escalate:
+                i += 10
         i += 1
     return mdpdf
 
 
 def register_cloud_run_service(guild_id, channel_id, region, project_id, service_name):
     """
-    Registers a Cloud Run service in the database and starts 
-    a timer to periodically query the service.
+    Registers a Cloud Run service in the database; the monitoring
+    engine starts polling it when it sees the new row.
 
     Args:
         guild_id (int): The ID of the guild.
@@ -485,10 +618,7 @@ def register_cloud_run_service(guild_id, channel_id, region, project_id, service
     VALUES (?, ?, ?, ?, ?)
     ''', (guild_id, channel_id, region, project_id, service_name))
         db.commit()
-        timer_thread = threading.Thread(target=run_timer, args=(
-            guild_id, channel_id, CloudRun(region, project_id, service_name)))
-        timer_thread.daemon = True
-        timer_thread.start()
+        engine.poke()
         return jsonify({'message': 'Service registered'}), 201
 
 
@@ -516,11 +646,106 @@ def unregister_cloud_run_service(guild_id, channel_id, region, project_id, servi
     if cursor.rowcount > 0:
         # If records were deleted, commit the changes and return a success message
         db.commit()
+        engine.poke()
         return jsonify({'message': 'Service unregistered'}), 200
     # If no records match the conditions, return an error message
     return jsonify({'message': 'Service not found'}), 404
 
 
+def parse_services(data) -> list | None:
+    """
+    Reads the services of a bulk request:
+    {"services": [{"region": ..., "project_id": ..., "service_name": ...}, ...]}
+
+    Args:
+        data: The JSON body of the request.
+
+    Returns:
+        list | None: The items of the request, None if the body has no list of services.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('services'), list):
+        return None
+    return data['services']
+
+
+def is_valid_service(service) -> bool:
+    """
+    Tells whether an item of a bulk request names a service.
+    """
+    return isinstance(service, dict) and all(
+        isinstance(service.get(field), str) and service[field]
+        for field in ('region', 'project_id', 'service_name'))
+
+
+def register_cloud_run_services(guild_id, channel_id, services: list):
+    """
+    Registers several Cloud Run services in one transaction. The monitoring
+    engine staggers the first polls of the new services.
+
+    Args:
+        guild_id (int): The ID of the guild.
+        channel_id (int): The ID of the channel.
+        services (list): The region, project_id and service_name of each service.
+
+    Returns:
+        tuple: A tuple containing the result of each service, in order, and the HTTP status code.
+    """
+    results = []
+    db = get_db()
+    with db:
+        cursor = db.cursor()
+        for service in services:
+            if not is_valid_service(service):
+                results.append({'service': service, 'status': 400, 'message': 'Invalid service'})
+                continue
+            # 主鍵已存在時不插入
+            cursor.execute('''
+      INSERT OR IGNORE INTO cloud_run_service (guild_id, channel_id, region, project_id, service_name)
+      VALUES (?, ?, ?, ?, ?)
+      ''', (guild_id, channel_id, service['region'], service['project_id'], service['service_name']))
+            if cursor.rowcount > 0:
+                results.append({'service': service, 'status': 201, 'message': 'Service registered'})
+            else:
+                results.append({'service': service, 'status': 400, 'message': 'Service already registered'})
+    db.close()
+    if any(result['status'] == 201 for result in results):
+        engine.poke()
+    return jsonify({'results': results}), 200
+
+
+def unregister_cloud_run_services(guild_id, channel_id, services: list):
+    """
+    Unregisters several Cloud Run services of a channel in one transaction.
+
+    Args:
+        guild_id (int): The ID of the guild.
+        channel_id (int): The ID of the channel.
+        services (list): The region, project_id and service_name of each service.
+
+    Returns:
+        tuple: A tuple containing the result of each service, in order, and the HTTP status code.
+    """
+    results = []
+    db = get_db()
+    with db:
+        cursor = db.cursor()
+        for service in services:
+            if not is_valid_service(service):
+                results.append({'service': service, 'status': 400, 'message': 'Invalid service'})
+                continue
+            cursor.execute('''
+      DELETE FROM cloud_run_service WHERE guild_id=? AND channel_id=? AND region=? AND project_id=? AND service_name=?
+      ''', (guild_id, channel_id, service['region'], service['project_id'], service['service_name']))
+            if cursor.rowcount > 0:
+                results.append({'service': service, 'status': 200, 'message': 'Service unregistered'})
+            else:
+                results.append({'service': service, 'status': 404, 'message': 'Service not found'})
+    db.close()
+    if any(result['status'] == 200 for result in results):
+        engine.poke()
+    return jsonify({'results': results}), 200
+
+
 def list_cloud_run_services(guild_id, channel_id):
     """
     Retrieve a list of cloud run services based on the guild ID and channel ID.
@@ -1,12 +1,18 @@
 """ dcbot websocket """
 
 import os
-import asyncio
+import json
+import time
+import uuid
+import itertools
 import threading
+from collections import deque, OrderedDict
 import websocket
-from websocket import WebSocketException
+from websocket import WebSocketException, ABNF
 import logging
 
+from flaskr.wire import Codec, capabilities
+
 # --- logger
 
 logger = logging.getLogger(__name__)
@@ -18,28 +24,160 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 DCBOT_SOCKET_URI = os.getenv('DCBOT_SOCKET_URI')
+# 待送訊息的上限，超過時丟棄最舊的訊息
+DCBOT_QUEUE_SIZE = int(os.getenv('DCBOT_QUEUE_SIZE', '1000'))
+# 重新連線的等待時間 (秒)，每次失敗加倍
+DCBOT_RECONNECT_MIN = 1
+DCBOT_RECONNECT_MAX = 60
+# 心跳間隔與等待 pong 的時間 (秒)
+DCBOT_PING_INTERVAL = 20
+DCBOT_PING_TIMEOUT = 10
+# 已送出但尚未收到 ack 的訊息上限
+DCBOT_WINDOW = 32
+# 超過此時間 (秒) 未收到 ack 的訊息重送
+DCBOT_ACK_TIMEOUT = 30
+# 每則訊息最多送出的次數
+DCBOT_MAX_ATTEMPTS = 5
+
+
+class Frame:
+    """
+    A message framed with its ID, waiting for the ack of the bot.
+
+    Attributes:
+        id (str): The ID of the message, echoed by the ack or nack.
+        payload (dict): The message with its ID, encoded when sent.
+        attempts (int): The number of times the message was sent.
+        sent_at (float): The monotonic time of the last send.
+    """
+
+    __slots__ = ('id', 'payload', 'attempts', 'sent_at')
+
+    def __init__(self, frame_id: str, payload: dict) -> None:
+        self.id = frame_id
+        self.payload = payload
+        self.attempts = 0
+        self.sent_at = 0.0
+
 
 class DCBotWebSocket:
     """
     A class representing a WebSocket connection to the DCBot server.
+
+    Messages are put in a bounded queue and sent by a background thread,
+    so `send` never blocks the polling. While the bot is unreachable the
+    messages stay queued, the connection is retried with exponential
+    backoff, and the oldest messages are dropped once the queue is full.
+
+    Every message carries an ID. The bot answers with an ack once the
+    message is delivered to Discord, or a nack with an error code. Up to
+    `DCBOT_WINDOW` messages are in flight at once; only the messages
+    nacked as retryable, or not acked within `DCBOT_ACK_TIMEOUT`
+    seconds, are sent again.
+
+    On connect, the monitor offers the encodings it supports (`wire.capabilities`)
+    and the bot answers with its choice; until then messages are plain JSON.
     """
 
     _ws = None
+    _codec = Codec()
+    _queue: deque = deque()
+    _inflight: OrderedDict = OrderedDict()
+    _cond = threading.Condition()
+    _connected = threading.Event()
+    _started = False
+    _ids = itertools.count()
+    # 每次啟動的 ID 前綴不同，bot 不會把重啟前後的訊息視為重複
+    _session = uuid.uuid4().hex[:8]
+    _stats = {'queued': 0, 'sent': 0, 'acked': 0, 'rejected': 0, 'retransmitted': 0,
+              'dropped': 0, 'failed': 0, 'reconnects': 0}
 
     @staticmethod
     def connect_dcbot():
         """
-        Connects to the DCBot server using WebSocket.
+        Starts the connection and the sender threads. Calling it again has no effect.
         """
+        with DCBotWebSocket._cond:
+            if DCBotWebSocket._started:
+                return
+            DCBotWebSocket._started = True
         print(f'connecting dcbot to {DCBOT_SOCKET_URI}', flush=True)
-        connected_event = asyncio.Event()
+        for target in (DCBotWebSocket._run_connection, DCBotWebSocket._run_sender):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def send(message: str):
+        """
+        Queues a message for the DCBot server and returns immediately.
+
+        Args:
+            message (str): The message to send, a JSON object.
+
+        Returns:
+            bool: True if the message was queued without dropping an older one, False otherwise.
+        """
+        logger.debug('queueing message to dcbot: %s', message)
+        try:
+            payload = json.loads(message)
+        except json.JSONDecodeError as e:
+            logger.error('message is not json: %s', e)
+            return False
+        frame_id = f'{DCBotWebSocket._session}-{next(DCBotWebSocket._ids)}'
+        frame = Frame(frame_id, {**payload, 'id': frame_id})
+        with DCBotWebSocket._cond:
+            dropped = len(DCBotWebSocket._queue) >= DCBOT_QUEUE_SIZE
+            if dropped:
+                DCBotWebSocket._queue.popleft()
+                DCBotWebSocket._stats['dropped'] += 1
+                logger.warning('dcbot queue full, oldest message dropped')
+            DCBotWebSocket._queue.append(frame)
+            DCBotWebSocket._stats['queued'] += 1
+            DCBotWebSocket._cond.notify()
+        return not dropped
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Returns the counters of the queue.
+
+        Returns:
+            dict: The numbers of queued, sent, acked, rejected, retransmitted,
+                dropped and failed messages, the number of reconnections, the
+                current queue length and in-flight count, and whether the bot is connected.
+        """
+        with DCBotWebSocket._cond:
+            return {**DCBotWebSocket._stats,
+                    'pending': len(DCBotWebSocket._queue),
+                    'inflight': len(DCBotWebSocket._inflight),
+                    'connected': DCBotWebSocket._connected.is_set()}
+
+    @staticmethod
+    def _run_connection():
+        """
+        Keeps a connection open, reconnecting with exponential backoff.
+
+        Dead connections are detected by the ping/pong heartbeat of `run_forever`.
+        """
+        delay = DCBOT_RECONNECT_MIN
 
         def on_open(ws):
+            nonlocal delay
             logger.debug('dcbot connected %s', ws)
-            connected_event.set()
+            delay = DCBOT_RECONNECT_MIN
+            # 協商編碼前先以 JSON 傳送
+            DCBotWebSocket._codec = Codec()
+            ws.send(json.dumps({'hello': capabilities()}))
+            # 前一個連線中未確認的訊息，在新連線上重送
+            DCBotWebSocket._requeue_inflight()
+            DCBotWebSocket._connected.set()
+            with DCBotWebSocket._cond:
+                DCBotWebSocket._cond.notify()
 
         def on_message(ws, message):
             logger.debug('dcbot message: %s', message)
+            DCBotWebSocket._handle_reply(message)
 
         def on_error(ws, error):
             logger.error('dcbot error: %s', error)
@@ -49,40 +187,171 @@ class DCBotWebSocket:
                 logger.error('dcbot closed: %s', close_msg)
 
             logger.debug('dcbot closed: %s', close_msg)
-            connected_event.clear()
-            DCBotWebSocket._ws = None
-
-        DCBotWebSocket._ws = websocket.WebSocketApp(
-            DCBOT_SOCKET_URI,
-            on_message = on_message,
-            on_error = on_error,
-            on_open = on_open,
-            on_close = on_close
-        )
-        wst = threading.Thread(target=DCBotWebSocket._ws.run_forever)
-        wst.daemon = True
-        wst.start()
+            DCBotWebSocket._connected.clear()
+
+        while True:
+            DCBotWebSocket._ws = websocket.WebSocketApp(
+                DCBOT_SOCKET_URI,
+                on_message = on_message,
+                on_error = on_error,
+                on_open = on_open,
+                on_close = on_close
+            )
+            try:
+                DCBotWebSocket._ws.run_forever(ping_interval=DCBOT_PING_INTERVAL,
+                                               ping_timeout=DCBOT_PING_TIMEOUT)
+            except Exception as e:
+                logger.error('dcbot connection failed: %s', e)
+            DCBotWebSocket._connected.clear()
+            logger.info('reconnecting dcbot in %d seconds', delay)
+            time.sleep(delay)
+            delay = min(delay * 2, DCBOT_RECONNECT_MAX)
+            DCBotWebSocket._stats['reconnects'] += 1
 
     @staticmethod
-    def send(message: str):
+    def _run_sender():
         """
-        Sends a message to the DCBot server.
+        Sends the queued messages in order while connected and the window has room,
+        and resends the messages whose ack timed out.
+        """
+        while True:
+            DCBotWebSocket._connected.wait()
+            DCBotWebSocket._requeue_expired()
+            if not DCBotWebSocket._send_next():
+                with DCBotWebSocket._cond:
+                    # 有 ack 或新訊息時被喚醒，逾時則檢查未確認的訊息
+                    DCBotWebSocket._cond.wait(1)
 
-        Args:
-            message (str): The message to send.
+    @staticmethod
+    def _next_frame() -> Frame | None:
+        """
+        Takes the oldest queued message that can be sent. An edit of a keyed
+        message is held while the message or an earlier edit of it is unacked,
+        so at most one of them is in flight: a resent message is never
+        overtaken by its edits, and a resent edit never overwrites a newer one.
+        Call with `_cond` held.
 
         Returns:
-            bool: True if the message was sent successfully, False otherwise.
+            Frame | None: The message, or None if every queued message is held.
         """
-        logger.debug('sending message to dcbot: %s', message)
+        unacked = {frame.payload['message_key'] for frame in DCBotWebSocket._inflight.values()
+                   if frame.payload.get('message_key')}
+        for i, frame in enumerate(DCBotWebSocket._queue):
+            if frame.payload.get('edit') and frame.payload.get('message_key') in unacked:
+                continue
+            del DCBotWebSocket._queue[i]
+            return frame
+        return None
+
+    @staticmethod
+    def _send_next() -> bool:
+        """
+        Sends the oldest queued message that is not held if the window has
+        room, keeping it queued if the send fails.
+
+        Returns:
+            bool: True if a message was sent, False otherwise.
+        """
+        with DCBotWebSocket._cond:
+            if not DCBotWebSocket._queue or len(DCBotWebSocket._inflight) >= DCBOT_WINDOW:
+                return False
+            frame = DCBotWebSocket._next_frame()
+            if frame is None:
+                return False
+            frame.attempts += 1
+            frame.sent_at = time.monotonic()
+            DCBotWebSocket._inflight[frame.id] = frame
         try:
-            DCBotWebSocket._ws.send(message)
-        except WebSocketException as e:
+            data = DCBotWebSocket._codec.encode(frame.payload)
+            DCBotWebSocket._ws.send(data, ABNF.OPCODE_BINARY if isinstance(data, bytes)
+                                    else ABNF.OPCODE_TEXT)
+        except (WebSocketException, OSError, AttributeError) as e:
+            # 保留訊息，等重新連線後再送
             logger.error('error: %s', e)
-            try:
-                DCBotWebSocket.connect_dcbot()
-                DCBotWebSocket._ws.send(message)
-            except WebSocketException as inner_e:
-                logger.error('error: %s', inner_e)
-                return False
+            with DCBotWebSocket._cond:
+                DCBotWebSocket._inflight.pop(frame.id, None)
+                frame.attempts -= 1
+                DCBotWebSocket._queue.appendleft(frame)
+                DCBotWebSocket._stats['failed'] += 1
+            DCBotWebSocket._connected.clear()
+            # 關閉連線，讓連線執行緒重新連線
+            if DCBotWebSocket._ws is not None:
+                DCBotWebSocket._ws.close()
+            return False
+        with DCBotWebSocket._cond:
+            DCBotWebSocket._stats['sent'] += 1
         return True
+
+    @staticmethod
+    def _handle_reply(message: str) -> None:
+        """
+        Consumes an ack or nack of the bot.
+
+        An ack, or a nack that is not retryable, completes the message.
+        A retryable nack sends the message again ahead of the queue,
+        up to `DCBOT_MAX_ATTEMPTS` times.
+
+        Args:
+            message (str): The reply, e.g. {"ack": "<id>"} or
+                {"nack": "<id>", "code": "forbidden", "retry": false}.
+        """
+        try:
+            reply = json.loads(message)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(reply, dict):
+            return
+        if isinstance(reply.get('welcome'), dict):
+            DCBotWebSocket._codec = Codec.from_welcome(reply['welcome'])
+            logger.info('dcbot encoding: %s, compression: %s',
+                        DCBotWebSocket._codec.encoding, DCBotWebSocket._codec.compression)
+            return
+        with DCBotWebSocket._cond:
+            if 'ack' in reply:
+                if DCBotWebSocket._inflight.pop(reply['ack'], None) is not None:
+                    DCBotWebSocket._stats['acked'] += 1
+            elif 'nack' in reply:
+                frame = DCBotWebSocket._inflight.pop(reply['nack'], None)
+                if frame is None:
+                    return
+                code = reply.get('code')
+                if reply.get('retry') and frame.attempts < DCBOT_MAX_ATTEMPTS:
+                    logger.warning('dcbot nack %s (%s), resending', frame.id, code)
+                    DCBotWebSocket._queue.appendleft(frame)
+                    DCBotWebSocket._stats['retransmitted'] += 1
+                else:
+                    logger.error('dcbot rejected %s (%s): %s', frame.id, code,
+                                 str(frame.payload.get('message'))[:200])
+                    DCBotWebSocket._stats['rejected'] += 1
+            else:
+                return
+            DCBotWebSocket._cond.notify()
+
+    @staticmethod
+    def _requeue_expired() -> None:
+        """
+        Puts the messages not acked within `DCBOT_ACK_TIMEOUT` seconds back ahead of the queue.
+        """
+        now = time.monotonic()
+        with DCBotWebSocket._cond:
+            expired = [frame for frame in DCBotWebSocket._inflight.values()
+                       if now - frame.sent_at >= DCBOT_ACK_TIMEOUT]
+            for frame in reversed(expired):
+                del DCBotWebSocket._inflight[frame.id]
+                if frame.attempts >= DCBOT_MAX_ATTEMPTS:
+                    logger.error('dcbot never acked %s', frame.id)
+                    DCBotWebSocket._stats['rejected'] += 1
+                    continue
+                DCBotWebSocket._queue.appendleft(frame)
+                DCBotWebSocket._stats['retransmitted'] += 1
+
+    @staticmethod
+    def _requeue_inflight() -> None:
+        """
+        Puts all the unacked messages back ahead of the queue, in their order.
+        """
+        with DCBotWebSocket._cond:
+            frames = list(DCBotWebSocket._inflight.values())
+            DCBotWebSocket._inflight.clear()
+            DCBotWebSocket._queue.extendleft(reversed(frames))
+            DCBotWebSocket._stats['retransmitted'] += len(frames)
@@ -0,0 +1,183 @@
+""" Online anomaly detection relative to each service's own baseline """
+
+import math
+import threading
+import logging
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# EWMA 平滑係數，越大越快適應新的數值
+EWMA_ALPHA = 0.1
+# 累積足夠的資料點後才開始判斷
+EWMA_MIN_SAMPLES = 10
+# 偏離基準值多少個標準差視為異常
+Z_SCORE_THRESHOLD = 3
+# 標準差的下限，避免數值長時間不變時，微小的變動就被視為異常
+MIN_STD = 1.0
+MIN_STD_RATIO = 0.1
+
+# 數值下降也視為異常的指標
+DETECT_DOWNWARD = {
+    'Request Count (2xx)',
+}
+
+
+class EwmaState:
+    """
+    Exponentially weighted mean and variance of one metric of one service.
+    """
+
+    __slots__ = ('mean', 'var', 'count')
+
+    def __init__(self) -> None:
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def std(self) -> float:
+        """
+        Returns the standard deviation, bounded below by `MIN_STD`
+        and by `MIN_STD_RATIO` of the mean.
+        """
+        return max(math.sqrt(self.var), MIN_STD, MIN_STD_RATIO * abs(self.mean))
+
+    def z_score(self, value: float) -> float | None:
+        """
+        Returns how many standard deviations the value is from the mean,
+        or None while the state is still warming up.
+        """
+        if self.count < EWMA_MIN_SAMPLES:
+            return None
+        return (value - self.mean) / self.std()
+
+    def update(self, value: float, alpha: float = EWMA_ALPHA) -> None:
+        """
+        Updates the mean and variance with a new value in O(1).
+        """
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+
+class ServiceState:
+    """
+    The detector state of one service: one `EwmaState` per metric
+    and the time of the last row that was fed in.
+    """
+
+    __slots__ = ('metrics', 'last_time')
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, EwmaState] = {}
+        self.last_time = None
+
+
+class AnomalyDetector:
+    """
+    Flags metrics deviating from each service's own baseline.
+
+    Every new row updates the state of each metric in O(1), so rows
+    already fed in are skipped and overlapping polling windows can be
+    passed as they are.
+    """
+
+    def __init__(self, threshold: float = Z_SCORE_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._services: dict[str, ServiceState] = {}
+
+    def update(self, service: str, times: list, metrics: list[dict]) -> dict[str, float]:
+        """
+        Feeds new rows of metrics into the state of a service.
+
+        Args:
+            service (str): The key of the service.
+            times (list): The time of each row, oldest first.
+            metrics (list[dict]): The metric rows, oldest first.
+
+        Returns:
+            dict[str, float]: The z-scores of the metrics of the newest row
+                deviating from the baseline, empty if there is no new row.
+        """
+        state = self._get_state(service)
+        deviations = {}
+        for time, metric in zip(times, metrics):
+            if state.last_time is not None and time <= state.last_time:
+                continue
+            state.last_time = time
+            deviations = {}
+            for key, value in metric.items():
+                if value is None or math.isnan(value):
+                    continue
+                ewma = state.metrics.get(key)
+                if ewma is None:
+                    ewma = state.metrics[key] = EwmaState()
+                z = ewma.z_score(value)
+                if z is not None and (
+                        z > self.threshold
+                        or (key in DETECT_DOWNWARD and z < -self.threshold)):
+                    deviations[key] = z
+                ewma.update(value)
+        if deviations:
+            logger.debug('deviations of %s: %s', service, deviations)
+        return deviations
+
+    def stats(self, service: str, key: str) -> tuple[float, float] | None:
+        """
+        Returns the baseline mean and standard deviation of a metric.
+
+        Args:
+            service (str): The key of the service.
+            key (str): The metric name.
+
+        Returns:
+            tuple[float, float] | None: The mean and standard deviation,
+                or None if the metric is still warming up.
+        """
+        ewma = self._get_state(service).metrics.get(key)
+        if ewma is None or ewma.count < EWMA_MIN_SAMPLES:
+            return None
+        return ewma.mean, ewma.std()
+
+    def forget(self, service: str) -> None:
+        """
+        Drops the state of a service.
+
+        Args:
+            service (str): The key of the service.
+        """
+        with self._lock:
+            self._services.pop(service, None)
+
+    def _get_state(self, service: str) -> ServiceState:
+        with self._lock:
+            state = self._services.get(service)
+            if state is None:
+                state = self._services[service] = ServiceState()
+            return state
+
+
+def deviation_rules(deviations: dict[str, float]) -> list[str]:
+    """
+    Describes the deviations found by the detector as fired rules.
+
+    Args:
+        deviations (dict[str, float]): The z-scores keyed by metric name.
+
+    Returns:
+        list[str]: The descriptions of the deviations.
+    """
+    return [f'{key} {">" if z > 0 else "<"} baseline' for key, z in deviations.items()]
@@ -0,0 +1,169 @@
+""" The monitoring engine: one poller per registered service, reconciled with the database """
+
+import os
+import threading
+import logging
+from typing import Callable
+
+from flaskr.db import get_db
+from flaskr.genAI.cloud import CloudRun
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 每個服務輪詢的間隔 (秒)
+POLL_INTERVAL = 30
+# 比對資料庫中已註冊服務的間隔 (秒)，API 程序註冊的服務最晚在此時間後開始輪詢
+ENGINE_RECONCILE_SECONDS = float(os.getenv('ENGINE_RECONCILE_SECONDS', '5'))
+
+
+def registered_services() -> dict[str, tuple[CloudRun, str]]:
+    """
+    Reads the registered services from the database.
+
+    Returns:
+        dict[str, tuple[CloudRun, str]]: The CloudRun instance and the channel ID
+            of each service, by full service name.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('''
+    SELECT region, project_id, service_name, channel_id FROM cloud_run_service
+    ''')
+    services = {}
+    for row in cursor.fetchall():
+        cr = CloudRun(row['region'], row['project_id'], row['service_name'])
+        services[cr.get_full_service_name()] = (cr, row['channel_id'])
+    db.close()
+    return services
+
+
+class Poller:
+    """
+    The polling of one service.
+
+    Attributes:
+        cr (CloudRun): The CloudRun instance.
+        channel_id (str): The ID of the channel the service reports to.
+        generation (int): Tells the timer chains of successive registrations apart.
+    """
+
+    def __init__(self, cr: CloudRun, channel_id: str, generation: int) -> None:
+        self.cr = cr
+        self.channel_id = channel_id
+        self.generation = generation
+
+
+class MonitoringEngine:
+    """
+    Polls every registered service every `poll_interval` seconds.
+
+    The database is the only link with the API: registering a service only
+    writes its row, and the engine starts or stops the pollers when it
+    reconciles with the table, every `interval` seconds. The engine can thus
+    run in its own process while any number of API workers serve requests.
+    When it runs in the API process, `poke` reconciles at once.
+    """
+
+    def __init__(self, poll: Callable[[CloudRun, str], None],
+                 interval: float = ENGINE_RECONCILE_SECONDS,
+                 poll_interval: float = POLL_INTERVAL,
+                 services: Callable[[], dict] = registered_services) -> None:
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self._poll = poll
+        self._services = services
+        self._lock = threading.Lock()
+        self._pollers: dict[str, Poller] = {}
+        self._generation = 0
+        self._started = False
+
+    def start(self) -> None:
+        """
+        Starts the pollers of the registered services and reconciles every `interval` seconds.
+        """
+        self._started = True
+        self._tick()
+
+    def poke(self) -> None:
+        """
+        Reconciles at once if the engine runs in this process, after a change of the registrations.
+        """
+        if self._started:
+            self.reconcile()
+
+    def running(self) -> list[str]:
+        """
+        Returns the full names of the services being polled.
+        """
+        with self._lock:
+            return list(self._pollers)
+
+    def reconcile(self) -> tuple[list[str], list[str]]:
+        """
+        Starts the pollers of the newly registered services and stops the
+        ones of the unregistered services. A service moved to another
+        channel keeps its poller and reports to the new channel.
+
+        The first polls of the services started together are staggered over
+        `poll_interval`, so registering a fleet does not poll it all at once.
+
+        Returns:
+            tuple[list[str], list[str]]: The started and the stopped services.
+        """
+        services = self._services()
+        started, stopped = [], []
+        with self._lock:
+            for key in list(self._pollers):
+                if key not in services:
+                    del self._pollers[key]
+                    stopped.append(key)
+            for key, (cr, channel_id) in services.items():
+                poller = self._pollers.get(key)
+                if poller is not None:
+                    poller.channel_id = channel_id
+                    continue
+                self._generation += 1
+                self._pollers[key] = Poller(cr, channel_id, self._generation)
+                started.append((key, self._generation))
+        for i, (key, generation) in enumerate(started):
+            # 同時加入的服務錯開第一次輪詢，平均分散在一個輪詢間隔內
+            timer = threading.Timer(self.poll_interval * i / len(started),
+                                    self._run, [key, generation])
+            timer.daemon = True
+            timer.start()
+        started = [key for key, _ in started]
+        if started or stopped:
+            logger.info('pollers started: %s, stopped: %s', started, stopped)
+        return started, stopped
+
+    def _tick(self) -> None:
+        timer = threading.Timer(self.interval, self._tick)
+        timer.daemon = True
+        timer.start()
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.error('cannot reconcile the pollers: %s', e)
+
+    def _run(self, key: str, generation: int) -> None:
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None or poller.generation != generation:
+                # 服務已取消註冊，或已重新註冊並由新的計時器輪詢
+                return
+            cr, channel_id = poller.cr, poller.channel_id
+        timer = threading.Timer(self.poll_interval, self._run, [key, generation])
+        timer.daemon = True
+        timer.start()
+        try:
+            self._poll(cr, channel_id)
+        except Exception as e:
+            logger.error('polling %s failed: %s', key, e)
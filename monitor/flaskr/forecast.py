@@ -0,0 +1,240 @@
+""" Seasonal forecasts of the utilization of each service, used to scale up ahead of peaks """
+
+import threading
+import logging
+from collections import deque
+
+import numpy as np
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 季節週期的資料筆數，指標每分鐘一筆，一天為 1440 筆
+FORECAST_SEASON = 1440
+# 往後預測的資料筆數 (分鐘)，需大於新版本上線所需的時間
+FORECAST_HORIZON = 10
+# Holt-Winters 的平滑係數 (level, trend, season)
+HOLT_WINTERS_ALPHA = 0.3
+HOLT_WINTERS_BETA = 0.01
+HOLT_WINTERS_GAMMA = 0.3
+
+# 預測值超過門檻時提前增加資源，門檻與 SCALING_RULES 增加資源的條件相同
+PRESCALE_THRESHOLDS = {
+    'Container CPU Utilization (%)': ('cpu', 50),
+    'Container Memory Utilization (%)': ('memory', 50),
+}
+
+
+class SeasonalForecaster:
+    """
+    Forecasts one metric of one service.
+
+    Once two seasons of values were fed in, an additive Holt-Winters model
+    is fitted and then updated in O(1) per value. Before that, the forecast
+    is the value one season earlier, shifted by how much the recent values
+    moved since then (same time yesterday).
+    """
+
+    def __init__(self, season: int = FORECAST_SEASON, alpha: float = HOLT_WINTERS_ALPHA,
+                 beta: float = HOLT_WINTERS_BETA, gamma: float = HOLT_WINTERS_GAMMA) -> None:
+        self.season = season
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.history = deque(maxlen=2 * season)
+        self.level = None
+        self.trend = 0.0
+        self.seasonals = None
+        self._t = 0
+
+    @property
+    def fitted(self) -> bool:
+        """
+        Whether the Holt-Winters model is fitted.
+        """
+        return self.level is not None
+
+    def update(self, value: float) -> None:
+        """
+        Feeds the next value in.
+
+        Args:
+            value (float): The value of the metric.
+        """
+        self.history.append(value)
+        if self.fitted:
+            self._step(value)
+        elif len(self.history) == 2 * self.season:
+            self._fit()
+
+    def forecast(self, horizon: int = FORECAST_HORIZON) -> np.ndarray | None:
+        """
+        Forecasts the next values.
+
+        Args:
+            horizon (int): The number of values to forecast.
+
+        Returns:
+            np.ndarray | None: The forecast values, or None if there is not enough history.
+        """
+        if self.fitted:
+            steps = np.arange(1, horizon + 1)
+            index = (self._t + steps - 1) % self.season
+            return self.level + steps * self.trend + self.seasonals[index]
+        return same_time_baseline(np.array(self.history), self.season, horizon)
+
+    def _fit(self) -> None:
+        """
+        Initializes the level, trend and seasonal components from the
+        first two seasons and replays the second season through the model.
+        """
+        values = np.array(self.history)
+        first, second = values[:self.season], values[self.season:]
+        self.level = first.mean()
+        self.trend = (second.mean() - first.mean()) / self.season
+        self.seasonals = first - self.level
+        self._t = self.season
+        for value in second:
+            self._step(value)
+
+    def _step(self, value: float) -> None:
+        i = self._t % self.season
+        seasonal = self.seasonals[i]
+        last_level = self.level
+        self.level = self.alpha * (value - seasonal) \
+            + (1 - self.alpha) * (self.level + self.trend)
+        self.trend = self.beta * (self.level - last_level) + (1 - self.beta) * self.trend
+        self.seasonals[i] = self.gamma * (value - self.level) + (1 - self.gamma) * seasonal
+        self._t += 1
+
+
+def same_time_baseline(values: np.ndarray, season: int, horizon: int) -> np.ndarray | None:
+    """
+    Forecasts the next values as the values one season earlier, shifted by the
+    difference between the latest values and the values one season before them.
+
+    Args:
+        values (np.ndarray): The history, oldest first.
+        season (int): The number of values in a season.
+        horizon (int): The number of values to forecast.
+
+    Returns:
+        np.ndarray | None: The forecast values, or None if the history is shorter
+            than a season and the horizon.
+    """
+    if horizon > season or len(values) < season + horizon:
+        return None
+    start = len(values) - season
+    shift = values[-horizon:].mean() - values[start - horizon:start].mean()
+    return values[start:start + horizon] + shift
+
+
+class ServiceForecast:
+    """
+    The forecasters of one service, one per metric, and the time
+    of the last row that was fed in.
+    """
+
+    __slots__ = ('metrics', 'last_time')
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, SeasonalForecaster] = {}
+        self.last_time = None
+
+
+class Forecaster:
+    """
+    Forecasts the metrics in `PRESCALE_THRESHOLDS` of every service.
+
+    Rows already fed in are skipped, so overlapping polling windows
+    can be passed as they are.
+    """
+
+    def __init__(self, season: int = FORECAST_SEASON,
+                 horizon: int = FORECAST_HORIZON) -> None:
+        self.season = season
+        self.horizon = horizon
+        self._lock = threading.Lock()
+        self._services: dict[str, ServiceForecast] = {}
+
+    def update(self, service: str, times: list, metrics: list[dict]) -> None:
+        """
+        Feeds new rows of metrics into the forecasters of a service.
+
+        Args:
+            service (str): The key of the service.
+            times (list): The time of each row, oldest first.
+            metrics (list[dict]): The metric rows, oldest first.
+        """
+        state = self._get_state(service)
+        for time, metric in zip(times, metrics):
+            if state.last_time is not None and time <= state.last_time:
+                continue
+            state.last_time = time
+            for key in PRESCALE_THRESHOLDS:
+                value = metric.get(key)
+                if value is None or np.isnan(value):
+                    continue
+                forecaster = state.metrics.get(key)
+                if forecaster is None:
+                    forecaster = state.metrics[key] = SeasonalForecaster(self.season)
+                forecaster.update(value)
+
+    def has_history(self, service: str) -> bool:
+        """
+        Checks whether any row of a service was fed in.
+
+        Args:
+            service (str): The key of the service.
+
+        Returns:
+            bool: True if the service has history, False otherwise.
+        """
+        return self._get_state(service).last_time is not None
+
+    def prescale_steps(self, service: str) -> tuple[int, int]:
+        """
+        Returns the steps to scale up ahead of a predicted peak: a metric below
+        its threshold now but predicted to cross it within the horizon.
+
+        Args:
+            service (str): The key of the service.
+
+        Returns:
+            tuple[int, int]: The CPU and memory steps, 1 to scale up and 0 to keep.
+        """
+        steps = {'cpu': 0, 'memory': 0}
+        for key, forecaster in self._get_state(service).metrics.items():
+            resource, threshold = PRESCALE_THRESHOLDS[key]
+            forecast = forecaster.forecast(self.horizon)
+            if forecast is None or forecaster.history[-1] > threshold:
+                continue
+            if forecast.max() > threshold:
+                logger.debug('%s of %s predicted to reach %.1f',
+                             key, service, forecast.max())
+                steps[resource] = 1
+        return steps['cpu'], steps['memory']
+
+    def forget(self, service: str) -> None:
+        """
+        Drops the forecasters of a service.
+
+        Args:
+            service (str): The key of the service.
+        """
+        with self._lock:
+            self._services.pop(service, None)
+
+    def _get_state(self, service: str) -> ServiceForecast:
+        with self._lock:
+            state = self._services.get(service)
+            if state is None:
+                state = self._services[service] = ServiceForecast()
+            return state
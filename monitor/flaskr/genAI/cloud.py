@@ -1,16 +1,33 @@
 """ Cloud Run Performance Monitor and Resource Manager """
 
+import time
+import threading
+import logging
 from abc import abstractmethod, ABC
 from datetime import datetime, timedelta
-from typing import Tuple
+from typing import Tuple, Iterator
 import pandas as pd
 from google.cloud import run_v2
 from google.cloud import monitoring_v3, logging_v2
+from google.cloud.logging_v2.services.logging_service_v2 import LoggingServiceV2Client
 from google.cloud.monitoring_v3.query import Query
+from google.api_core.operation import Operation
+from google.api_core.exceptions import Conflict
+from google.logging.type import log_severity_pb2
 
 import dotenv
 dotenv.load_dotenv()
 
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
 # Time Range interface
 class TimeRange(ABC):
     """
@@ -151,7 +168,8 @@ class CloudRunResource:
         try:
             self.value = self.value * 2
             self.parent.update_resouce()
-        except Exception:
+        except Exception as e:
+            logger.error('cannot scale up resource: %s', e)
             self.value = origin
 
     def scale_down(self):
@@ -164,10 +182,144 @@ class CloudRunResource:
         try:
             self.value = self.value // 2
             self.parent.update_resouce()
-        except Exception:
+        except Exception as e:
+            logger.error('cannot scale down resource: %s', e)
             self.value = origin
 
 
+# Cloud Run 可設定的 CPU (vCPU) 與 Memory (MiB)，每次調整只移動一格
+CPU_GRID = [1, 2, 4, 6, 8]
+MEMORY_GRID = [512, 1024, 2048, 4096, 8192, 16384, 24576]
+
+
+def step_on_grid(value: int, grid: list[int], step: int) -> int:
+    """
+    Moves a value to the next grid value above or below it.
+
+    Args:
+        value (int): The current value, which may be off the grid.
+        grid (list[int]): The valid values, in ascending order.
+        step (int): Positive to move up, negative to move down, 0 to keep the value.
+
+    Returns:
+        int: The new value, or the current value if there is no grid value in that direction.
+    """
+    if step > 0:
+        return next((v for v in grid if v > value), value)
+    if step < 0:
+        return next((v for v in reversed(grid) if v < value), value)
+    return value
+
+
+def parse_resource_value(value: str) -> int | Exception:
+    """
+    Parses a resource limit such as '2000m', '2' or '512Mi' to vCPU or MiB.
+
+    Args:
+        value (str): The resource limit.
+
+    Returns:
+        int: The CPU in vCPU or the memory in MiB.
+
+    Raises:
+        Exception: If the value is invalid.
+    """
+    if value[-1] == 'm':
+        return int(value[:-1]) // 1000
+    if value[-2:] == 'Gi':
+        return int(value[:-2]) * 1024
+    if value[-2:] == 'Mi':
+        return int(value[:-2])
+    if value.isdigit():
+        return int(value)
+    raise Exception('Invalid value')
+
+
+# 快取的服務設定超過此時間 (秒) 才重新讀取
+SPEC_CACHE_TTL = 300
+
+
+class ServiceSpecCache:
+    """
+    The last fetched `run_v2.Service` of every service, keyed by its full name.
+
+    The cached spec carries the etag of the service, so that updates are sent
+    against it and rejected by Cloud Run if the service changed meanwhile.
+    """
+
+    def __init__(self, ttl: float = SPEC_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._specs: dict[str, tuple[float, run_v2.Service]] = {}
+        self._client = None
+
+    def get(self, name: str, client: run_v2.ServicesClient = None) -> run_v2.Service:
+        """
+        Returns the spec of a service, fetching it if it is missing or expired.
+
+        Args:
+            name (str): The full name of the service.
+            client (run_v2.ServicesClient, optional): The client used to fetch the service.
+                Defaults to a client shared by the cache.
+
+        Returns:
+            run_v2.Service: The spec of the service.
+        """
+        with self._lock:
+            cached = self._specs.get(name)
+            if client is None:
+                if self._client is None:
+                    self._client = run_v2.ServicesClient()
+                client = self._client
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        service = client.get_service(name=name)
+        with self._lock:
+            self._specs[name] = (time.monotonic(), service)
+        return service
+
+    def peek(self, name: str) -> run_v2.Service | None:
+        """
+        Returns the cached spec of a service without any API call,
+        even if it is expired.
+
+        Args:
+            name (str): The full name of the service.
+
+        Returns:
+            run_v2.Service | None: The cached spec, or None if the service was never fetched.
+        """
+        with self._lock:
+            cached = self._specs.get(name)
+        return cached[1] if cached is not None else None
+
+    def expire(self, name: str, service: run_v2.Service) -> None:
+        """
+        Stores a spec that `peek` returns but `get` does not trust, e.g. the
+        spec just sent in an update: its limits are current but its etag is
+        stale, so the next `get` fetches the service again.
+
+        Args:
+            name (str): The full name of the service.
+            service (run_v2.Service): The spec.
+        """
+        with self._lock:
+            self._specs[name] = (float('-inf'), service)
+
+    def invalidate(self, name: str) -> None:
+        """
+        Drops the cached spec of a service, so that the next `get` fetches it.
+
+        Args:
+            name (str): The full name of the service.
+        """
+        with self._lock:
+            self._specs.pop(name, None)
+
+
+service_specs = ServiceSpecCache()
+
+
 class CloudRunResourceManager:
     """
     A class that manages the resource constraints of a Cloud Run service.
@@ -180,6 +332,8 @@ class CloudRunResourceManager:
 
     Methods:
         init_resource(): Initializes the resource values for CPU and memory.
+        plan(cpu, memory): Computes the CPU and memory values after scaling.
+        apply_plan(cpu, memory): Scales CPU and memory with a single service update.
         update_resouce(): Updates the resource constraints of the service.
         get_resource() -> Dict[str, str]: Retrieves the resource limits for 
             the first container in the service template.
@@ -210,6 +364,78 @@ class CloudRunResourceManager:
             self.cpu.value = self._parse_resource_value_to_int(resource['cpu'])
             self.memory.value = self._parse_resource_value_to_int(
                 resource['memory'])
+            self.is_init_resource = True
+
+    def plan(self, cpu: int = 0, memory: int = 0) -> Tuple[int, int]:
+        """
+        Computes the CPU and memory values after scaling.
+
+        A step moves the value to the neighbouring value of `CPU_GRID` or
+        `MEMORY_GRID`. A step that would leave the valid range is dropped,
+        and the result is adjusted to the CPU/memory constraints of Cloud Run.
+
+        Args:
+            cpu (int): The CPU step.
+            memory (int): The memory step.
+
+        Returns:
+            Tuple[int, int]: The planned CPU and memory values.
+        """
+        self.init_resource()
+        target_cpu = step_on_grid(self.cpu.value, CPU_GRID, cpu)
+        target_memory = step_on_grid(self.memory.value, MEMORY_GRID, memory)
+
+        if not self._check_resourse_constraints(target_cpu, self.memory.value):
+            target_cpu = self.cpu.value
+        if not self._check_resourse_constraints(self.cpu.value, target_memory):
+            target_memory = self.memory.value
+        return self._auto_update_resource_constraints(target_cpu, target_memory)
+
+    def apply_plan(self, cpu: int = 0, memory: int = 0) -> Operation | None:
+        """
+        Scales CPU and memory together, with a single update of the service
+        and therefore a single new revision.
+
+        Args:
+            cpu (int): The CPU step, positive to scale up and negative to scale down.
+            memory (int): The memory step, positive to scale up and negative to scale down.
+
+        If the service was changed by someone else since its spec was read,
+        its current limits are read again and the step is planned once more
+        from them, instead of overwriting the change with the stale targets.
+
+        Returns:
+            Operation | None: The long-running operation of the update, or None
+                if there was nothing to change or the update failed.
+        """
+        return self._apply_plan(cpu, memory, replan=True)
+
+    def _apply_plan(self, cpu: int, memory: int, replan: bool) -> Operation | None:
+        try:
+            target_cpu, target_memory = self.plan(cpu, memory)
+        except Exception as e:
+            logger.error('cannot plan scaling of %s: %s',
+                         self.cloud_run_info.service_name, e)
+            return None
+        if (target_cpu, target_memory) == (self.cpu.value, self.memory.value):
+            return None
+
+        origin = self.cpu.value, self.memory.value
+        self.cpu.value, self.memory.value = target_cpu, target_memory
+        try:
+            return self.update_resouce()
+        except Conflict as e:
+            self.cpu.value, self.memory.value = origin
+            if not replan:
+                logger.error('cannot scale %s: %s', self.cloud_run_info.service_name, e)
+                return None
+            logger.warning('%s changed meanwhile, planning again', self.cloud_run_info.service_name)
+            self.is_init_resource = False
+            return self._apply_plan(cpu, memory, replan=False)
+        except Exception as e:
+            logger.error('cannot scale %s: %s', self.cloud_run_info.service_name, e)
+            self.cpu.value, self.memory.value = origin
+            return None
 
     def _parse_resource_value_to_int(self, value: str) -> int | Exception:
         """
@@ -224,14 +450,7 @@ class CloudRunResourceManager:
         Raises:
             Exception: If the value is invalid.
         """
-        print(value)
-        if value[-1] == 'm':
-            return int(value[:-1]) // 1000
-        if value[-2:] == 'Gi':
-            return int(value[:-2]) * 1024
-        if value[-2:] == 'Mi':
-            return int(value[:-2])
-        raise Exception('Invalid value')
+        return parse_resource_value(value)
 
     def _parse_resource_value_to_str(self, value: int) -> str:
         """
@@ -290,9 +509,14 @@ class CloudRunResourceManager:
 
         return cpu, memory
 
-    def update_resouce(self) -> None | Exception:
+    def update_resouce(self) -> Operation | Exception:
         '''
         Update the resource constraints of the service.
+        Returns the long-running operation without waiting for the new revision.
+
+        Raises:
+          Conflict: If the service changed since its spec was cached; the
+            cached spec is dropped so the caller can re-read it and plan again.
 
         Args:
           cpu (str): The CPU limit for the service.
@@ -303,36 +527,142 @@ class CloudRunResourceManager:
         if self._check_resourse_constraints(cpu, memory):
             cpu, memory = self._auto_update_resource_constraints(cpu, memory)
             full_service_name = self.cloud_run_info.get_full_service_name()
-            service = self.client.get_service(name=full_service_name)
-
-            request = run_v2.UpdateServiceRequest(
-                service=service,
-            )
-
-            request.service.template.containers[0].resources.limits = {
-                'cpu': self._parse_resource_value_to_str(cpu),
-                'memory': self._parse_resource_value_to_str(memory),
-            }
-
-            self.client.update_service(request=request)
+            try:
+                operation, service = self._update_service(cpu, memory)
+            except Conflict:
+                # 服務在快取之後被修改過 (etag 不符)，目標值是依舊設定計算的，不可直接重送
+                service_specs.invalidate(full_service_name)
+                raise
+            # 更新後 etag 會改變，下次使用前重新讀取；保留新的上限供預算計算使用
+            service_specs.expire(full_service_name, service)
+            return operation
         else:
             raise Exception('Invalid resource constraints')
 
+    def _update_service(self, cpu: int, memory: int) -> tuple[Operation, run_v2.Service]:
+        """
+        Sends an update of the resource limits against the cached spec and its etag.
+        Returns the operation and the spec sent.
+        """
+        # 複製一份，避免修改到快取中的設定
+        service = run_v2.Service(service_specs.get(
+            self.cloud_run_info.get_full_service_name(), self.client))
+        service.template.containers[0].resources.limits = {
+            'cpu': self._parse_resource_value_to_str(cpu),
+            'memory': self._parse_resource_value_to_str(memory),
+        }
+        request = run_v2.UpdateServiceRequest(
+            service=service,
+        )
+        return self.client.update_service(request=request), service
+
     def get_resource(self) -> dict[str, str]:
         '''
         Retrieves the resource limits for the first container in the service template.
+        The service spec is read from `service_specs`, so it costs no API call
+        until the cached spec expires.
 
         Returns:
           Dict[str, str]: The resource limits for the container.
         '''
 
-        full_service_name = self.cloud_run_info.get_full_service_name()
-        service = self.client.get_service(name=full_service_name)
-
+        service = service_specs.get(self.cloud_run_info.get_full_service_name(), self.client)
         resource = service.template.containers[0].resources.limits
         return resource
 
 
+# 讀取 log 的分頁大小與上限
+LOG_PAGE_SIZE = 100
+LOG_MAX_ENTRIES = 1000
+# 收集到這麼多不同的錯誤訊息後就停止讀取
+LOG_MAX_DISTINCT_MESSAGES = 20
+# 每則訊息最多保留的字數
+LOG_MESSAGE_MAX_CHARS = 500
+LOG_FIELD_MASK = ('entries(timestamp,insertId,severity,textPayload,jsonPayload,resource),'
+                  'nextPageToken')
+
+
+def _log_message(entry) -> str:
+    """
+    Returns the message of a log entry, truncated to `LOG_MESSAGE_MAX_CHARS`.
+    """
+    if entry.text_payload:
+        message = entry.text_payload
+    elif entry.json_payload:
+        payload = dict(entry.json_payload)
+        message = str(payload.get('message', payload))
+    else:
+        message = ''
+    return message[:LOG_MESSAGE_MAX_CHARS]
+
+
+def log_filter(services: list[tuple[str, str]], start: str, end: str) -> str:
+    """
+    Builds the filter of the error logs of some services of a project.
+
+    Args:
+        services (list[tuple[str, str]]): The region and name of each service.
+        start (str): The start time in ISO format (UTC).
+        end (str): The end time in ISO format (UTC).
+
+    Returns:
+        str: The Cloud Logging filter.
+    """
+    services = ' OR '.join(
+        f'(resource.labels.service_name="{name}" AND resource.labels.location="{region}")'
+        for region, name in services)
+    return f'''
+resource.type="cloud_run_revision"
+({services})
+timestamp>="{start}Z"
+timestamp<="{end}Z"
+ERROR
+severity!="ERROR"
+'''
+
+
+def list_log_entries(client: LoggingServiceV2Client, project_id: str, filter_str: str,
+                     page_size: int = LOG_PAGE_SIZE,
+                     max_entries: int = LOG_MAX_ENTRIES) -> Iterator[dict]:
+    """
+    Streams the log entries of a project matching a filter, newest first.
+
+    Pages of `page_size` entries are fetched lazily, with only the fields in
+    `LOG_FIELD_MASK`, and at most `max_entries` are read.
+
+    Args:
+        client (LoggingServiceV2Client): The Cloud Logging client.
+        project_id (str): The project ID.
+        filter_str (str): The filter of the entries.
+        page_size (int): The number of entries per page.
+        max_entries (int): The maximum number of entries to read.
+
+    Yields:
+        dict: The timestamp, severity, message, insert ID, service name and region of an entry.
+    """
+    request = logging_v2.types.ListLogEntriesRequest(
+        resource_names=[f'projects/{project_id}'],
+        filter=filter_str,
+        order_by='timestamp desc',
+        page_size=page_size,
+    )
+    # 只取需要的欄位，減少傳輸量
+    pager = client.list_log_entries(
+        request=request, metadata=[('x-goog-fieldmask', LOG_FIELD_MASK)])
+
+    for count, entry in enumerate(pager):
+        if count >= max_entries:
+            break
+        yield {
+            'timestamp': entry.timestamp.isoformat() if entry.timestamp else None,
+            'severity': log_severity_pb2.LogSeverity.Name(entry.severity),
+            'message': _log_message(entry),
+            'insert_id': entry.insert_id,
+            'service_name': entry.resource.labels.get('service_name'),
+            'region': entry.resource.labels.get('location'),
+        }
+
+
 class CloudRunPerformanceMonitor:
     """
     A class that monitors the performance of a Cloud Run service.
@@ -342,7 +672,7 @@ class CloudRunPerformanceMonitor:
             about the Cloud Run service.
         monitoring_client (monitoring_v3.MetricServiceClient): The client for 
             interacting with the Cloud Monitoring API.
-        logging_client (logging_v2.Client): The client for interacting with the Cloud Logging API.
+        logging_client (LoggingServiceV2Client): The client for interacting with the Cloud Logging API.
         scalar_type (list[str]): A list of scalar metric types.
         distribution_type (list[str]): A list of distribution metric types.
 
@@ -353,15 +683,15 @@ class CloudRunPerformanceMonitor:
             with alignment and reduction applied.
         get_metric(self, metric_type, time_range, options): Retrieves the metric 
             from the Cloud Monitoring API.
-        get_logs(self, time_range): Retrieves the logs from the Cloud Logging API.
+        iter_logs(self, time_range): Streams the error logs from the Cloud Logging API.
+        get_logs(self, time_range): Retrieves the distinct error messages from the Cloud Logging API.
     """
 
     def __init__(self, cloud_run_info: CloudRun) -> None:
         self.cloud_run_info = cloud_run_info
         self.monitoring_client = monitoring_v3.MetricServiceClient()
 
-        self.logging_client = logging_v2.Client(
-            project=cloud_run_info.project_id)
+        self.logging_client = LoggingServiceV2Client()
 
         self.scalar_type = [
             'run.googleapis.com/request_count',
@@ -493,35 +823,60 @@ class CloudRunPerformanceMonitor:
         df = query.as_dataframe()
         return self._process_pd_dataframe(df, options)
 
-    def get_logs(self, time_range: TimeRange):
+    def iter_logs(self, time_range: TimeRange, page_size: int = LOG_PAGE_SIZE,
+                  max_entries: int = LOG_MAX_ENTRIES) -> Iterator[dict]:
         '''
-        Retrieves the logs from the Cloud Logging API.
+        Streams the error logs of the service from the Cloud Logging API, newest first.
+
+        Pages of `page_size` entries are fetched lazily, with only the timestamp,
+        severity and payload of every entry, and at most `max_entries` are read.
 
         Args:
           time_range (TimeRange): The time range to be retrieved.
+          page_size (int): The number of entries per page.
+          max_entries (int): The maximum number of entries to read.
 
-        Returns:
-          The logs.
+        Yields:
+          dict: The timestamp, severity, message and insert ID of an entry.
         '''
 
         start, end = time_range.get_time_range_iso()
-        print(start, end)
-
-        filter_str = f'''
-resource.type="cloud_run_revision"
-resource.labels.service_name="{self.cloud_run_info.service_name}"
-timestamp>="{start}Z"
-timestamp<="{end}Z"
-ERROR
-severity!="ERROR"
-'''
+        logger.debug('list logs of %s: %s - %s', self.cloud_run_info.service_name, start, end)
+        for entry in list_log_entries(self.logging_client, self.cloud_run_info.project_id,
+                                      log_filter([(self.cloud_run_info.region,
+                                                   self.cloud_run_info.service_name)], start, end),
+                                      page_size, max_entries):
+            del entry['service_name'], entry['region']
+            yield entry
+
+    def get_logs(self, time_range: TimeRange, page_size: int = LOG_PAGE_SIZE,
+                 max_entries: int = LOG_MAX_ENTRIES,
+                 max_distinct: int = LOG_MAX_DISTINCT_MESSAGES) -> list[dict]:
+        '''
+        Retrieves the distinct error messages of the service from the Cloud Logging API.
 
-        print(filter_str)
+        Reading stops as soon as `max_distinct` distinct messages were collected
+        or `max_entries` entries were read, so an error storm costs a bounded
+        number of pages.
 
-        entries = self.logging_client.list_entries(filter_=filter_str)
+        Args:
+          time_range (TimeRange): The time range to be retrieved.
+          page_size (int): The number of entries per page.
+          max_entries (int): The maximum number of entries to read.
+          max_distinct (int): The number of distinct messages to collect.
 
-        logs = []
-        for entry in entries:
-            logs.append(entry.payload)
+        Returns:
+          list[dict]: The distinct messages, newest first, with the timestamp and
+            severity of their latest entry and how many entries were read for them.
+        '''
 
-        return logs
+        logs: dict[str, dict] = {}
+        for entry in self.iter_logs(time_range, page_size, max_entries):
+            log = logs.get(entry['message'])
+            if log is not None:
+                log['count'] += 1
+                continue
+            if len(logs) >= max_distinct:
+                break
+            logs[entry['message']] = {**entry, 'count': 1}
+        return list(logs.values())
@@ -1,8 +1,10 @@
 """ Language Model Manager """
 
 import time
+import textwrap
 import vertexai
 from vertexai.preview.language_models import TextGenerationModel
+from flaskr.rules import ABNORMAL_RULES
 
 vertexai.init(
     project='tsmccareerhack2024-icsd-grp3',
@@ -49,11 +51,7 @@ class LLMSingleton:
         Returns:
             str: The generated text.
         """
-        combined_prompt = f"""
-        {data}
-        ---
-        {self.prompt}
-        """
+        combined_prompt = self._combine_prompt(data)
         try:
             response = self.model.predict(
                 combined_prompt,
@@ -68,6 +66,50 @@ class LLMSingleton:
 
         return response.text
 
+    def gen_stream(self, data: str):
+        """
+        Generates text based on the given data and the prompt,
+        yielding the text chunk by chunk as the model produces it.
+
+        If the streaming call fails before any chunk has been produced,
+        it falls back to the blocking `gen` and yields the whole text at once.
+
+        Args:
+            data (str): The data to be used for text generation.
+
+        Yields:
+            str: The next chunk of generated text.
+        """
+        combined_prompt = self._combine_prompt(data)
+        produced = False
+        try:
+            for response in self.model.predict_streaming(
+                combined_prompt,
+                **self.parameters,
+            ):
+                produced = True
+                yield response.text
+        except Exception:
+            if produced:
+                raise
+            yield self.gen(data)
+
+    def _combine_prompt(self, data: str) -> str:
+        """
+        Combines the given data and the prompt into the text sent to the model.
+
+        Args:
+            data (str): The data to be used for text generation.
+
+        Returns:
+            str: The combined prompt.
+        """
+        return f"""
+        {data}
+        ---
+        {self.prompt}
+        """
+
     def set_prompt(self, prompt: str):
         """
         Sets a new prompt for text generation.
@@ -136,7 +178,7 @@ class LLM:
     Large Language Model (LLM) for generating text.
     """
     AnalysisError = llm_task('analysis error',
-                             """
+                             f"""
 背景：目前在 Google Cloud Run 上運行的一款應用服務，本應能穩定處理客戶請求並維持優異性能。然而，最近發現一些指標異常，需要進行分析和處理。
 
 角色：你是一位專門監控此應用服務的 AI 助理。
@@ -147,12 +189,7 @@ class LLM:
 
 數據分析任務：
 1. 分析數據，以下為判斷異常指標的方法，請依據此資料判斷各個指標是否為異常指標：
-   - Container Startup Latency (ms)
-   - Instance Count (active) > 2
-   - Request Count (4xx) > 5
-   - Request Count (5xx) > 5
-   - Container CPU Utilization (%) > 60
-   - Container Memory Utilization (%) > 60
+{textwrap.indent(ABNORMAL_RULES.describe(), '   ')}
 2. 在問題描述中，對問題提出具體描述，並用列點的形式呈現，並在問題描述的最後進行問題的總結。
 
 任務輸出格式：
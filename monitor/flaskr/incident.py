@@ -0,0 +1,218 @@
+""" Incidents grouping the alerts of each (service, rule) """
+
+import os
+import json
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from flaskr.db import get_db
+from flaskr.genAI.cloud import CloudRun
+from flaskr.dcbot_websocket import DCBotWebSocket
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 規則持續未觸發多久後，事件視為已解決
+RESOLVE_AFTER = timedelta(minutes=5)
+# 事件解決後在此時間內再次觸發，視為同一事件 (flapping)，不再重新告警
+REOPEN_WINDOW = timedelta(minutes=30)
+# 定期摘要的間隔 (分鐘)，0 表示不送出摘要
+INCIDENT_DIGEST_MINUTES = int(os.getenv('INCIDENT_DIGEST_MINUTES', '0'))
+
+OPEN = 'open'
+RESOLVED = 'resolved'
+
+
+class IncidentChanges:
+    """
+    How the incidents of a service changed after one polling cycle.
+
+    Attributes:
+        opened (list[str]): The rules of newly opened incidents, which deserve an alert.
+        updated (list[str]): The rules of incidents that were already open or flapped back.
+        resolved (list[str]): The rules of incidents resolved in this cycle.
+    """
+
+    def __init__(self) -> None:
+        self.opened = []
+        self.updated = []
+        self.resolved = []
+
+
+def update_incidents(cr: CloudRun, channel_id, fired_rules: list[str],
+                     now: datetime = None) -> IncidentChanges:
+    """
+    Opens, updates and resolves the incidents of a service in one transaction.
+
+    A fired rule updates the open incident of the same (service, rule), or
+    reopens the incident resolved within `REOPEN_WINDOW`, before a new incident
+    is opened. Open incidents whose rule has not fired for `RESOLVE_AFTER`
+    are resolved.
+
+    Args:
+        cr (CloudRun): The CloudRun instance.
+        channel_id (str): The ID of the channel the service reports to.
+        fired_rules (list[str]): The descriptions of the rules fired in this cycle.
+        now (datetime, optional): The time of the cycle. Defaults to now.
+
+    Returns:
+        IncidentChanges: The rules of the opened, updated and resolved incidents.
+    """
+    if now is None:
+        now = datetime.now()
+    changes = IncidentChanges()
+    service = (cr.region, cr.project_id, cr.service_name)
+    db = get_db()
+    cursor = db.cursor()
+
+    cursor.execute('''
+    SELECT id, rule, updated_at FROM incident
+    WHERE region=? AND project_id=? AND service_name=? AND status=?
+    ''', (*service, OPEN))
+    open_incidents = {row['rule']: row for row in cursor.fetchall()}
+
+    for rule in fired_rules:
+        incident = open_incidents.get(rule)
+        if incident is not None:
+            cursor.execute('''
+            UPDATE incident SET updated_at=?, hit_count=hit_count+1 WHERE id=?
+            ''', (now.isoformat(), incident['id']))
+            changes.updated.append(rule)
+            continue
+
+        cursor.execute('''
+        SELECT id FROM incident
+        WHERE region=? AND project_id=? AND service_name=? AND rule=? AND status=?
+          AND resolved_at>=?
+        ORDER BY resolved_at DESC LIMIT 1
+        ''', (*service, rule, RESOLVED, (now - REOPEN_WINDOW).isoformat()))
+        flapped = cursor.fetchone()
+        if flapped is not None:
+            cursor.execute('''
+            UPDATE incident SET status=?, updated_at=?, resolved_at=NULL,
+              hit_count=hit_count+1, flap_count=flap_count+1
+            WHERE id=?
+            ''', (OPEN, now.isoformat(), flapped['id']))
+            changes.updated.append(rule)
+            continue
+
+        cursor.execute('''
+        INSERT INTO incident (region, project_id, service_name, rule, channel_id,
+          status, opened_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (*service, rule, channel_id, OPEN, now.isoformat(), now.isoformat()))
+        changes.opened.append(rule)
+
+    for rule, incident in open_incidents.items():
+        if rule in fired_rules:
+            continue
+        if now - datetime.fromisoformat(incident['updated_at']) >= RESOLVE_AFTER:
+            cursor.execute('''
+            UPDATE incident SET status=?, resolved_at=? WHERE id=?
+            ''', (RESOLVED, now.isoformat(), incident['id']))
+            changes.resolved.append(rule)
+
+    db.commit()
+    db.close()
+    if changes.opened or changes.resolved:
+        logger.debug('incidents of %s: opened=%s resolved=%s',
+                     cr.service_name, changes.opened, changes.resolved)
+    return changes
+
+
+def list_incidents(channel_id, since: datetime) -> list[dict]:
+    """
+    Lists the incidents of a channel that are open or were updated since a given time.
+
+    Args:
+        channel_id (str): The ID of the channel.
+        since (datetime): The start of the period.
+
+    Returns:
+        list[dict]: The incidents, grouped by service.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('''
+    SELECT * FROM incident
+    WHERE channel_id=? AND (status=? OR updated_at>=? OR resolved_at>=?)
+    ORDER BY region, project_id, service_name, opened_at
+    ''', (channel_id, OPEN, since.isoformat(), since.isoformat()))
+    incidents = [dict(row) for row in cursor.fetchall()]
+    db.close()
+    return incidents
+
+
+def format_digest(incidents: list[dict]) -> str:
+    """
+    Formats the incidents of a channel as a digest message.
+
+    Args:
+        incidents (list[dict]): The incidents, grouped by service.
+
+    Returns:
+        str: The digest in markdown.
+    """
+    message = '**事件摘要**\n'
+    service = None
+    for incident in incidents:
+        if service != incident['service_name']:
+            service = incident['service_name']
+            message += f'- service name: **{service}** ({incident["project_id"]}, {incident["region"]})\n'
+        status = '持續中' if incident['status'] == OPEN else '已解決'
+        message += f'  - {incident["rule"]}: {status}，觸發 {incident["hit_count"]} 次'
+        if incident['flap_count']:
+            message += f'，反覆 {incident["flap_count"]} 次'
+        message += f'，開始於 {incident["opened_at"][:19]}\n'
+    return message
+
+
+def send_digests(since: datetime) -> None:
+    """
+    Sends a digest of the incidents since a given time to every channel that has some.
+
+    Args:
+        since (datetime): The start of the period.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('''
+    SELECT DISTINCT channel_id FROM cloud_run_service
+    ''')
+    channel_ids = [row['channel_id'] for row in cursor.fetchall()]
+    db.close()
+
+    for channel_id in channel_ids:
+        incidents = list_incidents(channel_id, since)
+        if not incidents:
+            continue
+        DCBotWebSocket.send(json.dumps({
+            'channel_id': channel_id,
+            'message': format_digest(incidents)
+        }))
+
+
+def run_digest_timer(since: datetime = None) -> None:
+    """
+    Periodically sends incident digests, every `INCIDENT_DIGEST_MINUTES` minutes.
+    Does nothing if `INCIDENT_DIGEST_MINUTES` is 0.
+
+    Args:
+        since (datetime, optional): The start of the first period. Defaults to now.
+    """
+    if INCIDENT_DIGEST_MINUTES <= 0:
+        return
+    now = datetime.now()
+    if since is not None:
+        send_digests(since)
+    timer = threading.Timer(INCIDENT_DIGEST_MINUTES * 60, run_digest_timer, [now])
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,214 @@
+""" Batched log queries: one Cloud Logging query per project for the services alarming together """
+
+import time
+import threading
+import logging
+from datetime import datetime
+
+from flaskr.genAI.cloud import (CloudRunPerformanceMonitor, log_filter, list_log_entries,
+                                LOG_PAGE_SIZE, LOG_MAX_ENTRIES)
+from flaskr.logbuffer import to_utc
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 等待同專案其他服務加入批次的時間 (秒)
+LOG_BATCH_DELAY = 1.0
+# 每個批次最多合併的服務數，避免 filter 過長
+LOG_BATCH_MAX_SERVICES = 20
+# 等待批次結果的上限 (秒)
+LOG_BATCH_TIMEOUT = 60
+
+
+class LogBatch:
+    """
+    One query over the error logs of several services of a project.
+
+    Until it is sent, services join the batch and widen its window. Once
+    sent, requests of its services within its window wait for its result
+    instead of querying again (single flight).
+
+    Attributes:
+        project_id (str): The project ID.
+        start (datetime): The start of the window (UTC).
+        end (datetime): The end of the window (UTC).
+        services (set[tuple[str, str]]): The region and name of each service.
+        sent (bool): Whether the query was sent.
+        results (dict[tuple[str, str], list[dict]]): The entries of each service, newest first.
+        error (Exception | None): The error of the query, if it failed.
+    """
+
+    def __init__(self, project_id: str, start: datetime, end: datetime) -> None:
+        self.project_id = project_id
+        self.start = start
+        self.end = end
+        self.services: set[tuple[str, str]] = set()
+        self.sent = False
+        self.results: dict[tuple[str, str], list[dict]] = {}
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+    def covers(self, service: tuple[str, str], start: datetime, end: datetime) -> bool:
+        """
+        Checks whether the sent query already covers a request.
+        """
+        return service in self.services and self.start <= start and end <= self.end
+
+    def join(self, service: tuple[str, str], start: datetime, end: datetime) -> None:
+        """
+        Adds a service to the batch, widening its window.
+        """
+        self.services.add(service)
+        self.start = min(self.start, start)
+        self.end = max(self.end, end)
+
+
+class ProjectLogFetcher:
+    """
+    Fetches the error logs of the services of a project with as few
+    queries as possible.
+
+    The first request of a project opens a batch and waits `delay` seconds
+    for the other services of the project, which alarm together when a
+    shared dependency fails. A single query with an OR over the services
+    is then sent for the whole batch, and its entries are split by their
+    service name and location labels. Each service keeps at most
+    `max_entries` entries; when the noisiest services fill their share
+    first, the others are queried again further back in the window.
+    """
+
+    def __init__(self, delay: float = LOG_BATCH_DELAY,
+                 max_services: int = LOG_BATCH_MAX_SERVICES,
+                 page_size: int = LOG_PAGE_SIZE,
+                 max_entries: int = LOG_MAX_ENTRIES) -> None:
+        self.delay = delay
+        self.max_services = max_services
+        self.page_size = page_size
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 每個專案等待送出與查詢中的批次
+        self._batches: dict[str, list[LogBatch]] = {}
+
+    def fetch(self, crpm: CloudRunPerformanceMonitor,
+              start: datetime, end: datetime) -> list[dict]:
+        """
+        Returns the error logs of a service within a window, newest first.
+
+        Args:
+            crpm (CloudRunPerformanceMonitor): The monitor of the service.
+            start (datetime): The start of the window (UTC).
+            end (datetime): The end of the window (UTC).
+
+        Returns:
+            list[dict]: The timestamp, severity, message and insert ID of the entries.
+
+        Raises:
+            Exception: The error of the query.
+            TimeoutError: If the query did not finish within `LOG_BATCH_TIMEOUT` seconds.
+        """
+        project_id = crpm.cloud_run_info.project_id
+        service = (crpm.cloud_run_info.region, crpm.cloud_run_info.service_name)
+        batch, leader = self._join(project_id, service, start, end)
+
+        if leader:
+            time.sleep(self.delay)
+            self._send(crpm, batch)
+        elif not batch.done.wait(LOG_BATCH_TIMEOUT):
+            raise TimeoutError(f'log query of {project_id} did not finish')
+
+        if batch.error is not None:
+            raise batch.error
+        return [entry for entry in batch.results.get(service, [])
+                if start <= to_utc(entry['timestamp']) <= end]
+
+    def _join(self, project_id: str, service: tuple[str, str],
+              start: datetime, end: datetime) -> tuple[LogBatch, bool]:
+        """
+        Finds the batch serving a request, opening one if needed.
+
+        Returns:
+            tuple[LogBatch, bool]: The batch, and whether the caller opened it
+                and therefore has to send it.
+        """
+        with self._lock:
+            batches = self._batches.setdefault(project_id, [])
+            for batch in batches:
+                if batch.sent and batch.covers(service, start, end):
+                    return batch, False
+            for batch in batches:
+                if not batch.sent and (service in batch.services
+                                       or len(batch.services) < self.max_services):
+                    batch.join(service, start, end)
+                    return batch, False
+            batch = LogBatch(project_id, start, end)
+            batch.join(service, start, end)
+            batches.append(batch)
+            return batch, True
+
+    def _send(self, crpm: CloudRunPerformanceMonitor, batch: LogBatch) -> None:
+        """
+        Sends the query of a batch and splits its entries by service.
+        """
+        with self._lock:
+            batch.sent = True
+            services = sorted(batch.services)
+            start, end = batch.start.isoformat(), batch.end.isoformat()
+        logger.debug('list logs of %d services of %s: %s - %s',
+                     len(services), batch.project_id, start, end)
+
+        results: dict[tuple[str, str], list[dict]] = {service: [] for service in services}
+        try:
+            self._collect(crpm, batch.project_id, results, start, end)
+            batch.results = results
+        except Exception as e:
+            logger.error('cannot list logs of %s: %s', batch.project_id, e)
+            batch.error = e
+        finally:
+            with self._lock:
+                self._batches[batch.project_id].remove(batch)
+                if not self._batches[batch.project_id]:
+                    del self._batches[batch.project_id]
+            batch.done.set()
+
+    def _collect(self, crpm: CloudRunPerformanceMonitor, project_id: str,
+                 results: dict[tuple[str, str], list[dict]], start: str, end: str) -> None:
+        """
+        Fills the entries of each service, up to `max_entries` each.
+
+        A query reads at most `max_entries` per service still short of its
+        share. When it stops at that cap because some services filled their
+        share, the others are queried again from the oldest entry read.
+        """
+        seen: set[str] = set()
+        pending = list(results)
+        while pending:
+            cap = self.max_entries * len(pending)
+            count, oldest = 0, None
+            for entry in list_log_entries(crpm.logging_client, project_id,
+                                          log_filter(pending, start, end),
+                                          self.page_size, cap):
+                count += 1
+                oldest = entry['timestamp'] or oldest
+                service_entries = results.get((entry.pop('region'), entry.pop('service_name')))
+                # 每個服務最多保留 max_entries 筆，避免錯誤最多的服務佔滿結果
+                if service_entries is None or entry['timestamp'] is None \
+                        or entry['insert_id'] in seen \
+                        or len(service_entries) >= self.max_entries:
+                    continue
+                seen.add(entry['insert_id'])
+                service_entries.append(entry)
+            if count < cap or oldest is None:
+                return
+            short = [service for service in pending if len(results[service]) < self.max_entries]
+            if len(short) == len(pending):
+                return
+            # 其他服務從已讀到的最舊時間再往前查詢
+            pending = short
+            end = to_utc(oldest).isoformat()
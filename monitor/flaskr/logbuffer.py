@@ -0,0 +1,169 @@
+""" Per-service log cursors and ring buffers, so that every log entry is fetched once """
+
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+from flaskr.genAI.cloud import CloudRunPerformanceMonitor, SpecificTimeRange
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 每個服務保留的 log 筆數
+LOG_BUFFER_SIZE = 2000
+
+
+def to_utc(timestamp: str) -> datetime:
+    """
+    Parses an ISO timestamp to a naive UTC datetime, as used by the time ranges.
+    A timestamp without timezone is taken as UTC.
+    """
+    time = datetime.fromisoformat(timestamp)
+    if time.tzinfo is not None:
+        time = time.astimezone(timezone.utc).replace(tzinfo=None)
+    return time
+
+
+class LogCursor:
+    """
+    The position of the newest log entry fetched for a service.
+
+    Entries sharing the newest timestamp are told apart by their insert ID,
+    so the next fetch can start at that timestamp without duplicates.
+
+    Attributes:
+        timestamp (datetime): The naive UTC timestamp of the newest entry.
+        insert_ids (set[str]): The insert IDs of the entries at that timestamp.
+    """
+
+    __slots__ = ('timestamp', 'insert_ids')
+
+    def __init__(self, timestamp: datetime, insert_ids: set[str]) -> None:
+        self.timestamp = timestamp
+        self.insert_ids = insert_ids
+
+    def covers(self, time: datetime, insert_id: str) -> bool:
+        """
+        Checks whether an entry was already fetched.
+        """
+        return time < self.timestamp or (
+            time == self.timestamp and insert_id in self.insert_ids)
+
+
+class ServiceLogBuffer:
+    """
+    The latest log entries of one service and the cursor of the last fetch.
+    """
+
+    def __init__(self, size: int = LOG_BUFFER_SIZE) -> None:
+        self.entries: deque = deque(maxlen=size)
+        self.cursor: LogCursor | None = None
+        self.lock = threading.Lock()
+
+
+class LogBuffers:
+    """
+    Incrementally fetches the error logs of every service into a bounded
+    ring buffer, and serves the anomaly analysis from that buffer.
+
+    Args:
+        size (int): The number of entries kept per service.
+        fetch (Callable, optional): Fetches the entries of a service within a
+            window, newest first, e.g. `ProjectLogFetcher.fetch`. Defaults to
+            `CloudRunPerformanceMonitor.iter_logs`.
+    """
+
+    def __init__(self, size: int = LOG_BUFFER_SIZE,
+                 fetch: Callable[[CloudRunPerformanceMonitor, datetime, datetime],
+                                 Iterable[dict]] = None) -> None:
+        self.size = size
+        self.fetch = fetch
+        self._lock = threading.Lock()
+        self._buffers: dict[str, ServiceLogBuffer] = {}
+
+    def read(self, service: str, crpm: CloudRunPerformanceMonitor,
+             start: str, end: str) -> list[dict]:
+        """
+        Fetches the entries newer than the cursor of a service, then returns
+        the buffered entries of the window, oldest first.
+
+        Args:
+            service (str): The key of the service.
+            crpm (CloudRunPerformanceMonitor): The monitor used to fetch the logs.
+            start (str): The start of the window in ISO format (UTC).
+            end (str): The end of the window in ISO format (UTC).
+
+        Returns:
+            list[dict]: The entries with their timestamp, severity, message and insert ID.
+        """
+        buffer = self._get_buffer(service)
+        window_start, window_end = to_utc(start), to_utc(end)
+        with buffer.lock:
+            self._fetch(buffer, crpm, window_start, window_end)
+            return [entry for time, entry in buffer.entries
+                    if window_start <= time <= window_end]
+
+    def forget(self, service: str) -> None:
+        """
+        Drops the buffer and cursor of a service.
+
+        Args:
+            service (str): The key of the service.
+        """
+        with self._lock:
+            self._buffers.pop(service, None)
+
+    def _fetch(self, buffer: ServiceLogBuffer, crpm: CloudRunPerformanceMonitor,
+               start: datetime, end: datetime) -> None:
+        """
+        Reads the entries between the cursor (or the window start, if later) and
+        the window end, and appends the new ones to the buffer.
+        """
+        cursor = buffer.cursor
+        if cursor is not None:
+            if cursor.timestamp > end:
+                return
+            start = max(start, cursor.timestamp)
+        if self.fetch is not None:
+            entries = self.fetch(crpm, start, end)
+        else:
+            entries = crpm.iter_logs(SpecificTimeRange(start.isoformat(), end.isoformat()))
+
+        new_entries = []
+        # 由新到舊讀取，已讀過的 entry 之後就不必再讀
+        for entry in entries:
+            if entry['timestamp'] is None:
+                continue
+            time = to_utc(entry['timestamp'])
+            if cursor is not None and cursor.covers(time, entry['insert_id']):
+                if time < cursor.timestamp:
+                    break
+                continue
+            new_entries.append((time, entry))
+        if not new_entries:
+            return
+
+        new_entries.reverse()
+        buffer.entries.extend(new_entries)
+        newest = new_entries[-1][0]
+        insert_ids = {entry['insert_id'] for time, entry in new_entries if time == newest}
+        if cursor is not None and cursor.timestamp == newest:
+            insert_ids |= cursor.insert_ids
+        buffer.cursor = LogCursor(newest, insert_ids)
+        logger.debug('fetched %d new log entries', len(new_entries))
+
+    def _get_buffer(self, service: str) -> ServiceLogBuffer:
+        with self._lock:
+            buffer = self._buffers.get(service)
+            if buffer is None:
+                buffer = self._buffers[service] = ServiceLogBuffer(self.size)
+            return buffer
@@ -0,0 +1,293 @@
+""" Online log template mining (Drain) that collapses repeated errors into templates """
+
+import re
+import threading
+import logging
+from typing import Iterable
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+WILDCARD = '<*>'
+# 解析樹的深度 (根節點、長度層、前綴層與葉節點)
+DRAIN_DEPTH = 4
+# 與樣板相同的 token 比例達到此值，視為同一個樣板
+DRAIN_SIMILARITY = 0.4
+# 每個節點的子節點上限，超過時併入萬用字元節點
+DRAIN_MAX_CHILDREN = 100
+# 每個服務保留的樣板上限
+DRAIN_MAX_CLUSTERS = 500
+# 每則訊息最多解析的 token 數
+DRAIN_MAX_TOKENS = 200
+
+# 先將常見的變數 (ID、數字、位址) 換成萬用字元
+MASKS = [
+    re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'),
+    re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'),
+    re.compile(r'\b0x[0-9a-fA-F]+\b'),
+    re.compile(r'\b[0-9a-fA-F]{16,}\b'),
+    re.compile(r'(?<![A-Za-z])[-+]?\d+(?:\.\d+)?(?![A-Za-z])'),
+]
+
+
+def tokenize(message: str) -> list[str]:
+    """
+    Masks the variables of a message and splits it into tokens.
+
+    Args:
+        message (str): The log message.
+
+    Returns:
+        list[str]: The tokens, at most `DRAIN_MAX_TOKENS`.
+    """
+    for mask in MASKS:
+        message = mask.sub(WILDCARD, message)
+    return message.split()[:DRAIN_MAX_TOKENS]
+
+
+class LogCluster:
+    """
+    A log template and the statistics of the messages it matched.
+
+    Attributes:
+        tokens (list[str]): The template, variable tokens being `WILDCARD`.
+        count (int): The number of matched messages.
+        first_seen (str): The earliest timestamp of the matched messages.
+        last_seen (str): The latest timestamp of the matched messages.
+        example (str): The first matched message.
+        severity (str): The severity of the first matched message.
+    """
+
+    __slots__ = ('tokens', 'count', 'first_seen', 'last_seen', 'example', 'severity', 'leaf')
+
+    def __init__(self, tokens: list[str], message: str, timestamp: str | None,
+                 severity: str | None, leaf: list) -> None:
+        self.tokens = tokens
+        self.count = 0
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.example = message
+        self.severity = severity
+        self.leaf = leaf
+
+    @property
+    def template(self) -> str:
+        """
+        The template as a string.
+        """
+        return ' '.join(self.tokens)
+
+    def seen(self, timestamp: str | None) -> None:
+        """
+        Counts a matched message.
+        """
+        self.count += 1
+        if timestamp is None:
+            return
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+
+class Drain:
+    """
+    The Drain online log parser: messages are routed through a fixed-depth
+    tree by their token count and first tokens, then matched against the
+    few templates of the leaf by token similarity.
+
+    He, P., Zhu, J., Zheng, Z. & Lyu, M. R. (2017).
+    Drain: An Online Log Parsing Approach with Fixed Depth Tree.
+    """
+
+    def __init__(self, depth: int = DRAIN_DEPTH, similarity: float = DRAIN_SIMILARITY,
+                 max_children: int = DRAIN_MAX_CHILDREN,
+                 max_clusters: int = DRAIN_MAX_CLUSTERS) -> None:
+        self.prefix_depth = max(depth - 3, 1)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.clusters: list[LogCluster] = []
+        self._root: dict = {}
+
+    def add(self, message: str, timestamp: str = None, severity: str = None) -> LogCluster:
+        """
+        Matches a message against the templates, creating or generalizing one.
+
+        Args:
+            message (str): The log message.
+            timestamp (str, optional): The ISO timestamp of the message.
+            severity (str, optional): The severity of the message.
+
+        Returns:
+            LogCluster: The template the message belongs to.
+        """
+        tokens = tokenize(message)
+        leaf = self._leaf(tokens)
+        cluster = self._match(leaf, tokens)
+        if cluster is None:
+            if len(self.clusters) >= self.max_clusters:
+                self._evict()
+            cluster = LogCluster(tokens, message, timestamp, severity, leaf)
+            leaf.append(cluster)
+            self.clusters.append(cluster)
+        else:
+            cluster.tokens = [t if t == c else WILDCARD for t, c in zip(tokens, cluster.tokens)]
+        cluster.seen(timestamp)
+        return cluster
+
+    def _leaf(self, tokens: list[str]) -> list:
+        """
+        Walks the tree to the leaf of the message, creating the missing nodes.
+        """
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_depth]:
+            # 含數字的 token 多半是變數，走萬用字元節點
+            if any(c.isdigit() for c in token):
+                token = WILDCARD
+            if token not in node and len(node) >= self.max_children:
+                token = WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    def _match(self, leaf: list, tokens: list[str]) -> LogCluster | None:
+        """
+        Returns the most similar template of the leaf, if similar enough.
+        """
+        best, best_key = None, (-1.0, -1)
+        for cluster in leaf:
+            same = wildcards = 0
+            for token, template in zip(tokens, cluster.tokens):
+                if template == WILDCARD:
+                    wildcards += 1
+                elif token == template:
+                    same += 1
+            key = (same / len(tokens) if tokens else 1.0, wildcards)
+            if key > best_key:
+                best, best_key = cluster, key
+        if best is not None and best_key[0] >= self.similarity:
+            return best
+        return None
+
+    def _evict(self) -> None:
+        """
+        Drops the template seen least recently.
+        """
+        oldest = min(self.clusters, key=lambda c: c.last_seen or '')
+        self.clusters.remove(oldest)
+        oldest.leaf.remove(oldest)
+
+
+class TemplateSummary:
+    """
+    The messages of one template within one batch of logs.
+
+    Attributes:
+        template (str): The template.
+        count (int): The number of messages in the batch.
+        first_seen (str): The earliest timestamp in the batch.
+        last_seen (str): The latest timestamp in the batch.
+        example (str): One message of the batch.
+        severity (str): The severity of the example.
+    """
+
+    def __init__(self, cluster: LogCluster, message: str, timestamp: str | None,
+                 severity: str | None) -> None:
+        self.cluster = cluster
+        self.count = 0
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.example = message
+        self.severity = severity
+
+    @property
+    def template(self) -> str:
+        """
+        The current template of the cluster.
+        """
+        return self.cluster.template
+
+    def __str__(self) -> str:
+        period = f'{self.first_seen} ~ {self.last_seen}' if self.first_seen else '-'
+        return f'[x{self.count}] {self.template}\n  ({self.severity}, {period}) e.g. {self.example}'
+
+
+class LogMiner:
+    """
+    One Drain parser per service, kept across anomalies so that the
+    templates learned from earlier errors are reused.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._parsers: dict[str, Drain] = {}
+
+    def summarize(self, service: str, entries: Iterable[dict]) -> list[TemplateSummary]:
+        """
+        Feeds a batch of log entries into the parser of a service and
+        summarizes the batch per template.
+
+        Args:
+            service (str): The key of the service.
+            entries (Iterable[dict]): The entries with their timestamp, severity and message.
+
+        Returns:
+            list[TemplateSummary]: The templates of the batch, most frequent first.
+        """
+        parser = self._get_parser(service)
+        summaries: dict[int, TemplateSummary] = {}
+        for entry in entries:
+            message, timestamp = entry['message'], entry.get('timestamp')
+            cluster = parser.add(message, timestamp, entry.get('severity'))
+            summary = summaries.get(id(cluster))
+            if summary is None:
+                summary = summaries[id(cluster)] = TemplateSummary(
+                    cluster, message, timestamp, entry.get('severity'))
+            summary.count += 1
+            if timestamp is not None:
+                summary.first_seen = min(summary.first_seen or timestamp, timestamp)
+                summary.last_seen = max(summary.last_seen or timestamp, timestamp)
+        return sorted(summaries.values(), key=lambda s: s.count, reverse=True)
+
+    def forget(self, service: str) -> None:
+        """
+        Drops the parser of a service.
+
+        Args:
+            service (str): The key of the service.
+        """
+        with self._lock:
+            self._parsers.pop(service, None)
+
+    def _get_parser(self, service: str) -> Drain:
+        with self._lock:
+            parser = self._parsers.get(service)
+            if parser is None:
+                parser = self._parsers[service] = Drain()
+            return parser
+
+
+def format_templates(summaries: list[TemplateSummary], limit: int = None) -> str:
+    """
+    Formats the templates of a batch, one per paragraph.
+
+    Args:
+        summaries (list[TemplateSummary]): The templates, most frequent first.
+        limit (int, optional): The maximum number of templates. Defaults to all.
+
+    Returns:
+        str: The templates, or an empty string if there are none.
+    """
+    shown = summaries[:limit] if limit else summaries
+    text = '\n'.join(str(summary) for summary in shown)
+    if len(shown) < len(summaries):
+        rest = sum(summary.count for summary in summaries[len(shown):])
+        text += f'\n... {len(summaries) - len(shown)} more templates ({rest} entries)'
+    return text
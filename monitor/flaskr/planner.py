@@ -0,0 +1,276 @@
+""" Fleet-wide planning of the scaling proposals within per-project budgets """
+
+import os
+import json
+import threading
+import logging
+from typing import Callable
+
+from flaskr.db import get_db
+from flaskr.genAI.cloud import CloudRun, service_specs, parse_resource_value
+from flaskr.coalesce import NotificationCoalescer, PRIORITY_NOTICE
+from flaskr.autoscaler import ScalingDecision, record_scaling_decision
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 每個專案所有服務的 CPU (vCPU) 與 Memory (MiB) 上限總和，0 表示不限制
+# 以單一 instance 的上限計算，不乘上 instance 數量
+PROJECT_CPU_BUDGET = float(os.getenv('PROJECT_CPU_BUDGET', '0'))
+PROJECT_MEMORY_BUDGET = float(os.getenv('PROJECT_MEMORY_BUDGET', '0'))
+# 個別專案的預算，例如 {"my-project": {"cpu": 16, "memory": 32768}}
+PROJECT_BUDGETS = json.loads(os.getenv('PROJECT_BUDGETS', '{}'))
+# 收集提案並批次套用的間隔 (秒)
+PLAN_INTERVAL = 30
+
+DEFERRED = 'deferred'
+
+
+class ScalingProposal:
+    """
+    A scaling change proposed by the polling of one service.
+
+    Attributes:
+        cr (CloudRun): The CloudRun instance.
+        channel_id (str): The ID of the channel the service reports to.
+        decision (ScalingDecision): The decision of the autoscaling controller.
+        origin (tuple[int, int]): The current CPU and memory.
+        target (tuple[int, int]): The proposed CPU and memory.
+        apply (Callable[[], None]): Applies the change.
+        severity (float): The priority of the change within its project.
+    """
+
+    def __init__(self, cr: CloudRun, channel_id: str, decision: ScalingDecision,
+                 origin: tuple[int, int], target: tuple[int, int],
+                 apply: Callable[[], None]) -> None:
+        self.cr = cr
+        self.channel_id = channel_id
+        self.decision = decision
+        self.origin = origin
+        self.target = target
+        self.apply = apply
+        self.severity = max(decision.cpu_vote, decision.memory_vote)
+
+    @property
+    def key(self) -> str:
+        """
+        The key of the service.
+        """
+        return self.cr.get_full_service_name()
+
+    @property
+    def delta(self) -> tuple[int, int]:
+        """
+        The change of CPU and memory.
+        """
+        return self.target[0] - self.origin[0], self.target[1] - self.origin[1]
+
+
+def get_budget(project_id: str) -> tuple[float, float]:
+    """
+    Returns the CPU and memory budget of a project, 0 meaning unlimited.
+    The budget bounds the sum of the per-instance limits of its services.
+
+    Args:
+        project_id (str): The project ID.
+
+    Returns:
+        tuple[float, float]: The CPU budget in vCPU and memory budget in MiB.
+    """
+    budget = PROJECT_BUDGETS.get(project_id, {})
+    return (float(budget.get('cpu', PROJECT_CPU_BUDGET)),
+            float(budget.get('memory', PROJECT_MEMORY_BUDGET)))
+
+
+def plan_project(proposals: list[ScalingProposal], usage: tuple[float, float],
+                 budget: tuple[float, float]) -> tuple[list, list]:
+    """
+    Chooses the proposals of one project that fit in its budget.
+
+    Scale-downs are always accepted first, since they free budget. The
+    others are accepted by descending severity while the project stays
+    within its budget.
+
+    Args:
+        proposals (list[ScalingProposal]): The proposals of the project.
+        usage (tuple[float, float]): The CPU and memory currently allocated in the project.
+        budget (tuple[float, float]): The CPU and memory budget, 0 meaning unlimited.
+
+    Returns:
+        tuple[list, list]: The accepted and the deferred proposals.
+    """
+    used_cpu, used_memory = usage
+    accepted, deferred = [], []
+    shrinking = [p for p in proposals if p.delta[0] <= 0 and p.delta[1] <= 0]
+    growing = sorted((p for p in proposals if p not in shrinking),
+                     key=lambda p: p.severity, reverse=True)
+    for proposal in shrinking + growing:
+        cpu = used_cpu + proposal.delta[0]
+        memory = used_memory + proposal.delta[1]
+        if (proposal.delta[0] > 0 and budget[0] and cpu > budget[0]) \
+                or (proposal.delta[1] > 0 and budget[1] and memory > budget[1]):
+            deferred.append(proposal)
+            continue
+        accepted.append(proposal)
+        used_cpu, used_memory = cpu, memory
+    return accepted, deferred
+
+
+class FleetPlanner:
+    """
+    Collects the scaling proposals of all services and applies them in
+    batches every `PLAN_INTERVAL` seconds, deferring the ones that would
+    exceed the budget of their project.
+
+    A service proposes again on its next polling, so a deferred
+    change is planned again in the next batch. The deferrals are reported
+    through `notifications`, merged with the other notices of their channels.
+    """
+
+    def __init__(self, interval: float = PLAN_INTERVAL,
+                 notifications: NotificationCoalescer | None = None) -> None:
+        self.interval = interval
+        self.notifications = notifications if notifications is not None else NotificationCoalescer()
+        self._lock = threading.Lock()
+        self._proposals: dict[str, ScalingProposal] = {}
+        self._reported: dict[str, tuple[int, int]] = {}
+
+    def propose(self, proposal: ScalingProposal) -> None:
+        """
+        Adds a proposal to the next batch, replacing the previous proposal of the service.
+
+        Args:
+            proposal (ScalingProposal): The proposal.
+        """
+        with self._lock:
+            self._proposals[proposal.key] = proposal
+
+    def run_batch(self) -> tuple[list, list]:
+        """
+        Plans and applies the proposals collected since the last batch,
+        and reports the deferred ones to their channels.
+
+        Returns:
+            tuple[list, list]: The applied and the deferred proposals.
+        """
+        with self._lock:
+            proposals, self._proposals = list(self._proposals.values()), {}
+        if not proposals:
+            return [], []
+
+        projects: dict[str, list[ScalingProposal]] = {}
+        for proposal in proposals:
+            projects.setdefault(proposal.cr.project_id, []).append(proposal)
+
+        applied, deferred = [], []
+        for project_id, project_proposals in projects.items():
+            budget = get_budget(project_id)
+            usage = self.project_usage(project_id, project_proposals) if any(budget) else (0, 0)
+            accepted, rejected = plan_project(project_proposals, usage, budget)
+            applied += accepted
+            deferred += rejected
+            if rejected:
+                logger.info('project %s: %d scaling changes deferred, usage=%s budget=%s',
+                            project_id, len(rejected), usage, budget)
+
+        # 同一批次的調整一起送出，各自在背景追蹤上線進度
+        for proposal in applied:
+            self._reported.pop(proposal.key, None)
+            try:
+                proposal.apply()
+            except Exception as e:
+                logger.error('cannot apply scaling of %s: %s', proposal.cr.service_name, e)
+        self.report_deferred(deferred)
+        return applied, deferred
+
+    def report_deferred(self, deferred: list[ScalingProposal]) -> None:
+        """
+        Logs the deferred proposals and tells their channels, once per proposed target.
+
+        Args:
+            deferred (list[ScalingProposal]): The deferred proposals.
+        """
+        for proposal in deferred:
+            if self._reported.get(proposal.key) == proposal.target:
+                continue
+            self._reported[proposal.key] = proposal.target
+            record_scaling_decision(proposal.cr, proposal.decision, DEFERRED,
+                                    proposal.origin, proposal.target)
+            # 同頻道的延後通知共用標題，與其他資源調整通知一起合併送出
+            self.notifications.post(
+                proposal.channel_id,
+                f'- service name: **{proposal.cr.service_name}** ({proposal.cr.project_id})'
+                f': CPU {proposal.origin[0]} → {proposal.target[0]} vCPU,'
+                f' Memory {proposal.origin[1]} → {proposal.target[1]} MiB',
+                header='**資源調整延後** (超過專案預算)\n', priority=PRIORITY_NOTICE)
+
+    def project_usage(self, project_id: str,
+                      proposals: list[ScalingProposal]) -> tuple[float, float]:
+        """
+        Sums the CPU and memory limits of the registered services of a project.
+
+        The budgets are per instance: each service counts the limits of one
+        instance, not multiplied by its instance count, since scaling changes
+        the limits of the revision and Cloud Run scales the instances itself.
+
+        The limits of the proposing services are known from their proposals,
+        the others are read from the cached service specs, without any API call;
+        a service scaled by an earlier batch keeps the spec sent in its update.
+        Services whose spec is not cached are not counted.
+
+        Args:
+            project_id (str): The project ID.
+            proposals (list[ScalingProposal]): The proposals of the project.
+
+        Returns:
+            tuple[float, float]: The CPU in vCPU and memory in MiB.
+        """
+        known = {proposal.key: proposal.origin for proposal in proposals}
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute('''
+        SELECT DISTINCT region, service_name FROM cloud_run_service WHERE project_id=?
+        ''', (project_id,))
+        services = [CloudRun(row['region'], project_id, row['service_name'])
+                    for row in cursor.fetchall()]
+        db.close()
+
+        cpu = memory = 0
+        for cr in services:
+            key = cr.get_full_service_name()
+            if key in known:
+                cpu += known[key][0]
+                memory += known[key][1]
+                continue
+            spec = service_specs.peek(key)
+            if spec is None or not spec.template.containers:
+                continue
+            limits = spec.template.containers[0].resources.limits
+            try:
+                cpu += parse_resource_value(limits.get('cpu', '0m'))
+                memory += parse_resource_value(limits.get('memory', '0Mi'))
+            except Exception as e:
+                logger.error('cannot parse limits of %s: %s', key, e)
+        return cpu, memory
+
+    def start(self) -> None:
+        """
+        Runs a batch every `interval` seconds on a daemon timer.
+        """
+        timer = threading.Timer(self.interval, self._tick)
+        timer.daemon = True
+        timer.start()
+
+    def _tick(self) -> None:
+        self.start()
+        try:
+            self.run_batch()
+        except Exception as e:
+            logger.error('scaling batch failed: %s', e)
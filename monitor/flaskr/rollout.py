@@ -0,0 +1,138 @@
+""" Asynchronous Cloud Run updates and tracking of their rollouts """
+
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable
+
+from google.api_core.operation import Operation
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 查詢更新進度的間隔 (秒)
+ROLLOUT_POLL_INTERVAL = 5
+# 新版本超過此時間 (秒) 仍未上線，視為失敗並解除鎖定
+ROLLOUT_TIMEOUT = 600
+# 同時送出更新的執行緒數量
+ROLLOUT_MAX_WORKERS = 4
+
+
+class Rollout:
+    """
+    An update of a service whose new revision is not serving yet.
+
+    Attributes:
+        service (str): The key of the service.
+        started_at (float): The monotonic time the update was submitted.
+        operation (Operation): The long-running operation, once the update is sent.
+    """
+
+    def __init__(self, service: str) -> None:
+        self.service = service
+        self.started_at = time.monotonic()
+        self.operation = None
+
+
+class RolloutTracker:
+    """
+    Submits service updates on a thread pool and polls their long-running
+    operations, so that the polling threads never block on Cloud Run.
+
+    While the update of a service is rolling out, the service is locked
+    and new updates of it are rejected.
+    """
+
+    def __init__(self, poll_interval: float = ROLLOUT_POLL_INTERVAL,
+                 timeout: float = ROLLOUT_TIMEOUT,
+                 max_workers: int = ROLLOUT_MAX_WORKERS) -> None:
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='rollout')
+        self._lock = threading.Lock()
+        self._rollouts: dict[str, Rollout] = {}
+
+    def in_progress(self, service: str) -> bool:
+        """
+        Checks whether an update of the service is still rolling out.
+
+        Args:
+            service (str): The key of the service.
+
+        Returns:
+            bool: True if the service is locked by a rollout, False otherwise.
+        """
+        with self._lock:
+            return service in self._rollouts
+
+    def submit(self, service: str, update: Callable[[], Operation | None],
+               on_done: Callable[[bool], None] = None) -> Future | None:
+        """
+        Submits an update of a service unless one is already rolling out.
+
+        Args:
+            service (str): The key of the service.
+            update (Callable[[], Operation | None]): Sends the update and returns its
+                long-running operation, or None if nothing was sent.
+            on_done (Callable[[bool], None], optional): Called with whether the new
+                revision is serving, once the rollout is over.
+
+        Returns:
+            Future | None: The future of the rollout, or None if the service is locked.
+        """
+        with self._lock:
+            if service in self._rollouts:
+                logger.debug('rollout of %s in progress, update skipped', service)
+                return None
+            rollout = self._rollouts[service] = Rollout(service)
+        return self._executor.submit(self._run, rollout, update, on_done)
+
+    def _run(self, rollout: Rollout, update: Callable[[], Operation | None],
+             on_done: Callable[[bool], None] | None) -> bool:
+        """
+        Sends the update and waits for its revision to serve, then releases the lock.
+        """
+        serving = False
+        try:
+            rollout.operation = update()
+            if rollout.operation is not None:
+                self._wait(rollout)
+                serving = True
+                logger.info('rollout of %s done in %.1fs', rollout.service,
+                            time.monotonic() - rollout.started_at)
+        except Exception as e:
+            logger.error('rollout of %s failed: %s', rollout.service, e)
+        finally:
+            with self._lock:
+                self._rollouts.pop(rollout.service, None)
+
+        if on_done is not None and rollout.operation is not None:
+            try:
+                on_done(serving)
+            except Exception as e:
+                logger.error('rollout callback of %s failed: %s', rollout.service, e)
+        return serving
+
+    def _wait(self, rollout: Rollout) -> None:
+        """
+        Polls the operation until it is done, raising its error if it failed.
+
+        Raises:
+            TimeoutError: If the operation is not done within the timeout.
+        """
+        deadline = rollout.started_at + self.timeout
+        # Operation.done() 會向 API 查詢最新狀態
+        while not rollout.operation.done():
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'not serving after {self.timeout}s')
+            time.sleep(self.poll_interval)
+        rollout.operation.result()
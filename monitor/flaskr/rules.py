@@ -0,0 +1,265 @@
+""" Declarative anomaly and scaling rules, evaluated vectorized over whole windows """
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+
+class Condition:
+    """
+    A comparison of one metric against a threshold, e.g. `Metric('x') > 5`.
+
+    Attributes:
+        metric (str): The metric name.
+        op (str): The comparison operator, one of `OPERATORS`.
+        threshold (float): The threshold to compare with.
+        default (float): The value used when the metric is missing.
+            A missing value (NaN) of a present metric never meets the condition.
+    """
+
+    def __init__(self, metric: str, op: str, threshold: float, default: float = 0) -> None:
+        if op not in OPERATORS:
+            raise ValueError(f'Invalid operator: {op}')
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.default = default
+
+    def __str__(self) -> str:
+        return f'{self.metric} {self.op} {self.threshold:g}'
+
+
+class Metric:
+    """
+    A metric name which builds a `Condition` when compared with a number.
+
+    Example:
+        Metric('Request Count (5xx)') > 5
+    """
+
+    __hash__ = None
+
+    def __init__(self, name: str, default: float = 0) -> None:
+        self.name = name
+        self.default = default
+
+    def __gt__(self, threshold: float) -> Condition:
+        return Condition(self.name, '>', threshold, self.default)
+
+    def __ge__(self, threshold: float) -> Condition:
+        return Condition(self.name, '>=', threshold, self.default)
+
+    def __lt__(self, threshold: float) -> Condition:
+        return Condition(self.name, '<', threshold, self.default)
+
+    def __le__(self, threshold: float) -> Condition:
+        return Condition(self.name, '<=', threshold, self.default)
+
+    def __eq__(self, threshold: float) -> Condition:
+        return Condition(self.name, '==', threshold, self.default)
+
+
+class Rule:
+    """
+    An anomaly rule which fires when its condition holds
+    on `consecutive` rows in a row.
+
+    Attributes:
+        condition (Condition): The condition of the rule.
+        consecutive (int): The number of consecutive rows the condition must hold.
+        weight (float): The severity of the rule, used by the triage.
+        name (str): The description of the rule, e.g. 'Request Count (5xx) > 5'.
+    """
+
+    def __init__(self, condition: Condition, consecutive: int = 1, weight: float = 1) -> None:
+        self.condition = condition
+        self.consecutive = consecutive
+        self.weight = weight
+        self.name = str(condition)
+
+
+class ScalingRule:
+    """
+    A scaling heuristic which votes for changing CPU and memory
+    when its condition holds.
+
+    Attributes:
+        condition (Condition): The condition of the rule.
+        cpu (int): The vote for CPU, positive to scale up and negative to scale down.
+        memory (int): The vote for memory, positive to scale up and negative to scale down.
+    """
+
+    def __init__(self, condition: Condition, cpu: int = 0, memory: int = 0) -> None:
+        self.condition = condition
+        self.cpu = cpu
+        self.memory = memory
+
+
+class CompiledConditions:
+    """
+    Conditions compiled into NumPy arrays, so that they are evaluated
+    over all rows with one comparison per operator.
+    """
+
+    def __init__(self, conditions: list[Condition]) -> None:
+        self.columns = list(dict.fromkeys(condition.metric for condition in conditions))
+        self.column_index = np.array(
+            [self.columns.index(condition.metric) for condition in conditions], dtype=np.intp)
+        self.thresholds = np.array([condition.threshold for condition in conditions], dtype=float)
+        self.defaults = np.array([condition.default for condition in conditions], dtype=float)
+        self.op_masks = {
+            op: np.array([condition.op == op for condition in conditions])
+            for op in OPERATORS
+            if any(condition.op == op for condition in conditions)
+        }
+
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Evaluates every condition on every row.
+
+        Args:
+            df (pd.DataFrame): The metrics, one row per time.
+
+        Returns:
+            np.ndarray: A boolean array of shape (rows, conditions).
+        """
+        values = df.reindex(columns=self.columns).to_numpy(dtype=float)[:, self.column_index]
+        # 缺少的指標使用預設值，而存在但為 NaN 的數值則不符合任何條件
+        absent = ~np.isin(self.columns, df.columns)[self.column_index]
+        values[:, absent] = self.defaults[absent]
+        result = np.zeros(values.shape, dtype=bool)
+        for op, mask in self.op_masks.items():
+            result[:, mask] = OPERATORS[op](values[:, mask], self.thresholds[mask])
+        return result
+
+
+class RuleSet:
+    """
+    A set of anomaly rules compiled once and evaluated over whole windows.
+    """
+
+    def __init__(self, rules: list[Rule]) -> None:
+        self.rules = rules
+        self.names = [rule.name for rule in rules]
+        self.consecutive = np.array([rule.consecutive for rule in rules])
+        self._conditions = CompiledConditions([rule.condition for rule in rules])
+
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Evaluates every rule for the window ending at every row.
+
+        Args:
+            df (pd.DataFrame): The metrics, one row per time, oldest first.
+
+        Returns:
+            np.ndarray: A boolean array of shape (rows, rules), True where
+                the rule fires on the rows up to and including that row.
+        """
+        hits = self._conditions.evaluate(df)
+        for k in np.unique(self.consecutive[self.consecutive > 1]):
+            mask = self.consecutive == k
+            counts = np.cumsum(hits[:, mask], axis=0, dtype=np.int64)
+            window = counts.copy()
+            window[k:] -= counts[:-k]
+            run = window >= k
+            run[:k - 1] = False
+            hits[:, mask] = run
+        return hits
+
+    def fired(self, df: pd.DataFrame) -> list[str]:
+        """
+        Returns the names of the rules firing on the last row.
+
+        Args:
+            df (pd.DataFrame): The metrics, one row per time, oldest first.
+
+        Returns:
+            list[str]: The names of the fired rules, empty if there are none.
+        """
+        if len(df) == 0:
+            return []
+        return self.names_at(self.evaluate(df), -1)
+
+    def names_at(self, hits: np.ndarray, row: int) -> list[str]:
+        """
+        Returns the names of the rules firing on a row of the result of `evaluate`.
+        """
+        return [name for name, hit in zip(self.names, hits[row]) if hit]
+
+    def weights(self) -> dict[str, float]:
+        """
+        Returns the weight of every rule keyed by its name.
+        """
+        return {rule.name: rule.weight for rule in self.rules}
+
+    def describe(self) -> str:
+        """
+        Returns the rules as a markdown list, used in the LLM prompt.
+        """
+        lines = []
+        for rule in self.rules:
+            line = f'- {rule.name}'
+            if rule.consecutive > 1:
+                line += f' (連續 {rule.consecutive} 筆)'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+class ScalingRuleSet:
+    """
+    A set of scaling heuristics compiled once and evaluated over whole windows.
+    """
+
+    def __init__(self, rules: list[ScalingRule]) -> None:
+        self.rules = rules
+        self.cpu = np.array([rule.cpu for rule in rules])
+        self.memory = np.array([rule.memory for rule in rules])
+        self._conditions = CompiledConditions([rule.condition for rule in rules])
+
+    def votes(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Sums the votes of the rules on every row.
+
+        Args:
+            df (pd.DataFrame): The metrics, one row per time.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The CPU and memory votes of every row,
+                positive to scale up and negative to scale down.
+        """
+        hits = self._conditions.evaluate(df).astype(int)
+        return hits @ self.cpu, hits @ self.memory
+
+
+# 異常指標的判斷規則
+ABNORMAL_RULES = RuleSet([
+    Rule(Metric('Container Startup Latency (ms)') > 0, weight=1),
+    Rule(Metric('Instance Count (active)') > 2, weight=2),
+    Rule(Metric('Request Count (4xx)') > 5, weight=2),
+    Rule(Metric('Request Count (5xx)') > 5, weight=4),
+    Rule(Metric('Container CPU Utilization (%)') > 60, consecutive=2, weight=3),
+    Rule(Metric('Container Memory Utilization (%)') > 60, consecutive=2, weight=3),
+])
+
+# 自動調整資源的投票規則
+SCALING_RULES = ScalingRuleSet([
+    ScalingRule(Metric('Container CPU Utilization (%)') > 50, cpu=1),
+    ScalingRule(Metric('Container CPU Utilization (%)') < 30, cpu=-1),
+    ScalingRule(Metric('Container Memory Utilization (%)') > 50, memory=1),
+    ScalingRule(Metric('Container Memory Utilization (%)') < 30, memory=-1),
+    ScalingRule(Metric('Request Count', default=50) > 100, cpu=1, memory=1),
+    ScalingRule(Metric('Request Count', default=50) < 50, cpu=-1, memory=-1),
+    ScalingRule(Metric('Request Latency (ms)') > 100, cpu=1),
+    ScalingRule(Metric('Request Latency (ms)') < 50, cpu=-1),
+    ScalingRule(Metric('Instance Count', default=1) > 2, cpu=1, memory=1),
+    ScalingRule(Metric('Instance Count', default=1) < 1, cpu=-1, memory=-1),
+    ScalingRule(Metric('Container Startup Latency (ms)') > 100, cpu=1, memory=1),
+    ScalingRule(Metric('Container Startup Latency (ms)') == 0, cpu=-1, memory=-1),
+])
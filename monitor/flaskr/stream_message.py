@@ -0,0 +1,136 @@
+""" Discord messages that are posted once and then progressively edited """
+
+import json
+import time
+import uuid
+import logging
+
+from flaskr.dcbot_websocket import DCBotWebSocket
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Discord rejects messages longer than this
+DISCORD_MESSAGE_LIMIT = 2000
+# Discord allows about 5 edits per 5 seconds on one channel
+STREAM_EDIT_INTERVAL = 1.5
+
+
+class StreamingMessage:
+    """
+    A message whose headline is sent immediately and whose body is streamed
+    in afterwards as edit operations over the dcbot websocket.
+
+    When the content grows past the Discord message limit, the current
+    message is frozen and the rest continues in a new message.
+
+    Attributes:
+        channel_id (str): The ID of the channel to send the message to.
+        content (str): The content of the message currently being edited.
+        message_key (str): The key the bot uses to find the message to edit.
+        min_interval (float): The minimum number of seconds between two edits.
+    """
+
+    def __init__(self, channel_id: str, headline: str,
+                 min_interval: float = STREAM_EDIT_INTERVAL) -> None:
+        self.channel_id = channel_id
+        self.content = headline
+        self.message_key = uuid.uuid4().hex
+        self.min_interval = min_interval
+        self._pending = False
+        self._started = False
+        self._last_sent = 0.0
+
+    def start(self) -> bool:
+        """
+        Sends the headline as a new message.
+
+        Returns:
+            bool: True if the message was sent successfully, False otherwise.
+        """
+        self._started = True
+        self._pending = False
+        self._last_sent = time.monotonic()
+        return DCBotWebSocket.send(json.dumps({
+            'channel_id': self.channel_id,
+            'message': self.content,
+            'message_key': self.message_key,
+        }))
+
+    def append(self, text: str) -> None:
+        """
+        Appends text to the message body and sends an edit
+        if the last one was at least `min_interval` seconds ago.
+
+        Args:
+            text (str): The text to append.
+        """
+        if not text:
+            return
+        self.content += text
+        self._pending = True
+        while len(self.content) > DISCORD_MESSAGE_LIMIT:
+            self._roll_over()
+        if not self._started:
+            self._start_if_ready()
+        elif time.monotonic() - self._last_sent >= self.min_interval:
+            self._edit()
+
+    def finish(self) -> None:
+        """
+        Sends the final edit if any appended text has not been sent yet.
+        """
+        if not self._started:
+            self._start_if_ready()
+        elif self._pending:
+            self._edit()
+
+    def _start_if_ready(self) -> None:
+        """
+        Starts the continuation message once it has visible content,
+        since Discord rejects empty messages.
+        """
+        if self.content.strip():
+            self.start()
+
+    def _edit(self) -> None:
+        """
+        Replaces the content of the message with the current content.
+        """
+        self._last_sent = time.monotonic()
+        self._pending = False
+        DCBotWebSocket.send(json.dumps({
+            'channel_id': self.channel_id,
+            'message': self.content,
+            'message_key': self.message_key,
+            'edit': True,
+        }))
+
+    def _roll_over(self) -> None:
+        """
+        Freezes the current message at the Discord limit, preferably on
+        a line break, and continues the overflow in a new message.
+        """
+        cut = self.content.rfind('\n', 0, DISCORD_MESSAGE_LIMIT)
+        if cut <= 0:
+            cut = DISCORD_MESSAGE_LIMIT
+        overflow = self.content[cut:].lstrip('\n')
+        self.content = self.content[:cut]
+        if self._started:
+            self._edit()
+        else:
+            self.start()
+
+        logger.debug('message %s is full, continuing in a new message',
+                     self.message_key)
+        self.content = overflow
+        self.message_key = uuid.uuid4().hex
+        self._started = False
+        self._start_if_ready()
@@ -0,0 +1,157 @@
+""" Local triage that decides which anomalies are worth an LLM analysis """
+
+import re
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from flaskr.detector import AnomalyDetector
+from flaskr.rules import ABNORMAL_RULES
+
+# --- logger
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.DEBUG)
+handler = logging.StreamHandler()
+formatter = logging.Formatter(
+    '%(asctime)s %(levelname)s [%(funcName)s]: %(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# 規則的嚴重程度權重，未列出的規則 (例如偏離基準值) 權重為 1
+RULE_WEIGHTS = ABNORMAL_RULES.weights()
+
+# 分數達到此門檻才交給 LLM 分析
+LLM_SCORE_THRESHOLD = 3
+
+# 數值在服務基準值的幾個標準差內，視為該服務的常態
+BASELINE_NORMAL_SIGMA = 2
+# 偏離服務基準值的規則，最多計入的數量
+BASELINE_DEVIATION_MAX_COUNT = 3
+
+# 近期告警紀錄
+HISTORY_WINDOW = timedelta(minutes=30)
+REPEATED_ANALYSIS_PENALTY = 3
+PERSISTENT_ALERT_COUNT = 3
+
+
+class TriageResult:
+    """
+    The outcome of triaging one anomaly.
+
+    Attributes:
+        score (float): The severity score.
+        escalate (bool): Whether the anomaly should be analysed by the LLM.
+        reasons (list[str]): How the score was composed, for logging and templates.
+    """
+
+    def __init__(self, score: float, escalate: bool, reasons: list[str]) -> None:
+        self.score = score
+        self.escalate = escalate
+        self.reasons = reasons
+
+    def __repr__(self) -> str:
+        return f'TriageResult(score={self.score}, escalate={self.escalate})'
+
+
+class Triage:
+    """
+    Scores anomalies of every service by combining the fired rules,
+    the service's own baseline and its recent alert history.
+
+    Only anomalies scoring at least `threshold` should be sent to the LLM,
+    the others can be reported with `format_template`.
+    """
+
+    def __init__(self, detector: AnomalyDetector,
+                 threshold: float = LLM_SCORE_THRESHOLD) -> None:
+        self.detector = detector
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._history: dict[str, deque] = {}
+
+    def evaluate(self, service: str, fired_rules: list[str], metric: dict,
+                 now: datetime = None) -> TriageResult:
+        """
+        Scores an anomaly and records it in the alert history of the service.
+
+        Args:
+            service (str): The key of the service.
+            fired_rules (list[str]): The descriptions of the fired rules.
+            metric (dict): The latest metrics of the service.
+            now (datetime, optional): The time of the anomaly. Defaults to now.
+
+        Returns:
+            TriageResult: The score and whether to escalate to the LLM.
+        """
+        if now is None:
+            now = datetime.now()
+        reasons = []
+        score = 0.0
+
+        # 規則，偏離基準值的規則最多計入 BASELINE_DEVIATION_MAX_COUNT 條
+        deviation_count = 0
+        for rule in fired_rules:
+            key = _rule_metric(rule)
+            weight = RULE_WEIGHTS.get(rule, 1)
+            stats = self.detector.stats(service, key)
+            value = metric.get(key)
+            if rule.endswith('baseline'):
+                deviation_count += 1
+                if deviation_count <= BASELINE_DEVIATION_MAX_COUNT:
+                    reasons.append(f'{rule}: +{weight}')
+                    score += weight
+                continue
+            if stats is not None and value is not None \
+                    and value <= stats[0] + BASELINE_NORMAL_SIGMA * stats[1]:
+                weight /= 2
+                reasons.append(f'{rule}: +{weight} (usual for this service)')
+            else:
+                reasons.append(f'{rule}: +{weight}')
+            score += weight
+
+        # 近期告警紀錄
+        history = self._get_history(service, now)
+        if any(analysed and rules == set(fired_rules) for _, rules, analysed in history):
+            score -= REPEATED_ANALYSIS_PENALTY
+            reasons.append(f'same rules analysed recently: -{REPEATED_ANALYSIS_PENALTY}')
+        elif len(history) >= PERSISTENT_ALERT_COUNT:
+            score += 1
+            reasons.append('persistent alerts: +1')
+
+        escalate = score >= self.threshold
+        history.append((now, set(fired_rules), escalate))
+        logger.debug('triage %s: score=%s escalate=%s reasons=%s',
+                     service, score, escalate, reasons)
+        return TriageResult(score, escalate, reasons)
+
+    def _get_history(self, service: str, now: datetime) -> deque:
+        with self._lock:
+            history = self._history.setdefault(service, deque())
+        while history and now - history[0][0] > HISTORY_WINDOW:
+            history.popleft()
+        return history
+
+
+def format_template(fired_rules: list[str], result: TriageResult) -> str:
+    """
+    Formats the message sent for an anomaly that was not escalated to the LLM.
+
+    Args:
+        fired_rules (list[str]): The descriptions of the fired rules.
+        result (TriageResult): The triage result of the anomaly.
+
+    Returns:
+        str: The message in markdown.
+    """
+    message = f'**輕微異常** (嚴重度 {result.score:g}，未進行 AI 分析)\n'
+    for rule in fired_rules:
+        message += f'- {rule}\n'
+    return message
+
+
+def _rule_metric(rule: str) -> str:
+    """
+    Returns the metric name of a rule description such as 'Request Count (5xx) > 5'.
+    """
+    return re.split(' [<>] ', rule)[0]
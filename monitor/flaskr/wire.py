@@ -0,0 +1,123 @@
+""" Encoding of the messages sent over the dcbot websocket, negotiated on connect """
+
+import json
+import zlib
+import base64
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 二進位訊息第一個 byte 的旗標
+FLAG_ZLIB = 0x01
+FLAG_MSGPACK = 0x02
+# 超過此大小 (bytes) 的訊息才壓縮
+COMPRESS_MIN_BYTES = 256
+COMPRESS_LEVEL = 6
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+ZLIB = 'zlib'
+
+
+def capabilities() -> dict:
+    """
+    Returns the encodings and compressions this side can decode, as offered in the hello.
+
+    Returns:
+        dict: The encodings, preferred first, and the compressions.
+    """
+    return {
+        'encodings': [MSGPACK, JSON] if msgpack is not None else [JSON],
+        'compression': [ZLIB],
+    }
+
+
+class Codec:
+    """
+    Encodes the messages in the format agreed with the bot.
+
+    Plain JSON without compression is sent as text frames, as before the
+    handshake. Any other format is sent as a binary frame whose first byte
+    holds the `FLAG_*` flags. With msgpack, a report is sent as raw bytes
+    in `file` instead of base64 in `file_base64`.
+
+    Attributes:
+        encoding (str): `JSON` or `MSGPACK`.
+        compression (str | None): `ZLIB` or None.
+    """
+
+    def __init__(self, encoding: str = JSON, compression: str = None) -> None:
+        if encoding == MSGPACK and msgpack is None:
+            encoding = JSON
+        self.encoding = encoding
+        self.compression = compression
+
+    @staticmethod
+    def from_welcome(welcome: dict) -> 'Codec':
+        """
+        Creates the codec chosen by the bot, falling back to plain JSON
+        for anything this side does not support.
+
+        Args:
+            welcome (dict): The choice of the bot, e.g. {"encoding": "msgpack", "compression": "zlib"}.
+
+        Returns:
+            Codec: The codec.
+        """
+        encoding = welcome.get('encoding')
+        compression = welcome.get('compression')
+        return Codec(encoding if encoding in capabilities()['encodings'] else JSON,
+                     compression if compression in capabilities()['compression'] else None)
+
+    def encode(self, payload: dict) -> str | bytes:
+        """
+        Encodes a message.
+
+        Args:
+            payload (dict): The message.
+
+        Returns:
+            str | bytes: A text frame, or a binary frame with its flags byte.
+        """
+        if self.encoding == JSON and self.compression is None:
+            return json.dumps(payload)
+        flags = 0
+        if self.encoding == MSGPACK:
+            if 'file_base64' in payload:
+                payload = dict(payload)
+                payload['file'] = base64.b64decode(payload.pop('file_base64'))
+            body = msgpack.packb(payload)
+            flags |= FLAG_MSGPACK
+        else:
+            body = json.dumps(payload).encode()
+        if self.compression == ZLIB and len(body) >= COMPRESS_MIN_BYTES:
+            body = zlib.compress(body, COMPRESS_LEVEL)
+            flags |= FLAG_ZLIB
+        return bytes([flags]) + body
+
+
+def decode(frame: str | bytes) -> dict:
+    """
+    Decodes a text or binary frame.
+
+    Args:
+        frame (str | bytes): The frame.
+
+    Returns:
+        dict: The message.
+
+    Raises:
+        ValueError: If the frame cannot be decoded.
+    """
+    if isinstance(frame, str):
+        return json.loads(frame)
+    flags, body = frame[0], frame[1:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    if flags & FLAG_MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack is not installed')
+        return msgpack.unpackb(body)
+    return json.loads(body)
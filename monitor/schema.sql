@@ -1,4 +1,6 @@
-CREATE TABLE cloud_run_service (
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS cloud_run_service (
   region TEXT NOT NULL,
   project_id TEXT NOT NULL,
   service_name TEXT NOT NULL,
@@ -7,3 +9,39 @@ CREATE TABLE cloud_run_service (
   guild_id TEXT,
   PRIMARY KEY (region, project_id, service_name)
 );
+
+CREATE TABLE IF NOT EXISTS incident (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  region TEXT NOT NULL,
+  project_id TEXT NOT NULL,
+  service_name TEXT NOT NULL,
+  rule TEXT NOT NULL,
+  channel_id TEXT,
+  status TEXT NOT NULL,
+  opened_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  resolved_at TEXT,
+  hit_count INTEGER NOT NULL DEFAULT 1,
+  flap_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS incident_service_rule
+  ON incident (region, project_id, service_name, rule, status);
+
+CREATE TABLE IF NOT EXISTS scaling_decision (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  region TEXT NOT NULL,
+  project_id TEXT NOT NULL,
+  service_name TEXT NOT NULL,
+  decided_at TEXT NOT NULL,
+  action TEXT NOT NULL,
+  cpu_vote REAL,
+  memory_vote REAL,
+  cpu_from INTEGER,
+  cpu_to INTEGER,
+  memory_from INTEGER,
+  memory_to INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS scaling_decision_service
+  ON scaling_decision (region, project_id, service_name, decided_at);
@@ -0,0 +1,40 @@
+import io
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', '..', 'monitor', 'schema.sql')
+
+@pytest.fixture
+def db_module():
+    # 測試模組覆寫此 fixture，指定要替換 get_db 的模組
+    return None
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch, db_module):
+    path = str(tmp_path / 'monitor.db')
+    def get_db():
+        db = sqlite3.connect(path)
+        db.row_factory = sqlite3.Row
+        return db
+    db = get_db()
+    with open(SCHEMA, encoding='utf-8') as f:
+        db.executescript(f.read())
+    db.close()
+    if db_module is not None:
+        monkeypatch.setattr(db_module, 'get_db', get_db)
+    return get_db
+
+def _make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_ref:
+        for name, content in members.items():
+            zip_ref.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+@pytest.fixture
+def make_zip():
+    return _make_zip
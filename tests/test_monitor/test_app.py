@@ -0,0 +1,53 @@
+from unittest.mock import Mock
+
+import pytest
+
+import flaskr
+from flaskr import dcbot
+from flaskr.dcbot_websocket import DCBotWebSocket
+
+SERVICES_URL = '/dcbot/guilds/g/channels/c/cloud_run_services'
+
+@pytest.fixture
+def db_module():
+    return dcbot
+
+@pytest.fixture
+def client(temp_db, monkeypatch):
+    monkeypatch.setattr(dcbot.engine, 'poke', Mock())
+    monkeypatch.setattr(DCBotWebSocket, 'connect_dcbot', Mock())
+    monkeypatch.setattr(flaskr, 'MONITOR_ENGINE', 'external')
+    return flaskr.create_app().test_client()
+
+def service(name):
+    return {'region': 'region', 'project_id': 'project', 'service_name': name}
+
+def test_bulk_register_route(client):
+    response = client.post(SERVICES_URL, json={'services': [service('a'), service('a')]})
+    assert response.status_code == 200
+    assert [result['status'] for result in response.get_json()['results']] == [201, 400]
+    assert len(client.get(SERVICES_URL).get_json()) == 1
+
+def test_bulk_unregister_route(client):
+    client.post(SERVICES_URL, json={'services': [service('a')]})
+    response = client.delete(SERVICES_URL, json={'services': [service('a'), service('b')]})
+    assert [result['status'] for result in response.get_json()['results']] == [200, 404]
+    assert client.get(SERVICES_URL).get_json() == []
+
+def test_bulk_routes_require_a_list_of_services(client):
+    assert client.post(SERVICES_URL, json={'services': 'a'}).status_code == 400
+    assert client.delete(SERVICES_URL, data='not json').status_code == 400
+
+def upload_zip(client, make_zip, members):
+    return client.post('/gen', data={'file': (make_zip(members), 'metrics.zip'), 'channel_id': '1',
+                                     'original_response_id': '2'})
+
+def test_gen_rejects_unreadable_csv(client, make_zip):
+    response = upload_zip(client, make_zip, {'cpu.csv': b'\xff\xfe\x00bad'})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'invalid csv file'
+
+def test_gen_rejects_large_csv(client, make_zip, monkeypatch):
+    monkeypatch.setattr(dcbot, 'GEN_MAX_CSV_BYTES', 10)
+    response = upload_zip(client, make_zip, {'cpu.csv': 'Time,CPU\n' * 10})
+    assert response.status_code == 400
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from flaskr.autoscaler import AutoscalingController, COOLDOWN
+from flaskr.genAI.cloud import step_on_grid, CPU_GRID, MEMORY_GRID
+
+NOW = datetime(2024, 1, 1)
+
+def feed(controller, votes, start=0, now=NOW):
+    times = list(range(start, start + len(votes)))
+    return controller.decide(times, votes, [0] * len(votes), now=now)
+
+def test_waits_for_full_window():
+    controller = AutoscalingController(window=3)
+    assert not feed(controller, [1, 1]).should_scale
+    assert feed(controller, [1], start=2).cpu == 1
+
+def test_single_sample_does_not_scale():
+    controller = AutoscalingController(window=4)
+    decision = feed(controller, [0, 0, 0, 1])
+    assert decision.cpu == 0
+
+def test_scale_down_needs_stronger_votes():
+    controller = AutoscalingController(window=4, up_threshold=0.5, down_threshold=1.0)
+    assert feed(controller, [1, 1, 0, 0]).cpu == 1
+    controller = AutoscalingController(window=4, up_threshold=0.5, down_threshold=1.0)
+    assert feed(controller, [-1, -1, -1, 0]).cpu == 0
+    assert feed(controller, [-1, -1, -1, -1], start=4).cpu == -1
+
+def test_overlapping_rows_are_fed_once():
+    controller = AutoscalingController(window=3)
+    feed(controller, [1, 1])
+    assert not feed(controller, [1, 1]).should_scale
+
+def test_cooldown_after_change():
+    controller = AutoscalingController(window=2, up_dwell=timedelta(minutes=5),
+                                       down_dwell=timedelta(minutes=30))
+    controller.changed(NOW)
+
+    decision = feed(controller, [1, 1], now=NOW + timedelta(minutes=1))
+    assert decision.reason == COOLDOWN
+    assert not decision.should_scale
+    assert feed(controller, [1], start=2, now=NOW + timedelta(minutes=2)).repeated
+
+    assert feed(controller, [1], start=3, now=NOW + timedelta(minutes=6)).should_scale
+    assert feed(controller, [-1, -1], start=4, now=NOW + timedelta(minutes=6)).reason == COOLDOWN
+
+def test_step_on_grid():
+    assert step_on_grid(4, CPU_GRID, 1) == 6
+    assert step_on_grid(8, CPU_GRID, 1) == 8
+    assert step_on_grid(1, CPU_GRID, -1) == 1
+    assert step_on_grid(3, CPU_GRID, -1) == 2
+    assert step_on_grid(1536, MEMORY_GRID, 1) == 2048
+    assert step_on_grid(1024, MEMORY_GRID, 0) == 1024
+
+def test_predicted_peak_scales_up_ahead():
+    controller = AutoscalingController(window=2)
+    decision = controller.decide([0, 1], [0, 0], [0, 0], now=NOW, ahead=(1, 0))
+    assert decision.should_scale
+    assert decision.predicted
+    assert (decision.cpu, decision.memory) == (1, 0)
+
+    controller.changed(NOW)
+    decision = controller.decide([2, 3], [0, 0], [0, 0], now=NOW + timedelta(minutes=1), ahead=(1, 0))
+    assert decision.reason == COOLDOWN
@@ -157,4 +157,42 @@ class TestCloudRunResource:
 
         assert resource.value == 10
         parent.init_resource.assert_called_once()
-        parent.update_resouce.assert_called_once()
\ No newline at end of file
+        parent.update_resouce.assert_called_once()
+
+class TestCloudRunResourceManagerPlan:
+    @pytest.fixture
+    def manager(self, mock_run_services_client, monkeypatch):
+        cloud_run = CloudRun(region='test-region', project_id='test-project-id', service_name='test-service')
+        manager = CloudRunResourceManager(cloud_run)
+        monkeypatch.setattr(manager, 'get_resource', lambda: {'cpu': '2000m', 'memory': '1Gi'})
+        return manager
+
+    def test_plan_scales_both(self, manager):
+        assert manager.plan(cpu=1, memory=1) == (4, 2048)
+
+    def test_plan_drops_step_out_of_range(self, manager):
+        assert manager.plan(cpu=-1, memory=-1) == (1, 512)
+        manager.cpu.value = 8
+        assert manager.plan(cpu=1) == (8, 4096)
+
+    def test_apply_plan_updates_once(self, manager, monkeypatch):
+        update = MagicMock()
+        monkeypatch.setattr(manager, 'update_resouce', update)
+
+        assert manager.apply_plan(cpu=1, memory=1)
+
+        update.assert_called_once()
+        assert (manager.cpu.value, manager.memory.value) == (4, 2048)
+
+    def test_apply_plan_reverts_on_failure(self, manager, monkeypatch):
+        monkeypatch.setattr(manager, 'update_resouce', MagicMock(side_effect=Exception()))
+
+        assert not manager.apply_plan(cpu=1)
+        assert (manager.cpu.value, manager.memory.value) == (2, 1024)
+
+    def test_apply_plan_without_change(self, manager, monkeypatch):
+        update = MagicMock()
+        monkeypatch.setattr(manager, 'update_resouce', update)
+
+        assert not manager.apply_plan()
+        update.assert_not_called()
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from flaskr import coalesce
+from flaskr.coalesce import NotificationCoalescer, pack_messages
+
+@pytest.fixture
+def sent(monkeypatch):
+    messages = []
+    monkeypatch.setattr(coalesce.DCBotWebSocket, 'send',
+                        lambda message: messages.append(json.loads(message)))
+    return messages
+
+def test_notifications_of_a_channel_are_merged(sent):
+    coalescer = NotificationCoalescer(window=60)
+    coalescer.post('c1', 'CPU up', header='svc a\n')
+    coalescer.post('c1', 'Memory up', header='svc a\n')
+    coalescer.post('c1', 'recovered', header='svc b\n')
+    coalescer.post('c2', 'other')
+    assert sent == []
+
+    assert coalescer.flush('c1') == 1
+    assert sent == [{'channel_id': 'c1', 'message': 'svc a\nCPU up\nMemory up\n\nsvc b\nrecovered',
+                     'priority': coalesce.PRIORITY_NOTICE}]
+
+def test_merged_message_takes_highest_priority(sent):
+    coalescer = NotificationCoalescer(window=60)
+    coalescer.post('c1', 'CPU up')
+    coalescer.post('c1', 'alert', priority=coalesce.PRIORITY_ALERT)
+    coalescer.flush('c1')
+    assert sent[0]['priority'] == coalesce.PRIORITY_ALERT
+
+def test_flush_raises_priority(sent):
+    coalescer = NotificationCoalescer(window=60)
+    coalescer.post('c1', 'CPU up')
+    coalescer.flush('c1', priority=coalesce.PRIORITY_ALERT)
+    assert sent[0]['priority'] == coalesce.PRIORITY_ALERT
+
+def test_urgent_notification_flushes_at_once(sent):
+    coalescer = NotificationCoalescer(window=60)
+    coalescer.post('c1', 'CPU up')
+    coalescer.post('c1', 'failed', urgent=True)
+    assert [message['message'] for message in sent] == ['CPU up\nfailed']
+    assert coalescer.flush('c1') == 0
+
+def test_window_flushes_by_timer(sent):
+    coalescer = NotificationCoalescer(window=0.1)
+    coalescer.post('c1', 'a')
+    timer = coalescer._channels['c1'].timer
+    assert sent == []
+    timer.join()
+    assert [message['message'] for message in sent] == ['a']
+
+def test_pack_messages_respects_limit():
+    assert pack_messages(['a' * 6, 'b' * 6], limit=10) == ['a' * 6, 'b' * 6]
+    assert pack_messages(['a' * 3, 'b' * 3], limit=10) == ['aaa\n\nbbb']
+
+def test_pack_messages_splits_long_section_on_lines():
+    assert pack_messages(['1234\n5678\n90'], limit=9) == ['1234', '5678\n90']
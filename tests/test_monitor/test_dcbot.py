@@ -1,7 +1,12 @@
 import pytest
 from unittest.mock import Mock, patch
 import pandas as pd
-from flaskr.dcbot import check_metrics_abnormalities, polling_metric, get_lastest_llm_query_time
+from flask import Flask
+from flaskr import dcbot
+from flaskr.dcbot import check_metrics_abnormalities, find_metrics_abnormalities, polling_metric, get_lastest_llm_query_time
+from flaskr.dcbot import parse_services, apply_scaling, get_alert_headline, query, read_zip_csvs
+from flaskr.genAI.cloud import CloudRun
+
 
 def test_empty_metrics_list():
     assert check_metrics_abnormalities([]) == False
@@ -36,6 +41,16 @@ def test_cpu_memory_utilization_abnormal():
     ]
     assert check_metrics_abnormalities(metrics) == True
 
+def test_find_metrics_abnormalities_lists_fired_rules():
+    metrics = [
+        {'Container CPU Utilization (%)': 70, 'Request Count (5xx)': 0},
+        {'Container CPU Utilization (%)': 70, 'Request Count (5xx)': 6}
+    ]
+    assert find_metrics_abnormalities(metrics) == [
+        'Request Count (5xx) > 5',
+        'Container CPU Utilization (%) > 60'
+    ]
+
 def mock_get_metric(*arg, **kargs):
     return pd.DataFrame([
         {'Container Startup Latency (ms)': 10},
@@ -98,4 +113,110 @@ def test_polling_metric_empty():
     cursor.execute.assert_called_once()
 
     # 檢查是否有呼叫過 cursor.close()
-    cursor.close.assert_called_once()
\ No newline at end of file
+    cursor.close.assert_called_once()
+
+def test_read_zip_csvs_reads_csv_members_in_memory(make_zip):
+    buffer = make_zip({'cpu.csv': 'Time,CPU\n2024-01-01 00:00:00,1\n',
+                       'notes.txt': 'ignored', 'dir/': ''})
+    data_frames = read_zip_csvs(buffer)
+    assert len(data_frames) == 1
+    assert list(data_frames[0].columns) == ['Time', 'CPU']
+
+def test_read_zip_csvs_skips_macos_resource_forks(make_zip):
+    buffer = make_zip({'cpu.csv': 'Time,CPU\n', '__MACOSX/._cpu.csv': b'\x00\x05\x16\x07\xff'})
+    assert len(read_zip_csvs(buffer)) == 1
+
+def test_read_zip_csvs_checks_decompressed_size(monkeypatch, make_zip):
+    monkeypatch.setattr(dcbot, 'GEN_MAX_CSV_BYTES', 10)
+    with pytest.raises(ValueError):
+        read_zip_csvs(make_zip({'cpu.csv': 'Time,CPU\n' * 10}))
+
+@pytest.fixture
+def db_module():
+    return dcbot
+
+@pytest.fixture
+def registry(temp_db, monkeypatch):
+    poke = Mock()
+    monkeypatch.setattr(dcbot.engine, 'poke', poke)
+    with Flask(__name__).app_context():
+        yield dcbot, temp_db, poke
+
+def service(name):
+    return {'region': 'region', 'project_id': 'project', 'service_name': name}
+
+def test_bulk_register_reports_each_service(registry):
+    dcbot, get_db, poke = registry
+    response, status = dcbot.register_cloud_run_services(
+        'g', 'c', [service('a'), service('b'), service('a'), {'region': 'region'}])
+    assert status == 200
+    assert [result['status'] for result in response.get_json()['results']] == [201, 201, 400, 400]
+    assert len(get_db().execute('SELECT * FROM cloud_run_service').fetchall()) == 2
+    poke.assert_called_once()
+
+def test_bulk_unregister_reports_missing_services(registry):
+    dcbot, get_db, poke = registry
+    dcbot.register_cloud_run_services('g', 'c', [service('a')])
+    response, _ = dcbot.unregister_cloud_run_services('g', 'c', [service('a'), service('b')])
+    assert [result['status'] for result in response.get_json()['results']] == [200, 404]
+    assert get_db().execute('SELECT * FROM cloud_run_service').fetchall() == []
+
+def test_parse_services_requires_a_list():
+    assert parse_services({'services': [service('a')]}) == [service('a')]
+    assert parse_services({'services': 'a'}) is None
+    assert parse_services(None) is None
+
+def scaling_mocks(operation):
+    crm = Mock()
+    crm.apply_plan.return_value = operation
+    decision = Mock(cpu=1, memory=0, predicted=False)
+    return crm, Mock(), decision, Mock()
+
+def test_rejected_scaling_is_reported_and_not_recorded():
+    crm, controller, decision, notify = scaling_mocks(None)
+    with patch('flaskr.dcbot.record_scaling_decision') as record:
+        assert apply_scaling(crm, controller, decision, (1, 512), (2, 512), notify) is None
+    notify.assert_called_once_with(False)
+    controller.changed.assert_not_called()
+    record.assert_not_called()
+
+def test_accepted_scaling_is_recorded():
+    operation = Mock()
+    crm, controller, decision, notify = scaling_mocks(operation)
+    with patch('flaskr.dcbot.record_scaling_decision') as record:
+        assert apply_scaling(crm, controller, decision, (1, 512), (2, 512), notify) is operation
+    notify.assert_not_called()
+    controller.changed.assert_called_once()
+    record.assert_called_once()
+
+def test_alert_headline_only_uses_cached_specs():
+    specs = Mock()
+    specs.peek.return_value = None
+    with patch('flaskr.dcbot.service_specs', specs):
+        headline = get_alert_headline(CloudRun('region', 'project', 'a'), ['a > 1'], {})
+    specs.get.assert_not_called()
+    assert 'limits' not in headline
+
+def test_analysis_runs_without_logs_when_reading_them_fails(monkeypatch):
+    metrics = pd.DataFrame([{'Request Count (5xx)': 6}], index=[pd.Timestamp('2024-01-01')])
+    monkeypatch.setattr(dcbot, 'CloudRunPerformanceMonitor', Mock())
+    monkeypatch.setattr(dcbot, 'polling_metric', Mock(return_value=metrics))
+    monkeypatch.setattr(dcbot, 'forecaster', Mock())
+    monkeypatch.setattr(dcbot, 'detector', Mock(update=Mock(return_value={})))
+    monkeypatch.setattr(dcbot, 'update_incidents', Mock(return_value=Mock(resolved=[], opened=['x'])))
+    monkeypatch.setattr(dcbot, 'triage', Mock(evaluate=Mock(return_value=Mock(escalate=True))))
+    monkeypatch.setattr(dcbot, 'get_alert_headline', Mock(return_value='headline'))
+    monkeypatch.setattr(dcbot, 'notifications', Mock())
+    monkeypatch.setattr(dcbot, 'set_lastest_llm_query_time', Mock())
+    monkeypatch.setattr(dcbot, 'log_buffers', Mock(read=Mock(side_effect=TimeoutError('batch'))))
+    gen_stream = Mock(return_value=iter(['analysis']))
+    monkeypatch.setattr(dcbot.LLM.AnalysisError, 'gen_stream', gen_stream)
+    stream = Mock()
+    monkeypatch.setattr(dcbot, 'StreamingMessage', Mock(return_value=stream))
+    monkeypatch.setattr(dcbot, 'rollouts', Mock(in_progress=Mock(return_value=True)))
+
+    query(CloudRun('region', 'project', 'a'), '1')
+
+    assert '沒有 log' in gen_stream.call_args.kwargs['data']
+    stream.append.assert_called_once_with('analysis')
+    stream.finish.assert_called_once()
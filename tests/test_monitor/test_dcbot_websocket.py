@@ -0,0 +1,154 @@
+import json
+from collections import deque, OrderedDict
+from unittest.mock import MagicMock
+
+import pytest
+from websocket import WebSocketConnectionClosedException
+
+from flaskr import dcbot_websocket, wire
+from flaskr.dcbot_websocket import DCBotWebSocket
+
+@pytest.fixture(autouse=True)
+def socket(monkeypatch):
+    ws = MagicMock()
+    monkeypatch.setattr(DCBotWebSocket, '_ws', ws)
+    monkeypatch.setattr(DCBotWebSocket, '_queue', deque())
+    monkeypatch.setattr(DCBotWebSocket, '_inflight', OrderedDict())
+    monkeypatch.setattr(DCBotWebSocket, '_stats', dict.fromkeys(DCBotWebSocket._stats, 0))
+    DCBotWebSocket._connected.set()
+    yield ws
+    DCBotWebSocket._connected.clear()
+
+def message(text):
+    return json.dumps({'channel_id': '1', 'message': text})
+
+def sent_frames(socket):
+    return [json.loads(call.args[0]) for call in socket.send.call_args_list]
+
+def send_all():
+    while DCBotWebSocket._send_next():
+        pass
+
+def test_send_only_queues(socket):
+    assert DCBotWebSocket.send(message('a'))
+    socket.send.assert_not_called()
+    assert DCBotWebSocket.stats()['pending'] == 1
+
+def test_messages_are_sent_in_order_with_ids(socket):
+    DCBotWebSocket.send(message('a'))
+    DCBotWebSocket.send(message('b'))
+    send_all()
+    frames = sent_frames(socket)
+    assert [frame['message'] for frame in frames] == ['a', 'b']
+    assert frames[0]['id'] != frames[1]['id']
+    assert DCBotWebSocket.stats()['inflight'] == 2
+
+def test_ack_completes_message(socket):
+    DCBotWebSocket.send(message('a'))
+    send_all()
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[0]['id']}))
+    stats = DCBotWebSocket.stats()
+    assert stats['inflight'] == 0 and stats['acked'] == 1
+
+def test_retryable_nack_resends_only_that_message(socket):
+    DCBotWebSocket.send(message('a'))
+    DCBotWebSocket.send(message('b'))
+    send_all()
+    first, second = sent_frames(socket)
+    DCBotWebSocket._handle_reply(json.dumps({'ack': second['id']}))
+    DCBotWebSocket._handle_reply(json.dumps({'nack': first['id'], 'code': 'send_failed', 'retry': True}))
+    send_all()
+    assert [frame['message'] for frame in sent_frames(socket)] == ['a', 'b', 'a']
+    assert DCBotWebSocket.stats()['retransmitted'] == 1
+
+def test_permanent_nack_rejects_message(socket):
+    DCBotWebSocket.send(message('a'))
+    send_all()
+    DCBotWebSocket._handle_reply(json.dumps({'nack': sent_frames(socket)[0]['id'],
+                                             'code': 'forbidden', 'retry': False}))
+    send_all()
+    assert len(sent_frames(socket)) == 1
+    assert DCBotWebSocket.stats()['rejected'] == 1
+
+def test_window_limits_inflight_messages(socket, monkeypatch):
+    monkeypatch.setattr(dcbot_websocket, 'DCBOT_WINDOW', 2)
+    for text in 'abc':
+        DCBotWebSocket.send(message(text))
+    send_all()
+    assert len(sent_frames(socket)) == 2
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[0]['id']}))
+    send_all()
+    assert len(sent_frames(socket)) == 3
+
+def test_edits_wait_for_the_ack_of_their_message(socket):
+    DCBotWebSocket.send(json.dumps({'channel_id': '1', 'message': 'head', 'message_key': 'k'}))
+    DCBotWebSocket.send(json.dumps({'channel_id': '1', 'message': 'edit', 'message_key': 'k',
+                                    'edit': True}))
+    DCBotWebSocket.send(message('other'))
+    send_all()
+    assert [frame['message'] for frame in sent_frames(socket)] == ['head', 'other']
+
+    DCBotWebSocket._handle_reply(json.dumps({'nack': sent_frames(socket)[0]['id'],
+                                             'code': 'send_failed', 'retry': True}))
+    send_all()
+    assert [frame['message'] for frame in sent_frames(socket)] == ['head', 'other', 'head']
+
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[2]['id']}))
+    send_all()
+    assert sent_frames(socket)[-1]['message'] == 'edit'
+
+def test_resent_edit_never_overwrites_a_newer_one(socket):
+    DCBotWebSocket.send(json.dumps({'channel_id': '1', 'message': 'head', 'message_key': 'k'}))
+    send_all()
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[0]['id']}))
+    for text in ('edit 1', 'edit 2'):
+        DCBotWebSocket.send(json.dumps({'channel_id': '1', 'message': text, 'message_key': 'k',
+                                        'edit': True}))
+    send_all()
+    # edit 2 waits, so it cannot be acked before edit 1 is nacked
+    assert [frame['message'] for frame in sent_frames(socket)] == ['head', 'edit 1']
+
+    DCBotWebSocket._handle_reply(json.dumps({'nack': sent_frames(socket)[1]['id'],
+                                             'code': 'send_failed', 'retry': True}))
+    send_all()
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[2]['id']}))
+    send_all()
+    DCBotWebSocket._handle_reply(json.dumps({'ack': sent_frames(socket)[3]['id']}))
+    send_all()
+    assert [frame['message'] for frame in sent_frames(socket)] == ['head', 'edit 1', 'edit 1', 'edit 2']
+    assert DCBotWebSocket.stats()['inflight'] == 0
+
+def test_unacked_message_is_resent_after_timeout(socket, monkeypatch):
+    monkeypatch.setattr(dcbot_websocket, 'DCBOT_ACK_TIMEOUT', 0)
+    DCBotWebSocket.send(message('a'))
+    send_all()
+    DCBotWebSocket._requeue_expired()
+    send_all()
+    assert [frame['message'] for frame in sent_frames(socket)] == ['a', 'a']
+
+def test_failed_message_stays_queued(socket):
+    socket.send.side_effect = WebSocketConnectionClosedException('closed')
+    DCBotWebSocket.send(message('a'))
+    assert not DCBotWebSocket._send_next()
+
+    stats = DCBotWebSocket.stats()
+    assert stats['pending'] == 1 and stats['failed'] == 1 and stats['inflight'] == 0
+    assert not stats['connected']
+    socket.close.assert_called_once()
+
+def test_welcome_switches_encoding(socket, monkeypatch):
+    monkeypatch.setattr(DCBotWebSocket, '_codec', DCBotWebSocket._codec)
+    DCBotWebSocket._handle_reply(json.dumps({'welcome': {'encoding': 'json', 'compression': 'zlib'}}))
+    DCBotWebSocket.send(json.dumps({'channel_id': '1', 'message': 'x' * 1000}))
+    send_all()
+    data = socket.send.call_args.args[0]
+    assert isinstance(data, bytes)
+    assert wire.decode(data)['message'] == 'x' * 1000
+
+def test_oldest_message_is_dropped_when_full(socket, monkeypatch):
+    monkeypatch.setattr(dcbot_websocket, 'DCBOT_QUEUE_SIZE', 2)
+    DCBotWebSocket.send(message('a'))
+    DCBotWebSocket.send(message('b'))
+    assert not DCBotWebSocket.send(message('c'))
+    assert [frame.payload['message'] for frame in DCBotWebSocket._queue] == ['b', 'c']
+    assert DCBotWebSocket.stats()['dropped'] == 1
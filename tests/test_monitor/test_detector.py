@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from flaskr.detector import AnomalyDetector, EwmaState, deviation_rules, EWMA_MIN_SAMPLES
+
+def get_times(count, start=0):
+    now = datetime(2024, 1, 1)
+    return [now + timedelta(minutes=i) for i in range(start, start + count)]
+
+def test_ewma_state_tracks_mean():
+    state = EwmaState()
+    for _ in range(100):
+        state.update(50)
+    assert state.mean == 50
+    assert state.var == 0
+
+def test_ewma_state_warms_up():
+    state = EwmaState()
+    state.update(50)
+    assert state.z_score(100) is None
+
+def test_no_deviation_for_steady_metric():
+    detector = AnomalyDetector()
+    metrics = [{'Request Latency (ms)': 100}] * 30
+    assert detector.update('svc', get_times(30), metrics) == {}
+
+def test_deviation_relative_to_service_baseline():
+    detector = AnomalyDetector()
+    detector.update('busy', get_times(30), [{'Request Latency (ms)': 1000}] * 30)
+    detector.update('idle', get_times(30), [{'Request Latency (ms)': 10}] * 30)
+
+    assert detector.update('busy', get_times(1, 30), [{'Request Latency (ms)': 1050}]) == {}
+    assert 'Request Latency (ms)' in detector.update('idle', get_times(1, 30), [{'Request Latency (ms)': 1050}])
+
+def test_downward_deviation_only_for_selected_metrics():
+    detector = AnomalyDetector()
+    detector.update('svc', get_times(30), [{'Request Count (2xx)': 100, 'Request Latency (ms)': 100}] * 30)
+    deviations = detector.update('svc', get_times(1, 30), [{'Request Count (2xx)': 0, 'Request Latency (ms)': 0}])
+
+    assert list(deviations) == ['Request Count (2xx)']
+    assert deviation_rules(deviations) == ['Request Count (2xx) < baseline']
+
+def test_rows_already_seen_are_skipped():
+    detector = AnomalyDetector()
+    times = get_times(EWMA_MIN_SAMPLES)
+    detector.update('svc', times, [{'a': 1}] * EWMA_MIN_SAMPLES)
+    detector.update('svc', times, [{'a': 1}] * EWMA_MIN_SAMPLES)
+    assert detector._get_state('svc').metrics['a'].count == EWMA_MIN_SAMPLES
+
+def test_stats_during_warm_up():
+    detector = AnomalyDetector()
+    detector.update('svc', get_times(1), [{'a': 1}])
+    assert detector.stats('svc', 'a') is None
+    assert detector.stats('svc', 'b') is None
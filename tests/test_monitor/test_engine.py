@@ -0,0 +1,103 @@
+import threading
+
+from flaskr.genAI.cloud import CloudRun
+from flaskr import engine as engine_module
+from flaskr.engine import MonitoringEngine
+
+def make_services(*names, channel_id='1'):
+    services = {}
+    for name in names:
+        cr = CloudRun('region', 'project', name)
+        services[cr.get_full_service_name()] = (cr, channel_id)
+    return services
+
+class FakeTable:
+    def __init__(self, services):
+        self.services = services
+
+    def __call__(self):
+        return self.services
+
+def recording_poll():
+    calls, polled = [], threading.Event()
+    def poll(cr, channel_id):
+        calls.append((cr.service_name, channel_id))
+        polled.set()
+    return poll, calls, polled
+
+def test_new_services_are_polled():
+    poll, calls, polled = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=3600, services=FakeTable(make_services('a')))
+    started, stopped = engine.reconcile()
+    polled.wait(1)
+    assert len(started) == 1 and stopped == []
+    assert calls == [('a', '1')]
+
+def test_unregistered_services_are_stopped():
+    table = FakeTable(make_services('a', 'b'))
+    poll, _, _ = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=3600, services=table)
+    engine.reconcile()
+    table.services = make_services('a')
+    started, stopped = engine.reconcile()
+    assert started == [] and len(stopped) == 1
+    assert engine.running() == list(make_services('a'))
+
+def test_reconcile_does_not_start_a_second_poller():
+    poll, calls, polled = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=3600, services=FakeTable(make_services('a')))
+    engine.reconcile()
+    polled.wait(1)
+    assert engine.reconcile() == ([], [])
+    assert len(calls) == 1
+
+def test_stale_timer_of_a_reregistered_service_stops():
+    table = FakeTable(make_services('a'))
+    poll, calls, polled = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=3600, services=table)
+    engine.reconcile()
+    polled.wait(1)
+    table.services = {}
+    engine.reconcile()
+    polled.clear()
+    table.services = make_services('a')
+    engine.reconcile()
+    polled.wait(1)
+    key = next(iter(make_services('a')))
+    engine._run(key, 1)
+    assert len(calls) == 2
+
+def test_moved_service_reports_to_the_new_channel():
+    table = FakeTable(make_services('a'))
+    poll, calls, _ = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=3600, services=table)
+    engine.reconcile()
+    table.services = make_services('a', channel_id='2')
+    engine.reconcile()
+    engine._run(next(iter(table.services)), 1)
+    assert calls[-1] == ('a', '2')
+
+def test_first_polls_of_services_started_together_are_staggered(monkeypatch):
+    delays = []
+    class Timer:
+        def __init__(self, interval, function, args=None):
+            delays.append(interval)
+            self.daemon = False
+        def start(self):
+            pass
+    monkeypatch.setattr(engine_module.threading, 'Timer', Timer)
+    poll, _, _ = recording_poll()
+    engine = MonitoringEngine(poll, poll_interval=30, services=FakeTable(make_services('a', 'b', 'c')))
+    engine.reconcile()
+    assert delays == [0, 10, 20]
+
+def test_poke_only_reconciles_a_started_engine():
+    table = FakeTable(make_services('a'))
+    poll, _, _ = recording_poll()
+    engine = MonitoringEngine(poll, interval=3600, poll_interval=3600, services=table)
+    engine.poke()
+    assert engine.running() == []
+    engine.start()
+    table.services = make_services('a', 'b')
+    engine.poke()
+    assert len(engine.running()) == 2
@@ -0,0 +1,44 @@
+import numpy as np
+
+from flaskr.forecast import SeasonalForecaster, Forecaster, same_time_baseline
+
+SEASON = 24
+
+def seasonal(n, peak=80):
+    t = np.arange(n)
+    return 30 + (peak - 30) * (np.sin(2 * np.pi * t / SEASON) > 0.9)
+
+def test_not_enough_history():
+    forecaster = SeasonalForecaster(SEASON)
+    forecaster.update(1.0)
+    assert forecaster.forecast(5) is None
+
+def test_same_time_baseline():
+    values = np.array([1, 2, 3, 4, 11, 12, 13, 14], dtype=float)
+    # the values one season ago, shifted by the 10 the series moved up since then
+    assert same_time_baseline(values, season=4, horizon=2).tolist() == [21, 22]
+    assert same_time_baseline(values[:7], season=4, horizon=1).tolist() == [14]
+    assert same_time_baseline(values[:5], season=4, horizon=2) is None
+
+def test_holt_winters_follows_season():
+    forecaster = SeasonalForecaster(SEASON)
+    values = seasonal(SEASON * 5)
+    for value in values:
+        forecaster.update(value)
+
+    assert forecaster.fitted
+    forecast = forecaster.forecast(SEASON)
+    expected = seasonal(SEASON * 6)[SEASON * 5:]
+    assert np.abs(forecast - expected).mean() < 5
+
+def test_prescale_steps_before_peak():
+    forecaster = Forecaster(season=SEASON, horizon=6)
+    values = seasonal(SEASON * 4)
+    peak = int(np.argmax(values[SEASON * 3:] > 50)) + SEASON * 3
+    times = list(range(peak - 3))
+    forecaster.update('service', times, [
+        {'Container CPU Utilization (%)': v, 'Container Memory Utilization (%)': 20.0}
+        for v in values[:peak - 3]])
+
+    assert forecaster.prescale_steps('service') == (1, 0)
+    assert forecaster.prescale_steps('other') == (0, 0)
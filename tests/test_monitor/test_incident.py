@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+import pytest
+
+from flaskr import incident
+from flaskr.genAI.cloud import CloudRun
+
+@pytest.fixture
+def db_module():
+    return incident
+
+@pytest.fixture
+def cr():
+    return CloudRun('us-central1', 'project', 'service')
+
+def test_new_rule_opens_incident(temp_db, cr):
+    changes = incident.update_incidents(cr, '1', ['a > 1'], now=datetime(2024, 1, 1))
+    assert changes.opened == ['a > 1']
+    assert changes.updated == []
+
+def test_repeated_rule_updates_incident(temp_db, cr):
+    now = datetime(2024, 1, 1)
+    incident.update_incidents(cr, '1', ['a > 1'], now=now)
+    changes = incident.update_incidents(cr, '1', ['a > 1', 'b > 1'], now=now + timedelta(seconds=30))
+
+    assert changes.opened == ['b > 1']
+    assert changes.updated == ['a > 1']
+    rows = incident.list_incidents('1', now)
+    assert [row['hit_count'] for row in rows if row['rule'] == 'a > 1'] == [2]
+
+def test_quiet_rule_resolves_incident(temp_db, cr):
+    now = datetime(2024, 1, 1)
+    incident.update_incidents(cr, '1', ['a > 1'], now=now)
+
+    assert incident.update_incidents(cr, '1', [], now=now + timedelta(minutes=1)).resolved == []
+    assert incident.update_incidents(cr, '1', [], now=now + incident.RESOLVE_AFTER).resolved == ['a > 1']
+
+def test_flapping_rule_reopens_incident(temp_db, cr):
+    now = datetime(2024, 1, 1)
+    incident.update_incidents(cr, '1', ['a > 1'], now=now)
+    incident.update_incidents(cr, '1', [], now=now + incident.RESOLVE_AFTER)
+
+    changes = incident.update_incidents(cr, '1', ['a > 1'], now=now + incident.RESOLVE_AFTER * 2)
+    assert changes.opened == []
+    assert changes.updated == ['a > 1']
+
+    rows = incident.list_incidents('1', now)
+    assert len(rows) == 1
+    assert rows[0]['flap_count'] == 1
+
+def test_rule_after_reopen_window_opens_new_incident(temp_db, cr):
+    now = datetime(2024, 1, 1)
+    incident.update_incidents(cr, '1', ['a > 1'], now=now)
+    incident.update_incidents(cr, '1', [], now=now + incident.RESOLVE_AFTER)
+
+    later = now + incident.RESOLVE_AFTER + incident.REOPEN_WINDOW + timedelta(minutes=1)
+    assert incident.update_incidents(cr, '1', ['a > 1'], now=later).opened == ['a > 1']
+
+def test_format_digest(temp_db, cr):
+    now = datetime(2024, 1, 1)
+    incident.update_incidents(cr, '1', ['a > 1'], now=now)
+    digest = incident.format_digest(incident.list_incidents('1', now))
+    assert 'service' in digest
+    assert 'a > 1' in digest
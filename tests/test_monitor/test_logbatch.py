@@ -0,0 +1,137 @@
+import re
+import threading
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from google.cloud.logging_v2.types import LogEntry
+
+from flaskr.genAI.cloud import CloudRun
+from flaskr.logbatch import ProjectLogFetcher
+
+START = datetime(2024, 1, 1, 0, 0, 0)
+END = datetime(2024, 1, 1, 0, 1, 0)
+
+def make_entry(service, second, insert_id, region='region'):
+    entry = LogEntry(text_payload=f'{service} failed', severity=500, insert_id=insert_id,
+                     timestamp=datetime(2024, 1, 1, 0, 0, second, tzinfo=timezone.utc))
+    entry.resource.labels['service_name'] = service
+    entry.resource.labels['location'] = region
+    return entry
+
+def make_crpm(client, project, service, region='region'):
+    crpm = MagicMock()
+    crpm.cloud_run_info = CloudRun(region, project, service)
+    crpm.logging_client = client
+    return crpm
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.list_log_entries.side_effect = lambda **kwargs: iter([
+        make_entry('b', 30, 'b1'), make_entry('a', 20, 'a1'), make_entry('c', 10, 'c1')])
+    return client
+
+def fetch_together(fetcher, requests):
+    results = [None] * len(requests)
+    def run(i, crpm, start, end):
+        results[i] = fetcher.fetch(crpm, start, end)
+    threads = [threading.Thread(target=run, args=(i, *request)) for i, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_services_of_a_project_share_one_query(client):
+    fetcher = ProjectLogFetcher(delay=0.2)
+    results = fetch_together(fetcher, [(make_crpm(client, 'p', 'a'), START, END),
+                                       (make_crpm(client, 'p', 'b'), START, END)])
+
+    assert client.list_log_entries.call_count == 1
+    query = client.list_log_entries.call_args.kwargs['request'].filter
+    assert ('(resource.labels.service_name="a" AND resource.labels.location="region")'
+            ' OR (resource.labels.service_name="b" AND resource.labels.location="region")') in query
+    assert [[entry['insert_id'] for entry in result] for result in results] == [['a1'], ['b1']]
+
+def test_projects_are_queried_separately(client):
+    fetcher = ProjectLogFetcher(delay=0.2)
+    fetch_together(fetcher, [(make_crpm(client, 'p1', 'a'), START, END),
+                             (make_crpm(client, 'p2', 'a'), START, END)])
+    assert client.list_log_entries.call_count == 2
+
+def test_entries_are_cut_to_the_requested_window(client):
+    fetcher = ProjectLogFetcher(delay=0.2)
+    results = fetch_together(fetcher, [
+        (make_crpm(client, 'p', 'a'), START, END),
+        (make_crpm(client, 'p', 'b'), START, datetime(2024, 1, 1, 0, 0, 25))])
+    assert results[1] == []
+
+def test_request_covered_by_a_query_in_flight_waits_for_it():
+    sent, release = threading.Event(), threading.Event()
+    def list_log_entries(**kwargs):
+        sent.set()
+        release.wait()
+        return iter([make_entry('a', 20, 'a1')])
+    client = MagicMock()
+    client.list_log_entries.side_effect = list_log_entries
+    fetcher = ProjectLogFetcher(delay=0)
+    crpm = make_crpm(client, 'p', 'a')
+
+    first = threading.Thread(target=fetcher.fetch, args=(crpm, START, END))
+    first.start()
+    sent.wait()
+    result = []
+    second = threading.Thread(target=lambda: result.extend(
+        fetcher.fetch(crpm, START, datetime(2024, 1, 1, 0, 0, 30))))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+
+    assert client.list_log_entries.call_count == 1
+    assert [entry['insert_id'] for entry in result] == ['a1']
+
+def test_batch_is_split_at_max_services(client):
+    fetcher = ProjectLogFetcher(delay=0.2, max_services=1)
+    fetch_together(fetcher, [(make_crpm(client, 'p', 'a'), START, END),
+                             (make_crpm(client, 'p', 'b'), START, END)])
+    assert client.list_log_entries.call_count == 2
+
+def test_error_is_raised_to_every_member():
+    client = MagicMock()
+    client.list_log_entries.side_effect = RuntimeError('quota')
+    fetcher = ProjectLogFetcher(delay=0)
+    with pytest.raises(RuntimeError):
+        fetcher.fetch(make_crpm(client, 'p', 'a'), START, END)
+    assert not fetcher._batches
+
+def logging_client(entries):
+    def list_log_entries(request, metadata):
+        end = re.search(r'timestamp<="(.*)Z"', request.filter).group(1)
+        return iter([entry for entry in entries
+                     if f'service_name="{entry.resource.labels["service_name"]}" AND '
+                        f'resource.labels.location="{entry.resource.labels["location"]}"'
+                        in request.filter
+                     and entry.timestamp.replace(tzinfo=None) <= datetime.fromisoformat(end)])
+    client = MagicMock()
+    client.list_log_entries.side_effect = list_log_entries
+    return client
+
+def test_noisy_service_does_not_starve_the_others():
+    noisy = [make_entry('a', 59 - i, f'a{i}') for i in range(10)]
+    client = logging_client(noisy + [make_entry('b', 5, 'b1')])
+    fetcher = ProjectLogFetcher(delay=0.2, max_entries=3)
+    results = fetch_together(fetcher, [(make_crpm(client, 'p', 'a'), START, END),
+                                       (make_crpm(client, 'p', 'b'), START, END)])
+    assert [entry['insert_id'] for entry in results[0]] == ['a0', 'a1', 'a2']
+    assert [entry['insert_id'] for entry in results[1]] == ['b1']
+    assert client.list_log_entries.call_count == 2
+
+def test_services_are_split_by_region():
+    client = logging_client([make_entry('a', 20, 'east', region='east'),
+                             make_entry('a', 10, 'west', region='west')])
+    fetcher = ProjectLogFetcher(delay=0.2)
+    results = fetch_together(fetcher, [(make_crpm(client, 'p', 'a', 'east'), START, END),
+                                       (make_crpm(client, 'p', 'a', 'west'), START, END)])
+    assert [[entry['insert_id'] for entry in result] for result in results] == [['east'], ['west']]
@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+from flaskr.logbuffer import LogBuffers
+
+def entry(second, insert_id, message='error'):
+    return {'timestamp': f'2024-01-01T00:00:{second:02d}+00:00', 'severity': 'ERROR',
+            'message': message, 'insert_id': insert_id}
+
+def make_crpm(*batches):
+    # 每次呼叫回傳一批 log，與 API 相同由新到舊
+    crpm = MagicMock()
+    crpm.iter_logs.side_effect = [iter(sorted(batch, key=lambda e: e['timestamp'], reverse=True))
+                                  for batch in batches]
+    return crpm
+
+def fetched_range(crpm, call):
+    return crpm.iter_logs.call_args_list[call].args[0].get_time_range_iso()
+
+def test_first_read_fetches_the_window():
+    crpm = make_crpm([entry(1, 'a'), entry(2, 'b')])
+    buffers = LogBuffers()
+    logs = buffers.read('s', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:30')
+    assert [log['insert_id'] for log in logs] == ['a', 'b']
+    assert fetched_range(crpm, 0) == ('2024-01-01T00:00:00', '2024-01-01T00:00:30')
+
+def test_next_read_starts_at_the_cursor_without_duplicates():
+    crpm = make_crpm([entry(1, 'a'), entry(2, 'b')],
+                     [entry(2, 'b'), entry(2, 'c'), entry(5, 'd')])
+    buffers = LogBuffers()
+    buffers.read('s', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:02')
+    logs = buffers.read('s', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:10')
+    assert fetched_range(crpm, 1) == ('2024-01-01T00:00:02', '2024-01-01T00:00:10')
+    assert [log['insert_id'] for log in logs] == ['a', 'b', 'c', 'd']
+
+def test_read_returns_only_the_window():
+    crpm = make_crpm([entry(1, 'a'), entry(20, 'b')], [])
+    buffers = LogBuffers()
+    buffers.read('s', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:30')
+    logs = buffers.read('s', crpm, '2024-01-01T00:00:10', '2024-01-01T00:00:30')
+    assert [log['insert_id'] for log in logs] == ['b']
+
+def test_buffer_is_bounded():
+    crpm = make_crpm([entry(i, str(i)) for i in range(10)])
+    buffers = LogBuffers(size=3)
+    logs = buffers.read('s', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:30')
+    assert [log['insert_id'] for log in logs] == ['7', '8', '9']
+
+def test_services_have_separate_cursors():
+    crpm = make_crpm([entry(5, 'a')], [entry(1, 'b')])
+    buffers = LogBuffers()
+    buffers.read('s1', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:10')
+    logs = buffers.read('s2', crpm, '2024-01-01T00:00:00', '2024-01-01T00:00:10')
+    assert [log['insert_id'] for log in logs] == ['b']
+    assert fetched_range(crpm, 1)[0] == '2024-01-01T00:00:00'
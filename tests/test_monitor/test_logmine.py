@@ -0,0 +1,49 @@
+from flaskr.logmine import Drain, LogMiner, WILDCARD, tokenize, format_templates
+
+def test_tokenize_masks_variables():
+    tokens = tokenize('request 3f2c1d9e-1b2a-4c3d-9e8f-0a1b2c3d4e5f from 10.0.0.1:8080 took 12.5 ms')
+    assert tokens == ['request', WILDCARD, 'from', WILDCARD, 'took', WILDCARD, 'ms']
+
+def test_same_shape_messages_share_template():
+    drain = Drain()
+    a = drain.add('user alice not found in db')
+    b = drain.add('user bob not found in db')
+    c = drain.add('connection reset by peer')
+    assert a is b
+    assert a is not c
+    assert a.template == f'user {WILDCARD} not found in db'
+    assert a.count == 2
+    assert a.example == 'user alice not found in db'
+
+def test_max_clusters_evicts_least_recent():
+    drain = Drain(max_clusters=2)
+    drain.add('alpha one', '2024-01-01T00:00:01')
+    drain.add('beta two three', '2024-01-01T00:00:02')
+    drain.add('gamma four five six', '2024-01-01T00:00:03')
+    assert [c.example for c in drain.clusters] == ['beta two three', 'gamma four five six']
+
+def test_miner_summarizes_batches_per_service():
+    miner = LogMiner()
+    entries = [
+        {'message': f'timeout calling backend after {i} ms', 'severity': 'ERROR',
+         'timestamp': f'2024-01-01T00:00:{i:02d}'}
+        for i in range(30)
+    ] + [{'message': 'out of memory', 'severity': 'CRITICAL', 'timestamp': '2024-01-01T00:00:05'}]
+
+    summaries = miner.summarize('service', entries)
+
+    assert [s.count for s in summaries] == [30, 1]
+    assert summaries[0].template == f'timeout calling backend after {WILDCARD} ms'
+    assert summaries[0].first_seen == '2024-01-01T00:00:00'
+    assert summaries[0].last_seen == '2024-01-01T00:00:29'
+
+    # the next batch reuses the templates, but counts only its own entries
+    assert miner.summarize('service', entries[:2])[0].count == 2
+    assert miner.summarize('other', [])== []
+
+def test_format_templates_limit():
+    miner = LogMiner()
+    summaries = miner.summarize('service', [{'message': m} for m in ['a b', 'c d e', 'c d e']])
+    text = format_templates(summaries, limit=1)
+    assert text.startswith('[x2] c d e')
+    assert '1 more templates (1 entries)' in text
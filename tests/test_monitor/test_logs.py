@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+from google.cloud.logging_v2.types import LogEntry
+
+from flaskr.genAI import cloud
+from flaskr.genAI.cloud import CloudRun, CloudRunPerformanceMonitor, SpecificTimeRange
+
+def make_entries(messages):
+    for i, message in enumerate(messages):
+        yield LogEntry(text_payload=message, severity=500, insert_id=f'id{i}',
+                       timestamp=datetime(2024, 1, 1, 0, 0, i % 60, tzinfo=timezone.utc))
+
+@pytest.fixture
+def crpm(monkeypatch):
+    monkeypatch.setattr(cloud, 'LoggingServiceV2Client', MagicMock)
+    monkeypatch.setattr(cloud.monitoring_v3, 'MetricServiceClient', MagicMock)
+    return CloudRunPerformanceMonitor(CloudRun('region', 'project', 'service'))
+
+TIME_RANGE = SpecificTimeRange('2024-01-01T00:00:00', '2024-01-01T00:05:00')
+
+def test_request_is_paged_ordered_and_masked(crpm):
+    crpm.logging_client.list_log_entries.return_value = make_entries(['a'])
+    logs = list(crpm.iter_logs(TIME_RANGE, page_size=50))
+
+    kwargs = crpm.logging_client.list_log_entries.call_args.kwargs
+    assert kwargs['request'].page_size == 50
+    assert kwargs['request'].order_by == 'timestamp desc'
+    assert kwargs['request'].resource_names == ['projects/project']
+    assert ('x-goog-fieldmask', cloud.LOG_FIELD_MASK) in kwargs['metadata']
+    assert logs == [{'timestamp': '2024-01-01T00:00:00+00:00', 'severity': 'ERROR', 'message': 'a',
+                     'insert_id': 'id0'}]
+
+def test_get_logs_deduplicates_messages(crpm):
+    crpm.logging_client.list_log_entries.return_value = make_entries(['a', 'b', 'a', 'a'])
+    logs = crpm.get_logs(TIME_RANGE)
+    assert [(log['message'], log['count']) for log in logs] == [('a', 3), ('b', 1)]
+
+def test_get_logs_stops_at_distinct_messages(crpm):
+    consumed = []
+    def entries():
+        for entry in make_entries([str(i) for i in range(10_000)]):
+            consumed.append(entry)
+            yield entry
+    crpm.logging_client.list_log_entries.return_value = entries()
+
+    logs = crpm.get_logs(TIME_RANGE, max_distinct=5)
+
+    assert len(logs) == 5
+    assert len(consumed) == 6
+
+def test_get_logs_caps_entries(crpm):
+    crpm.logging_client.list_log_entries.return_value = make_entries(['a'] * 10_000)
+    logs = crpm.get_logs(TIME_RANGE, max_entries=100)
+    assert logs[0]['count'] == 100
+
+def test_json_payload_message_is_truncated(crpm):
+    entry = LogEntry(json_payload={'message': 'x' * 1000}, severity=500)
+    crpm.logging_client.list_log_entries.return_value = iter([entry])
+    logs = list(crpm.iter_logs(TIME_RANGE))
+    assert logs[0]['message'] == 'x' * cloud.LOG_MESSAGE_MAX_CHARS
+    assert logs[0]['timestamp'] is None
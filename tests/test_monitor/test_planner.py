@@ -0,0 +1,95 @@
+from unittest.mock import MagicMock
+
+import pytest
+from google.cloud import run_v2
+
+from flaskr import planner
+from flaskr.autoscaler import ScalingDecision
+from flaskr.coalesce import PRIORITY_NOTICE
+from flaskr.genAI import cloud
+from flaskr.genAI.cloud import CloudRun, CloudRunResourceManager, ServiceSpecCache
+from flaskr.planner import FleetPlanner, ScalingProposal, plan_project
+
+def make_proposal(name, origin, target, vote=1.0, project='project'):
+    decision = ScalingDecision(cpu=1, cpu_vote=vote)
+    return ScalingProposal(CloudRun('region', project, name), '1', decision,
+                           origin, target, MagicMock())
+
+def test_plan_project_prioritizes_severity():
+    low = make_proposal('low', (2, 1024), (4, 2048), vote=0.5)
+    high = make_proposal('high', (2, 1024), (4, 2048), vote=2)
+    accepted, deferred = plan_project([low, high], usage=(6, 4096), budget=(8, 0))
+    assert accepted == [high]
+    assert deferred == [low]
+
+def test_plan_project_scale_down_frees_budget():
+    down = make_proposal('down', (4, 2048), (2, 1024), vote=-1)
+    up = make_proposal('up', (2, 1024), (4, 2048))
+    accepted, deferred = plan_project([up, down], usage=(8, 4096), budget=(8, 4096))
+    assert accepted == [down, up]
+    assert deferred == []
+
+def test_plan_project_unlimited_budget():
+    proposals = [make_proposal(str(i), (2, 1024), (4, 2048)) for i in range(3)]
+    accepted, deferred = plan_project(proposals, usage=(100, 10 ** 6), budget=(0, 0))
+    assert len(accepted) == 3
+    assert deferred == []
+
+def test_run_batch_applies_and_reports_deferred(monkeypatch):
+    notifications = MagicMock()
+    record = MagicMock()
+    monkeypatch.setattr(planner, 'record_scaling_decision', record)
+    monkeypatch.setattr(planner, 'get_budget', lambda project_id: (6, 0))
+    monkeypatch.setattr(FleetPlanner, 'project_usage', lambda self, project_id, proposals: (4, 2048))
+
+    fleet = FleetPlanner(notifications=notifications)
+    first = make_proposal('first', (2, 1024), (4, 2048), vote=2)
+    second = make_proposal('second', (2, 1024), (4, 2048), vote=1)
+    fleet.propose(first)
+    fleet.propose(second)
+
+    applied, deferred = fleet.run_batch()
+
+    assert applied == [first]
+    assert deferred == [second]
+    first.apply.assert_called_once()
+    second.apply.assert_not_called()
+    channel_id, body = notifications.post.call_args.args
+    assert channel_id == '1' and 'second' in body
+    assert notifications.post.call_args.kwargs['priority'] == PRIORITY_NOTICE
+    record.assert_called_once()
+
+    # the same deferred change is reported only once
+    fleet.propose(make_proposal('second', (2, 1024), (4, 2048), vote=1))
+    fleet.run_batch()
+    assert notifications.post.call_count == 1
+    assert fleet.run_batch() == ([], [])
+
+@pytest.fixture
+def db_module():
+    return planner
+
+def test_applied_proposal_counts_in_the_next_cycle(temp_db, monkeypatch):
+    specs = ServiceSpecCache()
+    monkeypatch.setattr(cloud, 'service_specs', specs)
+    monkeypatch.setattr(planner, 'service_specs', specs)
+    client = MagicMock()
+    monkeypatch.setattr(run_v2, 'ServicesClient', lambda: client)
+    db = temp_db()
+    with db:
+        db.execute('''
+        INSERT INTO cloud_run_service (guild_id, channel_id, region, project_id, service_name)
+        VALUES ('g', '1', 'region', 'project', 'applied')
+        ''')
+    db.close()
+    service = run_v2.Service(name='projects/project/locations/region/services/applied', etag='e1')
+    service.template.containers.append(run_v2.Container(
+        resources=run_v2.ResourceRequirements(limits={'cpu': '1000m', 'memory': '512Mi'})))
+    client.get_service.return_value = service
+
+    manager = CloudRunResourceManager(CloudRun('region', 'project', 'applied'))
+    manager.init_resource()
+    manager.cpu.value = 2
+    manager.update_resouce()
+
+    assert FleetPlanner().project_usage('project', []) == (2, 512)
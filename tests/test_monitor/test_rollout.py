@@ -0,0 +1,62 @@
+import threading
+from unittest.mock import MagicMock
+
+from flaskr.rollout import RolloutTracker
+
+class FakeOperation:
+    def __init__(self, polls=2, error=None):
+        self.polls = polls
+        self.error = error
+
+    def done(self):
+        self.polls -= 1
+        return self.polls <= 0
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+
+def test_rollout_locks_service_until_serving():
+    release = threading.Event()
+    operation = FakeOperation()
+    tracker = RolloutTracker(poll_interval=0)
+    on_done = MagicMock()
+
+    def update():
+        release.wait(5)
+        return operation
+
+    future = tracker.submit('service', update, on_done)
+    assert tracker.in_progress('service')
+    assert tracker.submit('service', update) is None
+    assert not tracker.in_progress('other')
+
+    release.set()
+    assert future.result(5) is True
+    assert not tracker.in_progress('service')
+    on_done.assert_called_once_with(True)
+
+def test_failed_operation_releases_lock():
+    tracker = RolloutTracker(poll_interval=0)
+    on_done = MagicMock()
+
+    future = tracker.submit('service', lambda: FakeOperation(error=RuntimeError('boom')), on_done)
+
+    assert future.result(5) is False
+    assert not tracker.in_progress('service')
+    on_done.assert_called_once_with(False)
+
+def test_timeout_releases_lock():
+    tracker = RolloutTracker(poll_interval=0, timeout=0)
+
+    future = tracker.submit('service', lambda: FakeOperation(polls=10 ** 9))
+
+    assert future.result(5) is False
+    assert not tracker.in_progress('service')
+
+def test_nothing_sent_skips_callback():
+    tracker = RolloutTracker(poll_interval=0)
+    on_done = MagicMock()
+
+    assert tracker.submit('service', lambda: None, on_done).result(5) is False
+    on_done.assert_not_called()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from flaskr.rules import (Metric, Condition, Rule, RuleSet, ScalingRule, ScalingRuleSet,
+                          ABNORMAL_RULES, SCALING_RULES)
+
+def test_metric_builds_condition():
+    condition = Metric('Request Count (5xx)') > 5
+    assert isinstance(condition, Condition)
+    assert str(condition) == 'Request Count (5xx) > 5'
+
+def test_invalid_operator():
+    with pytest.raises(ValueError):
+        Condition('a', '!=', 1)
+
+def test_evaluate_over_whole_window():
+    rules = RuleSet([Rule(Metric('a') > 1), Rule(Metric('b') <= 0)])
+    df = pd.DataFrame({'a': [0, 2, 3], 'b': [1, 0, 1]})
+    hits = rules.evaluate(df)
+    assert hits.tolist() == [[False, False], [True, True], [True, False]]
+
+def test_consecutive_rule():
+    rules = RuleSet([Rule(Metric('a') > 60, consecutive=2)])
+    df = pd.DataFrame({'a': [70, 50, 70, 70, 70]})
+    assert rules.evaluate(df)[:, 0].tolist() == [False, False, False, True, True]
+
+def test_missing_metric_uses_default_and_nan_never_matches():
+    rules = RuleSet([Rule(Metric('a', default=0) == 0), Rule(Metric('b') == 0)])
+    df = pd.DataFrame({'b': [np.nan, 0]})
+    assert rules.evaluate(df).tolist() == [[True, False], [True, True]]
+
+def test_fired_on_last_row():
+    df = pd.DataFrame([
+        {'Container CPU Utilization (%)': 70, 'Request Count (5xx)': 0},
+        {'Container CPU Utilization (%)': 70, 'Request Count (5xx)': 6},
+    ])
+    assert ABNORMAL_RULES.fired(df) == ['Request Count (5xx) > 5', 'Container CPU Utilization (%) > 60']
+    assert ABNORMAL_RULES.fired(pd.DataFrame()) == []
+
+def test_scaling_votes():
+    rules = ScalingRuleSet([
+        ScalingRule(Metric('cpu') > 50, cpu=1),
+        ScalingRule(Metric('cpu') < 30, cpu=-1),
+        ScalingRule(Metric('requests') > 100, cpu=1, memory=1),
+    ])
+    df = pd.DataFrame({'cpu': [60, 10, 40], 'requests': [200, 200, 0]})
+    cpu, memory = rules.votes(df)
+    assert cpu.tolist() == [2, 0, 0]
+    assert memory.tolist() == [1, 1, 0]
+
+def test_default_scaling_rules_without_startup_metric():
+    df = pd.DataFrame({'Container CPU Utilization (%)': [80], 'Container Memory Utilization (%)': [40],
+                       'Request Latency (ms)': [200]})
+    cpu, memory = SCALING_RULES.votes(df)
+    # 沒有 startup latency 指標時視為 0，投下減少資源的一票
+    assert (cpu[-1], memory[-1]) == (1, -1)
+
+def test_describe_lists_rules():
+    assert '- Container CPU Utilization (%) > 60' in ABNORMAL_RULES.describe()
@@ -0,0 +1,95 @@
+from unittest.mock import MagicMock
+
+import pytest
+from google.api_core.exceptions import Aborted
+from google.cloud import run_v2
+
+from flaskr.genAI import cloud
+from flaskr.genAI.cloud import CloudRun, CloudRunResourceManager, ServiceSpecCache
+
+NAME = 'projects/p/locations/r/services/s'
+
+def make_service(etag='e1', cpu='1000m'):
+    service = run_v2.Service(name=NAME, etag=etag)
+    service.template.containers.append(run_v2.Container(
+        resources=run_v2.ResourceRequirements(limits={'cpu': cpu, 'memory': '512Mi'})))
+    return service
+
+def test_get_is_cached_until_ttl():
+    client = MagicMock()
+    client.get_service.return_value = make_service()
+    cache = ServiceSpecCache(ttl=60)
+
+    assert cache.get(NAME, client).etag == 'e1'
+    assert cache.get(NAME, client).etag == 'e1'
+    client.get_service.assert_called_once()
+
+    cache.ttl = 0
+    cache.get(NAME, client)
+    assert client.get_service.call_count == 2
+
+def test_peek_and_invalidate():
+    client = MagicMock()
+    client.get_service.return_value = make_service()
+    cache = ServiceSpecCache()
+
+    assert cache.peek(NAME) is None
+    cache.get(NAME, client)
+    assert cache.peek(NAME) is not None
+    cache.invalidate(NAME)
+    assert cache.peek(NAME) is None
+
+@pytest.fixture
+def manager(monkeypatch):
+    client = MagicMock()
+    monkeypatch.setattr(run_v2, 'ServicesClient', lambda: client)
+    monkeypatch.setattr(cloud, 'service_specs', ServiceSpecCache())
+    return CloudRunResourceManager(CloudRun(region='r', project_id='p', service_name='s'))
+
+def test_update_uses_cached_etag(manager):
+    manager.client.get_service.return_value = make_service('e1')
+    manager.init_resource()
+    manager.cpu.value = 2
+
+    manager.update_resouce()
+
+    manager.client.get_service.assert_called_once()
+    request = manager.client.update_service.call_args.kwargs['request']
+    assert request.service.etag == 'e1'
+    assert request.service.template.containers[0].resources.limits['cpu'] == '2000m'
+    # the applied limits stay visible to peek, but the stale etag is fetched again
+    assert cloud.service_specs.peek(NAME).template.containers[0].resources.limits['cpu'] == '2000m'
+    manager.client.get_service.return_value = make_service('e2', '2000m')
+    assert cloud.service_specs.get(NAME, manager.client).etag == 'e2'
+    assert manager.client.get_service.call_count == 2
+
+def test_conflict_is_not_retried_with_stale_targets(manager):
+    manager.client.get_service.return_value = make_service('e1')
+    manager.client.update_service.side_effect = Aborted('etag mismatch')
+    manager.init_resource()
+    manager.cpu.value = 2
+
+    with pytest.raises(Aborted):
+        manager.update_resouce()
+    manager.client.update_service.assert_called_once()
+    assert cloud.service_specs.peek(NAME) is None
+
+def test_apply_plan_replans_from_the_refreshed_spec_on_conflict(manager):
+    # someone else moved the service to 2 vCPU after it was cached at 1 vCPU
+    manager.client.get_service.side_effect = [make_service('e1', '1000m'), make_service('e2', '2000m')]
+    manager.client.update_service.side_effect = [Aborted('etag mismatch'), MagicMock()]
+
+    assert manager.apply_plan(cpu=1)
+
+    assert manager.client.get_service.call_count == 2
+    request = manager.client.update_service.call_args.kwargs['request']
+    assert request.service.etag == 'e2'
+    assert request.service.template.containers[0].resources.limits['cpu'] == '4000m'
+    assert manager.cpu.value == 4
+
+def test_apply_plan_gives_up_after_a_second_conflict(manager):
+    manager.client.get_service.side_effect = [make_service('e1'), make_service('e2')]
+    manager.client.update_service.side_effect = Aborted('etag mismatch')
+
+    assert manager.apply_plan(cpu=1) is None
+    assert manager.client.update_service.call_count == 2
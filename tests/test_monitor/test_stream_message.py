@@ -0,0 +1,54 @@
+import json
+from unittest.mock import Mock
+import pytest
+
+from flaskr import stream_message
+from flaskr.stream_message import StreamingMessage, DISCORD_MESSAGE_LIMIT
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    send = Mock(side_effect=lambda message: sent.append(json.loads(message)) or True)
+    monkeypatch.setattr(stream_message.DCBotWebSocket, 'send', send)
+    return sent
+
+def test_start_sends_headline(sent):
+    stream = StreamingMessage('1', 'headline\n')
+    stream.start()
+
+    assert sent == [{'channel_id': '1', 'message': 'headline\n', 'message_key': stream.message_key}]
+
+def test_append_is_rate_limited(sent):
+    stream = StreamingMessage('1', 'headline\n', min_interval=60)
+    stream.start()
+    stream.append('a')
+    stream.append('b')
+
+    assert len(sent) == 1
+
+    stream.finish()
+
+    assert len(sent) == 2
+    assert sent[-1]['edit'] is True
+    assert sent[-1]['message'] == 'headline\nab'
+    assert sent[-1]['message_key'] == sent[0]['message_key']
+
+def test_append_without_interval_edits_every_chunk(sent):
+    stream = StreamingMessage('1', 'headline\n', min_interval=0)
+    stream.start()
+    stream.append('a')
+    stream.append('b')
+    stream.finish()
+
+    assert [item['message'] for item in sent] == ['headline\n', 'headline\na', 'headline\nab']
+
+def test_append_rolls_over_discord_limit(sent):
+    stream = StreamingMessage('1', 'headline\n', min_interval=60)
+    stream.start()
+    stream.append('x' * DISCORD_MESSAGE_LIMIT)
+    stream.finish()
+
+    assert all(len(item['message']) <= DISCORD_MESSAGE_LIMIT for item in sent)
+    assert sent[-1]['message'] == 'x' * DISCORD_MESSAGE_LIMIT
+    assert sent[-1]['message_key'] != sent[0]['message_key']
+    assert 'edit' not in sent[-1]
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from flaskr.detector import AnomalyDetector, EWMA_MIN_SAMPLES
+from flaskr.triage import Triage, format_template
+
+@pytest.fixture
+def triage():
+    return Triage(AnomalyDetector())
+
+def test_startup_latency_alone_is_not_escalated(triage):
+    result = triage.evaluate('svc', ['Container Startup Latency (ms) > 0'],
+                             {'Container Startup Latency (ms)': 4453})
+    assert result.escalate == False
+
+def test_severe_rules_are_escalated(triage):
+    result = triage.evaluate('svc', ['Request Count (5xx) > 5', 'Container CPU Utilization (%) > 60'],
+                             {'Request Count (5xx)': 20, 'Container CPU Utilization (%)': 90})
+    assert result.escalate == True
+
+def test_rule_usual_for_service_is_discounted(triage):
+    now = datetime(2024, 1, 1)
+    times = [now + timedelta(minutes=i) for i in range(EWMA_MIN_SAMPLES)]
+    triage.detector.update('svc', times, [{'Request Count (5xx)': 10}] * EWMA_MIN_SAMPLES)
+
+    result = triage.evaluate('svc', ['Request Count (5xx) > 5'], {'Request Count (5xx)': 10})
+    assert result.score == 2
+    assert result.escalate == False
+
+def test_repeated_analysis_is_suppressed(triage):
+    rules = ['Request Count (5xx) > 5']
+    now = datetime(2024, 1, 1)
+
+    first = triage.evaluate('svc', rules, {'Request Count (5xx)': 20}, now=now)
+    second = triage.evaluate('svc', rules, {'Request Count (5xx)': 20}, now=now + timedelta(minutes=10))
+    third = triage.evaluate('svc', rules, {'Request Count (5xx)': 20}, now=now + timedelta(hours=1))
+
+    assert first.escalate == True
+    assert second.escalate == False
+    assert third.escalate == True
+
+def test_deviation_rules_are_capped(triage):
+    rules = [f'metric {i} > baseline' for i in range(10)]
+    result = triage.evaluate('svc', rules, {})
+    assert result.score == 3
+
+def test_format_template_lists_rules(triage):
+    rules = ['Container Startup Latency (ms) > 0']
+    result = triage.evaluate('svc', rules, {})
+    assert rules[0] in format_template(rules, result)
@@ -0,0 +1,33 @@
+import base64
+import json
+
+import pytest
+
+from flaskr import wire
+from flaskr.wire import Codec, decode
+
+ALERT = {'channel_id': '1', 'id': 'a-1', 'message': '- service name: **svc**\n' * 40}
+
+def test_plain_json_is_a_text_frame():
+    assert Codec().encode(ALERT) == json.dumps(ALERT)
+
+@pytest.mark.parametrize('encoding', [wire.JSON, wire.MSGPACK])
+@pytest.mark.parametrize('compression', [None, wire.ZLIB])
+def test_round_trip(encoding, compression):
+    if encoding == wire.MSGPACK:
+        pytest.importorskip('msgpack')
+    assert decode(Codec(encoding, compression).encode(ALERT)) == ALERT
+
+def test_small_message_is_not_compressed():
+    frame = Codec(wire.JSON, wire.ZLIB).encode({'ack': 'a-1'})
+    assert frame[0] & wire.FLAG_ZLIB == 0
+
+def test_msgpack_sends_report_as_raw_bytes():
+    pytest.importorskip('msgpack')
+    pdf = bytes(range(256)) * 4
+    message = decode(Codec(wire.MSGPACK).encode({'file_base64': base64.b64encode(pdf).decode()}))
+    assert message == {'file': pdf}
+
+def test_welcome_falls_back_on_unknown_choices():
+    codec = Codec.from_welcome({'encoding': 'cbor', 'compression': 'brotli'})
+    assert (codec.encoding, codec.compression) == (wire.JSON, None)